@@ -4,11 +4,23 @@ from core.svgkit import svgGenerator
 import sys
 import pathlib
 from core.convert import to_svgCodes
-from core.construct import CircuitBoard, to_txt
+from core.construct import CircuitBoard, to_txt, from_txt, make_inputHash
 from core.postprocessing import postprocessing
+from core.subcircuit import render_subcircuits
+from core.netlist import write_netlist, netlistExtensions
+from core.viewport import ViewportIndex
+from core.stream import render_stream
+from core.theme import themes, write_themes
+from core.cache import StageCache
+from core.manifest import BuildManifests, make_buildKey, make_toolVersion
 from tqdm import tqdm
 import argparse
-print_detail = False
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import contextlib
+import shutil
+import time
 
 
 class Path_parser:
@@ -40,57 +52,465 @@ class Path_parser:
                     map(lambda x: x.as_posix(), pathobj.iterdir()))
 
 
+@contextlib.contextmanager
+def timed(timings, stage):
+    """Add seconds taken by the with block to timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0) + time.perf_counter() - start
+
+
 def build(circuit, setting, log: tqdm, autoNode=True, blockWidth=6,
-          svg_filepath='output.svg', name='circuit'):
-    if print_detail:
-        log.write('Creating circuit board ...')
-    board = CircuitBoard(circuit, setting, autoNode=autoNode)
-    if print_detail:
-        log.write('Converting to SVG protocal ...')
-    svgCodes = to_svgCodes(board, blockWidth=blockWidth)
-    if print_detail:
-        log.write('Drawing SVG ...')
-    svgGenObj = svgGenerator(svgCodes, {'unit': 8})
-    svgGenObj.generate(svg_filepath)
-    if print_detail:
-        log.write('optimizing SVG file size ...')
-    postprocessing(svg_filepath)
+          svg_filepath='output.svg', name='circuit', theme='light',
+          darkTheme=None, themeVariants=(), embedHash=False, autoPlace=False,
+          print_detail=False, blocks=None, netlists=(), tiles=None,
+          bandRows=None, textCache=None, cache=None, timings=None):
+    # seconds taken by each stage are added to timings
+    timings = {} if timings is None else timings
+    inputHash = None
+    if embedHash:
+        inputHash = make_inputHash(circuit, setting, autoNode=autoNode,
+                                   blockWidth=blockWidth, blocks=blocks)
+    if blocks:
+        if netlists:
+            log.write('>>> Warning : netlists of sub-circuits are not written.')
+        if tiles is not None:
+            log.write('>>> Warning : tiles of sub-circuits are not written.')
+        if bandRows:
+            log.write('>>> Warning : sub-circuits are not drawn in bands.')
+        if cache:
+            log.write('>>> Warning : stages of sub-circuits are not cached.')
+        if print_detail:
+            log.write('Drawing sub-circuits ...')
+        with timed(timings, 'sub-circuits'):
+            render_subcircuits(circuit, setting, blocks, svg_filepath,
+                               autoNode=autoNode, blockWidth=blockWidth,
+                               generatorSetting={'unit': 8, 'autoPlace': autoPlace},
+                               theme=theme, darkTheme=darkTheme, inputHash=inputHash)
+    elif bandRows:
+        if netlists or tiles is not None or autoPlace:
+            log.write('>>> Warning : netlists, tiles and label placement are not '
+                      'made while streaming.')
+        if cache:
+            log.write('>>> Warning : stages are not cached while streaming.')
+        if print_detail:
+            log.write(f'Drawing bands of {bandRows} rows ...')
+        with timed(timings, 'bands'):
+            render_stream(circuit, setting, svg_filepath, bandRows=bandRows,
+                          autoNode=autoNode, blockWidth=blockWidth, theme=theme,
+                          darkTheme=darkTheme, inputHash=inputHash)
+    else:
+        generatorSetting = {'unit': 8, 'autoPlace': autoPlace}
+        # stages are only run if what they make is not cached, see core.cache
+        keys = cache.keys(circuit, setting, autoNode=autoNode, blockWidth=blockWidth,
+                          generatorSetting=generatorSetting) if cache else None
+        board = None
+
+        def stage(name, make):
+            artifact = cache.load(name, keys[name]) if cache else None
+            if artifact is None:
+                artifact = make()
+                if cache:
+                    cache.save(name, keys[name], artifact)
+            elif print_detail:
+                log.write(f'Using cached {name} ...')
+            return artifact
+
+        def make_board():
+            if print_detail:
+                log.write('Creating circuit board ...')
+            with timed(timings, 'board'):
+                return CircuitBoard(circuit, setting, autoNode=autoNode)
 
+        def make_svgCodes():
+            nonlocal board
+            board = board or stage('board', make_board)
+            if print_detail:
+                log.write('Converting to SVG protocal ...')
+            with timed(timings, 'svgCodes'):
+                return to_svgCodes(board, blockWidth=blockWidth, labelGroups=autoPlace)
 
-def dirParser(pathObj: Path_parser):
+        def make_svg():
+            nonlocal svgCodes
+            svgCodes = svgCodes or stage('svgCodes', make_svgCodes)
+            if print_detail:
+                log.write('Drawing SVG ...')
+            with timed(timings, 'svg'):
+                svgGenObj = svgGenerator(svgCodes, dict(generatorSetting),
+                                         textCache=textCache)
+                svgGenObj.generate(svg_filepath)
+                return pathlib.Path(svg_filepath).read_bytes()
+
+        # the netlist is made from the same board as the drawing
+        if netlists:
+            board = stage('board', make_board)
+        for netlistFormat in netlists:
+            if print_detail:
+                log.write(f'Writing {netlistFormat} netlist ...')
+            netlist_filepath = pathlib.Path(svg_filepath).with_suffix(
+                netlistExtensions[netlistFormat])
+            with timed(timings, 'netlist'):
+                write_netlist(board, netlist_filepath, netlistFormat, name)
+        svgCodes = None
+        if tiles is not None:
+            svgCodes = stage('svgCodes', make_svgCodes)
+        pathlib.Path(svg_filepath).write_bytes(stage('svg', make_svg))
+        if tiles is not None:
+            if print_detail:
+                log.write('Writing tiles ...')
+            with timed(timings, 'tiles'):
+                index = ViewportIndex(svgCodes, {'unit': 8}, blockWidth)
+                index.write_tiles(pathlib.Path(svg_filepath).with_suffix('.tiles'),
+                                  tiles, theme=theme, darkTheme=darkTheme)
+        if print_detail:
+            log.write('optimizing SVG file size ...')
+        with timed(timings, 'postprocessing'):
+            postprocessing(svg_filepath, theme, darkTheme, inputHash)
+    if themeVariants:
+        if print_detail:
+            log.write('Writing theme variants ...')
+        with timed(timings, 'themes'):
+            write_themes(svg_filepath, themeVariants)
+
+
+def dirParser(pathObj: Path_parser, report=True):
     txtfiles = []
     for dir_ in pathObj.dirlist:
         pathObj_ = Path_parser(dir_)
         if pathObj_.is_file:
             if pathObj_.ext.lower() == '.txt':
                 txtfiles.append(pathObj_.path)
-            else:
+            elif report:
                 print('>>> Error : Accept txt file only.')
-        else:
-            txtfiles += dirParser(pathObj_)
+        elif pathObj_.exists:
+            txtfiles += dirParser(pathObj_, report)
     return txtfiles
 
 
-def txtParser(pathObj: Path_parser):
+def txtParser(pathObj: Path_parser, report=True):
     if pathObj.ext.lower() == '.txt':
         return pathObj.path
-    else:
+    elif report:
         print('>>> Error : Accept txt file only.')
 
 
-def pathParser(pathObj: Path_parser):
+def pathParser(pathObj: Path_parser, report=True):
+    """txt files of a path, errors are printed if report is True."""
     txtfiles = []
     if pathObj.exists:
         if pathObj.is_file:
-            txtfiles.append(txtParser(pathObj))
+            txtfile = txtParser(pathObj, report)
+            if txtfile is not None:
+                txtfiles.append(txtfile)
         else:
-            txtfiles += dirParser(pathObj)
-    else:
+            txtfiles += dirParser(pathObj, report)
+    elif report:
         print('>>> Error : Path does not exist.')
 
     return txtfiles
 
 
+class TextCache(collections.OrderedDict):
+    """Texts rendered by a process, only maxTexts texts used last are kept,
+    thus a process that draws files for a long time (--watch) keeps a bounded
+    cache."""
+    maxTexts = 4096
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxTexts:
+            self.popitem(last=False)
+
+
+# texts rendered by this process, shared by every file it draws.
+textCache = TextCache()
+
+
+class LogCollector:
+    """Log lines of a file drawn by a worker, written by the main process."""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+
+def load_txtfile(txtfile):
+    """Load a txt file, return the inputs of build in it. Files are parsed, never
+    run, and every file is loaded on its own, variables never leak from one file
+    to the next."""
+    variables = from_txt(txtfile)
+    return {name: variables[name] for name in
+            ('circuit', 'setting', 'autoNode', 'blockWidth', 'blocks')}
+
+
+def svg_path(txtfile, args, baseDir):
+    """Path of the svg file drawn from a txt file."""
+    fileObj = Path_parser(txtfile)
+    if args['output'] == "":
+        svg_dir = pathlib.Path(baseDir, fileObj.dirname)
+    else:
+        svg_dir = pathlib.Path(baseDir, args['output'])
+    return svg_dir.joinpath(f'{fileObj.name}.svg').as_posix()
+
+
+def output_paths(svg_filepath, args):
+    """Files and folders written with an svg file."""
+    path = pathlib.Path(svg_filepath)
+    paths = [path]
+    paths += [path.with_name(f'{path.stem}.{theme}{path.suffix}')
+              for theme in args['theme_variants']]
+    paths += [path.with_suffix(netlistExtensions[netlistFormat])
+              for netlistFormat in args['netlist']]
+    if args['tiles'] is not None:
+        paths.append(path.with_suffix('.tiles'))
+    return paths
+
+
+def copy_outputs(source_svg, svg_filepath, args):
+    """Copy what is drawn for source_svg to svg_filepath."""
+    pathlib.Path(svg_filepath).parent.mkdir(exist_ok=True)
+    for source, target in zip(output_paths(source_svg, args),
+                              output_paths(svg_filepath, args)):
+        if source.is_dir():
+            shutil.copytree(source, target, dirs_exist_ok=True)
+        elif source.exists():
+            shutil.copyfile(source, target)
+
+
+def build_txtfile(txtfile, inputs, args, baseDir, log, timings=None):
+    """Draw one txt file, inputs are from load_txtfile and args are
+    the command line arguments."""
+    print_detail = args['log']
+    fileObj = Path_parser(txtfile)
+    if print_detail:
+        log.write(f'Open file : {fileObj.path}')
+    svg_filepath = svg_path(txtfile, args, baseDir)
+    pathlib.Path(svg_filepath).parent.mkdir(exist_ok=True)
+    if print_detail:
+        log.write(f'SVG file path : {svg_filepath}')
+    build(inputs['circuit'], inputs['setting'], log, inputs['autoNode'],
+          inputs['blockWidth'], svg_filepath, fileObj.name, args['theme'],
+          args['dark_theme'], args['theme_variants'], args['embed_hash'],
+          args['auto_place'], print_detail, inputs['blocks'], args['netlist'],
+          args['tiles'], args['stream'], textCache,
+          StageCache(args['cache']) if args['cache'] else None, timings)
+
+
+def build_job(txtfile, inputs, args, baseDir):
+    """Draw one txt file, return (txtfile, log lines, error message or None,
+    seconds taken, seconds of each stage). An error of one file never stops
+    other files."""
+    log = LogCollector()
+    timings = {}
+    start = time.perf_counter()
+    try:
+        build_txtfile(txtfile, inputs, args, baseDir, log, timings)
+    except Exception as error:
+        return txtfile, log.lines, f'{type(error).__name__} : {error}', 0, timings
+    return txtfile, log.lines, None, time.perf_counter() - start, timings
+
+
+def init_worker():
+    """Load matplotlib mathtext and fonts once, before a worker draws files."""
+    svgGenerator([], textCache=textCache).render_text('$x$')
+
+
+def make_executor(args):
+    """Processes that draw files in parallel, a context manager of None for
+    -j 1. Workers are started once and draw files of every batch."""
+    if args['jobs'] <= 1:
+        return contextlib.nullcontext()
+    return concurrent.futures.ProcessPoolExecutor(args['jobs'], initializer=init_worker)
+
+
+def submit_job(executor, txtfile, inputs, args, baseDir):
+    """Future of build_job in a worker, it fails if the workers are broken."""
+    try:
+        return executor.submit(build_job, txtfile, inputs, args, baseDir)
+    except concurrent.futures.process.BrokenProcessPool as error:
+        future = concurrent.futures.Future()
+        future.set_exception(error)
+        return future
+
+
+def build_batch(txtfiles, args, baseDir, manifests, toolVersion, executor=None):
+    """Draw txt files that are not up to date in the manifests of their output
+    folders, then print a summary. Files are drawn by executor if it is given,
+    return True if its workers are broken (a worker died), they draw no more
+    files."""
+    print_detail = args['log']
+    count = 0
+    upToDate = 0
+    failed = []
+    # files to draw as (txtfile, inputs, svg path, key), identical inputs are
+    # drawn once and copied.
+    jobs = []
+    copies = []
+    drawn = {}
+    with tqdm(total=len(txtfiles)) as pbar:
+        for txtfile in txtfiles:
+            name = Path_parser(txtfile).name
+            try:
+                if print_detail:
+                    pbar.write(f'Evaluating variables of {txtfile} ...')
+                inputs = load_txtfile(txtfile)
+                svg_filepath = svg_path(txtfile, args, baseDir)
+                # netlists are titled by the name of the file
+                key = make_buildKey(inputs, args, toolVersion, name)
+            except Exception as error:
+                failed.append((txtfile, f'{type(error).__name__} : {error}'))
+                pbar.write(f'>>> Error : {name} is not drawn, {failed[-1][1]}')
+                pbar.update(1)
+                continue
+            if not args['force'] and manifests.of(svg_filepath).is_upToDate(
+                    txtfile, key, output_paths(svg_filepath, args)):
+                upToDate += 1
+                pbar.update(1)
+            elif key in drawn:
+                copies.append((txtfile, svg_filepath, key))
+            else:
+                drawn[key] = None
+                jobs.append((txtfile, inputs, svg_filepath, key))
+
+        broken = False
+        if executor is not None and len(jobs) > 1:
+            # workers draw many files each, results come back in the order
+            # files are done.
+            futures = {submit_job(executor, txtfile, inputs, args, baseDir): txtfile
+                       for txtfile, inputs, _, _ in jobs}
+            results = concurrent.futures.as_completed(futures)
+        else:
+            futures = None
+            results = (build_job(txtfile, inputs, args, baseDir)
+                       for txtfile, inputs, _, _ in jobs)
+        jobOf = {txtfile: (svg_filepath, key) for txtfile, _, svg_filepath, key in jobs}
+        for result in results:
+            if futures is not None:
+                try:
+                    result = result.result()
+                except Exception as error:
+                    # a worker died, files it and other workers did not finish fail
+                    broken |= isinstance(error, concurrent.futures.process.BrokenProcessPool)
+                    result = futures[result], [], f'{type(error).__name__} : {error}', 0, {}
+            txtfile, lines, error, seconds, timings = result
+            name = Path_parser(txtfile).name
+            pbar.set_description(name)
+            for line in lines:
+                pbar.write(line)
+            svg_filepath, key = jobOf[txtfile]
+            if error is None:
+                count += 1
+                drawn[key] = svg_filepath
+                manifests.of(svg_filepath).record(
+                    txtfile, key, output_paths(svg_filepath, args), seconds)
+                if args['watch']:
+                    pbar.write(f'>>> {name} is drawn in {format_timings(seconds, timings)}.')
+                else:
+                    pbar.write('>>> ' + name + ' is drawn.')
+            else:
+                failed.append((txtfile, error))
+                pbar.write(f'>>> Error : {name} is not drawn, {error}')
+            pbar.update(1)
+
+        for txtfile, svg_filepath, key in copies:
+            name = Path_parser(txtfile).name
+            if drawn[key] is None:
+                failed.append((txtfile, 'the same as a file that is not drawn'))
+                pbar.write(f'>>> Error : {name} is not drawn, {failed[-1][1]}')
+            else:
+                try:
+                    if svg_filepath != drawn[key]:
+                        copy_outputs(drawn[key], svg_filepath, args)
+                    manifests.of(svg_filepath).record(
+                        txtfile, key, output_paths(svg_filepath, args), 0)
+                    count += 1
+                    pbar.write(f'>>> {name} is copied from {Path_parser(drawn[key]).name}.')
+                except OSError as error:
+                    failed.append((txtfile, f'{type(error).__name__} : {error}'))
+                    pbar.write(f'>>> Error : {name} is not drawn, {failed[-1][1]}')
+            pbar.update(1)
+
+    if upToDate:
+        print(f'>>> {upToDate} file{"s are" if upToDate > 1 else " is"} up to date.')
+    if count < 2:
+        print(f'>>> {count} svg figure is drawn.' if failed or upToDate else '>>> The svg figure is drawn.')
+    if count >= 2:
+        print(f'>>> {count} svg figures are drawn.')
+    if failed:
+        print(f'>>> {len(failed)} file{"s are" if len(failed) > 1 else " is"} not drawn :')
+        for txtfile, error in failed:
+            print(f'    {txtfile} : {error}')
+    return broken
+
+
+def format_timings(seconds, timings):
+    """Seconds taken and seconds of each stage in ms, e.g. 120 ms (board 20 ms, ...)."""
+    stages = ', '.join(f'{stage} {t * 1000:.0f} ms' for stage, t in timings.items())
+    return f'{seconds * 1000:.0f} ms ({stages})'
+
+
+def scan_txtfiles(paths):
+    """Modified time and size of txt files in paths, by path."""
+    stats = {}
+    for path in paths:
+        for txtfile in pathParser(Path_parser(path), report=False):
+            try:
+                stat = pathlib.Path(txtfile).stat()
+            except OSError:
+                continue
+            stats[txtfile] = (stat.st_mtime_ns, stat.st_size)
+    return stats
+
+
+def watch(paths, args, baseDir, manifests, toolVersion, executor=None,
+          interval=0.2, debounce=0.3):
+    """Draw txt files in paths again whenever they are saved, until Ctrl+C.
+    Files are polled every interval seconds, a file is drawn once it has
+    not changed for debounce seconds, thus rapid saves are drawn once.
+    Files are drawn by executor, workers that are broken are started again."""
+    print('>>> Watching for changes, press Ctrl+C to stop.')
+    stats = scan_txtfiles(paths)
+    # executors started again are shut down when watching stops
+    with contextlib.ExitStack() as stack:
+        try:
+            while True:
+                time.sleep(interval)
+                current = scan_txtfiles(paths)
+                changed = {txtfile for txtfile, stat in current.items()
+                           if stats.get(txtfile) != stat}
+                if not changed:
+                    stats = current
+                    continue
+                # wait until saves settle
+                while True:
+                    time.sleep(debounce)
+                    latest = scan_txtfiles(paths)
+                    settling = {txtfile for txtfile, stat in latest.items()
+                                if current.get(txtfile) != stat}
+                    current = latest
+                    if not settling:
+                        break
+                    changed |= settling
+                stats = current
+                changed = sorted(txtfile for txtfile in changed if txtfile in current)
+                if changed and build_batch(changed, args, baseDir, manifests,
+                                           toolVersion, executor):
+                    print('>>> Workers are broken, they are started again.')
+                    executor = stack.enter_context(make_executor(args))
+        except KeyboardInterrupt:
+            print('>>> Stopped watching.')
+
+
 def main():
     # if len(sys.argv) < 2:
     #    print('>>> Error : Please provide txt files or folders with txt files.')
@@ -103,10 +523,37 @@ def main():
                       default="", help="the output folder, empty if output to input folder")
     args.add_argument("-l", "--log", type=bool, default=False,
                       help="Output more details log.")
+    args.add_argument("-t", "--theme", type=str, default="light",
+                      choices=list(themes), help="the colour theme of output.")
+    args.add_argument("--dark-theme", type=str, default=None,
+                      choices=list(themes),
+                      help="theme applied under prefers-color-scheme: dark.")
+    args.add_argument("--theme-variants", type=str, nargs='*', default=[],
+                      choices=list(themes),
+                      help="also write name.<theme>.svg for each given theme.")
+    args.add_argument("--embed-hash", action='store_true',
+                      help="embed a hash of the input in the svg tag.")
+    args.add_argument("--auto-place", action='store_true',
+                      help="move labels to avoid overlapping elements and wires.")
+    args.add_argument("--netlist", type=str, nargs='*', default=[],
+                      choices=list(netlistExtensions),
+                      help="also write the netlist as name.json / name.cir.")
+    args.add_argument("--tiles", type=int, default=None, metavar="MAXZOOM",
+                      help="also write tiles of zoom 0 ~ MAXZOOM as name.tiles/z/x/y.svg.")
+    args.add_argument("--stream", type=int, default=None, metavar="BANDROWS",
+                      help="draw tall circuits in bands of BANDROWS rows with bounded memory.")
+    args.add_argument("-j", "--jobs", type=int, default=1,
+                      help="number of processes that draw files in parallel.")
+    args.add_argument("--cache", type=str, default=None, metavar="DIR",
+                      help="keep boards, svg codes and svg files in DIR, only stages "
+                           "after what changed are run again.")
+    args.add_argument("-w", "--watch", action='store_true',
+                      help="keep running and draw files again when they are saved.")
+    args.add_argument("--force", action='store_true',
+                      help="draw every file, even files that are up to date.")
     args = args.parse_args()
     args = vars(args)
 
-    print_detail = args['log']
     paths = args['files']
     txtfiles = []
     for path in paths:
@@ -120,43 +567,20 @@ def main():
     if not output_folder_path.exists():
         output_folder_path.mkdir()
     # start drawing svgs
-    count = 0
-    for txtfile in (pbar := tqdm(txtfiles)):
-        fileObj = Path_parser(txtfile)
-        pbar.set_description(fileObj.name)
-        if print_detail:
-            pbar.write(f'Open file : {fileObj.path}')
-
-        if args['output'] == "":
-            svg_dir = pathlib.Path(Path_parser(
-                sys.argv[0]).dirname, fileObj.dirname)
-        else:
-            svg_dir = pathlib.Path(Path_parser(
-                sys.argv[0]).dirname, args['output'])
-        svg_dir.mkdir(exist_ok=True)
-        svg_filepath = svg_dir.joinpath(f'{fileObj.name}.svg').as_posix()
-        if print_detail:
-            pbar.write(f'SVG file path : {svg_filepath}')
-        with open(fileObj.path, 'r') as f:
-            contents = f.read()
-
-        if print_detail:
-            pbar.write('Evaluating variables ...')
-        exec(contents, globals())
-        circuit = globals()['circuit']
-        setting = globals()['setting']
-        autoNode = globals()['autoNode']
-        blockWidth = globals()['blockWidth']
-        build(circuit, setting, pbar, autoNode,
-              blockWidth, svg_filepath, fileObj.name)
-        count += 1
-        pbar.write('>>> ' + fileObj.name + ' is drawn.')
-
-    if count < 2:
-        print('>>> The svg figure is drawn.')
-    if count >= 2:
-        print(f'>>> {count} svg figures are drawn.')
-    input('')
+    baseDir = Path_parser(sys.argv[0]).dirname
+    # every output folder keeps its manifest next to the files drawn in it
+    manifests = BuildManifests()
+    toolVersion = make_toolVersion(__file__)
+    # workers are started once, they draw every batch while watching
+    with contextlib.ExitStack() as stack:
+        executor = stack.enter_context(make_executor(args))
+        broken = build_batch(txtfiles, args, baseDir, manifests, toolVersion, executor)
+        if args['watch']:
+            if broken:
+                executor = stack.enter_context(make_executor(args))
+            watch(paths, args, baseDir, manifests, toolVersion, executor)
+    if not args['watch']:
+        input('')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,95 @@
+# Stage cache : what each stage of drawing makes, keyed by only what the stage depends on.
+#     board    : state of CircuitBoard (see construct) as npz, key of (circuit, setting, autoNode).
+#     svgCodes : svg codes as JSON, key of board and (blockWidth, autoPlace).
+#     svg      : svg file of svgGenerator before postprocessing, key of svgCodes and
+#                the generator setting.
+# Thus changing the theme only runs postprocessing, changing the generator setting only
+# draws again, and so on. Keys include the version of the drawer (see manifest), what
+# an older drawer made is never used.
+#
+# Files are directory/<stage>/<key><extension>. They are written to a temporary file
+# and renamed, thus processes drawing in parallel can share a cache.
+import io
+import os
+import json
+import hashlib
+import pathlib
+import numpy as np
+from core.construct import CircuitBoard
+from core.manifest import make_toolVersion
+
+def dump_svgCodes(svgCodes) :
+    return json.dumps(svgCodes, separators = (',', ':')).encode('utf8')
+def load_svgCodes(content) :
+    return [tuple(code) for code in json.loads(content)]
+
+# Boards are npz files of the arrays of their state, other fields of the state are JSON
+# in the array 'fields'. Nothing is unpickled, thus a cache can not run code.
+def dump_board(board) :
+    state  = board.to_state()
+    arrays = {name : state[name] for name in CircuitBoard._stateArrays}
+    fields = {'circuitCodeStr'    : state['circuitCodeStr'],
+              'settingSheetStr'   : state['settingSheetStr'],
+              'autoNode'          : state['autoNode'],
+              'elemSettings'      : [[list(pos), settings] for pos, settings in state['elemSettings'].items()],
+              'directionSettings' : [[list(pos), direction] for pos, direction in state['directionSettings']]}
+    content = io.BytesIO()
+    np.savez(content, fields = np.array(json.dumps(fields)), **arrays)
+    return content.getvalue()
+def load_board(content) :
+    def detuple(value) :
+        return tuple(map(detuple, value)) if isinstance(value, list) else value
+    with np.load(io.BytesIO(content), allow_pickle = False) as arrays :
+        state  = {name : arrays[name] for name in CircuitBoard._stateArrays}
+        fields = json.loads(str(arrays['fields']))
+    state.update(circuitCodeStr = fields['circuitCodeStr'], settingSheetStr = fields['settingSheetStr'],
+                 autoNode = fields['autoNode'])
+    # settings with several arguments are tuples
+    state['elemSettings'] = {tuple(pos) : {name : detuple(value) for name, value in settings.items()}
+                             for pos, settings in fields['elemSettings']}
+    state['directionSettings'] = [(tuple(pos), direction) for pos, direction in fields['directionSettings']]
+    return CircuitBoard.from_state(state)
+
+# stage -> (extension, dump, load), dump returns bytes.
+stageFormats = {
+    'board'    : ('.npz', dump_board, load_board),
+    'svgCodes' : ('.json', dump_svgCodes, load_svgCodes),
+    'svg'      : ('.svg', lambda content : content, lambda content : content),
+}
+
+class StageCache :
+    '''Artifacts of stages in directory.'''
+    def __init__(self, directory) :
+        self.directory   = pathlib.Path(directory)
+        self.toolVersion = make_toolVersion()
+
+    def keys(self, circuitCodeStr, settingSheetStr, *, autoNode = True, blockWidth = 6,
+             generatorSetting = None) :
+        '''Keys of every stage, each key covers the key of the stage before it.'''
+        def make_key(*parts) :
+            content = json.dumps(parts, sort_keys = True)
+            return hashlib.sha256(content.encode('utf8')).hexdigest()
+        generatorSetting = generatorSetting or {}
+        normalize = lambda s : s.replace('\r\n', '\n')
+        board    = make_key(self.toolVersion, normalize(circuitCodeStr), normalize(settingSheetStr), bool(autoNode))
+        svgCodes = make_key(board, float(blockWidth), bool(generatorSetting.get('autoPlace')))
+        svg      = make_key(svgCodes, {name : str(value) for name, value in generatorSetting.items()})
+        return {'board' : board, 'svgCodes' : svgCodes, 'svg' : svg}
+
+    def path(self, stage, key) :
+        return self.directory / stage / (key + stageFormats[stage][0])
+
+    def load(self, stage, key) :
+        '''The artifact of stage under key, None if it is not cached.'''
+        try :
+            content = self.path(stage, key).read_bytes()
+        except OSError :
+            return None
+        return stageFormats[stage][2](content)
+
+    def save(self, stage, key, artifact) :
+        path = self.path(stage, key)
+        path.parent.mkdir(parents = True, exist_ok = True)
+        temp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        temp.write_bytes(stageFormats[stage][1](artifact))
+        os.replace(temp, path)
@@ -1,6 +1,8 @@
 # Construct a CircuitBoard object from circuit string and setting sheet.
 # CircuitBoard object have Ai (elemIDArray), Ae (elemArray) that stores 
 # element ID and correspond objects.
+# States of elements are stored by the board as arrays (structure of arrays),
+# objects in Ae are views of a position made when they are accessed.
 # 
 # Each object stores some critical information about the element, like the value
 # that will be display as text beside the object, the direction an element points
@@ -30,16 +32,92 @@
 #   Element ID (elemID):
 #       Element ID is elemCode + label. 
 #       Ex : R1, L2, Va, m1 ... etc.
+#   Connections (connectArray):
+#       Directions an element connects to are bits of board.connectArray,
+#       element.connectR ... element.connectRD are views of these bits.
+#       bit : 0 R, 1 RU, 2 U, 3 LU, 4 L, 5 LD, 6 D, 7 RD (same as svg direction)
 
+import ast
+import bisect
+import hashlib
+import inspect
+import itertools
+import types
 import numpy as np
+
+connectBit = {
+    'R'  : 0, 'RU' : 1, 'U'  : 2, 'LU' : 3,
+    'L'  : 4, 'LD' : 5, 'D'  : 6, 'RD' : 7
+}
+# (di, dj) of each connect bit
+connectMove = (
+    ( 0, +1), (-1, +1), (-1,  0), (-1, -1),
+    ( 0, -1), (+1, -1), (+1,  0), (+1, +1)
+)
+def _connectProperty(direction) :
+    bit = connectBit[direction]
+    def get(self) :
+        return bool(self.board.connectArray[self.i, self.j] >> bit & 1)
+    def set(self, isConnected) :
+        if isConnected : self.board.connectArray[self.i, self.j] |= 1 << bit
+        else :           self.board.connectArray[self.i, self.j] &= 0xff ^ (1 << bit)
+    return property(get, set)
+def _make_pruneTable() :
+    '''\
+    Connections cut by modify_connection for each neighbourhood.
+    Neighbourhood is 8 bits, bit k is set if there is an element at direction k.
+    Patterns (x : element, . : no element, o : the element) :
+        (1)      (2)      (3)      (4)      (5)      (6)      (7)      (8)
+        x x x    x . x    x . x    x x x    x . .    . . x    x x x    x x x
+        x o .    . o x    x o .    . o x    . o .    . o .    . o .    . o .
+        x . x    x x x    x x x    x . x    x x x    x x x    x . .    . . x'''
+    patterns = (
+        ('xxx' 'xo.' 'x.x', ('U', 'L', 'RU', 'LD')),
+        ('x.x' '.ox' 'xxx', ('D', 'R', 'RU', 'LD')),
+        ('x.x' 'xo.' 'xxx', ('D', 'L', 'LU', 'RD')),
+        ('xxx' '.ox' 'x.x', ('U', 'R', 'LU', 'RD')),
+        ('x..' '.o.' 'xxx', ('D', 'RU', 'LD')),
+        ('..x' '.o.' 'xxx', ('D', 'LU', 'RD')),
+        ('xxx' '.o.' 'x..', ('U', 'LU', 'RD')),
+        ('xxx' '.o.' '..x', ('U', 'RU', 'LD')),
+    )
+    # directions of the 3x3 pattern, read row by row
+    patternDirc = ('LU', 'U', 'RU', 'L', None, 'R', 'LD', 'D', 'RD')
+    pruneTable = np.zeros(256, dtype = np.uint8)
+    for pattern, cutDircs in patterns :
+        neighbourhood = sum(1 << connectBit[dirc] for dirc, have in zip(patternDirc, pattern)
+                            if have == 'x')
+        pruneTable[neighbourhood] = sum(1 << connectBit[dirc] for dirc in cutDircs)
+    return pruneTable
+pruneTable = _make_pruneTable()
+# setting -> its default, see _settingProperty
+settingDefaults = {}
+def _settingProperty(name, default = None) :
+    '''Setting of an element. Settings are stored in board.elemSettings only after \
+       they are set, elements with default settings take no space.'''
+    settingDefaults[name] = default
+    def get(self) :
+        settings = self.board.elemSettings.get((self.i, self.j))
+        if settings is None : return default
+        return settings.get(name, default)
+    def set(self, value) :
+        self.board.elemSettings.setdefault((self.i, self.j), {})[name] = value
+    return property(get, set)
+def _arrayProperty(arrayName) :
+    '''State of an element stored in an array of the board.'''
+    def get(self) :
+        return getattr(self.board, arrayName)[self.i, self.j].item()
+    def set(self, value) :
+        getattr(self.board, arrayName)[self.i, self.j] = value
+    return property(get, set)
 class PosAdjustable :
-    def __init__(self) :
-        self.valuePos   = 'RHS'
-        self.pmPos      = 'LHS'
-        self.move       = 0, 0
-        self.pmMove     = 0, 0
-        self.valueMove  = 0, 0
-        self.pmSep      = 0
+    __slots__ = ()
+    valuePos   = _settingProperty('valuePos', 'RHS')
+    pmPos      = _settingProperty('pmPos', 'LHS')
+    move       = _settingProperty('move', (0, 0))
+    pmMove     = _settingProperty('pmMove', (0, 0))
+    valueMove  = _settingProperty('valueMove', (0, 0))
+    pmSep      = _settingProperty('pmSep', 0)
 
     def _check_posInput(self, side) :
         if side not in ('RHS', 'LHS') :
@@ -57,8 +135,6 @@ class PosAdjustable :
     def set_pmPos(self, side) :
         self._check_posInput(side)
         self.pmPos = side
-    def set_pmSep(self, sep) :
-        self.sep = float(sep)
     def set_move(self, pmove, vmove) :
         self._check_lengthInput(pmove, vmove)
         self.move = float(pmove), float(vmove)
@@ -72,29 +148,48 @@ class PosAdjustable :
         self._check_lengthInput(separation)
         self.pmSep = float(separation)
     
+# wires, nodes and grounds and OP have no label.
+unlabeledCodes = ('.', ',', 'w', 'n', 'g', 'O')
 class Element(PosAdjustable) : 
-    def __init__(self, elemID, board, i, j) :
-        '''Value of an element is automatically set as its element code.\
-           However, wires, nodes and grounds and OP are not.'''
-        self.elemCode  = elemID[0]
+    '''An element is a view of position (i, j) of a board, made when it is accessed.\
+       Codes, connections and anchors are stored in arrays of the board, settings \
+       in board.elemSettings.'''
+    __slots__ = ('board', 'i', 'j')
+    def __init__(self, board, i, j) :
         self.board     = board
         self.i, self.j = i, j
-        if self.elemCode[0] not in ('.', ',', 'w', 'n', 'g', 'O') :
-            self.label    = elemID[1]
-            self.value    = elemID[0] + '_' + elemID[1]
-            self.pm       = None
-        else :
-            self.label    = None
-            self.value    = None
-        self.connectU    = False
-        self.connectD    = False
-        self.connectL    = False
-        self.connectR    = False
-        self.connectRU   = False
-        self.connectRD   = False
-        self.connectLU   = False
-        self.connectLD   = False
-        PosAdjustable.__init__(self)
+    @property
+    def elemCode(self) :
+        elemCode = self.board.codeArray[self.i, self.j]
+        # diagonal only wire is an unnumbered wire
+        return '.' if elemCode == ',' else str(elemCode)
+    @property
+    def label(self) :
+        if self.board.codeArray[self.i, self.j] in unlabeledCodes : return None
+        return str(self.board.labelArray[self.i, self.j])
+    @property
+    def value(self) :
+        '''Value of an element is automatically set as its element code.\
+           However, wires, nodes and grounds and OP are not.'''
+        settings = self.board.elemSettings.get((self.i, self.j))
+        if settings is not None and 'value' in settings : return settings['value']
+        label = self.label
+        return None if label is None else self.elemCode + '_' + label
+    @value.setter
+    def value(self, value) :
+        self.board.elemSettings.setdefault((self.i, self.j), {})['value'] = value
+    pm          = _settingProperty('pm')
+    direction   = _arrayProperty('directionArray')
+    isPosAnchor = _arrayProperty('isPosAnchorArray')
+    isNode      = _arrayProperty('isNodeArray')
+    connectU  = _connectProperty('U')
+    connectD  = _connectProperty('D')
+    connectL  = _connectProperty('L')
+    connectR  = _connectProperty('R')
+    connectRU = _connectProperty('RU')
+    connectRD = _connectProperty('RD')
+    connectLU = _connectProperty('LU')
+    connectLD = _connectProperty('LD')
 
     def print_info(self) :
         print('elemCode  : ', self.elemCode)
@@ -126,11 +221,7 @@ class Element(PosAdjustable) :
 class ConnectingElement(Element) :
     '''Connecting Elements are those that can connect to mutiple direction,\
     includes nunumered wire and nodes. It has no direction.'''
-    def __init__(self, elemID, board, i, j) :
-        self.direction = 'U'
-        self.isPosAnchor = False
-        self.isNode      = False
-        super().__init__(elemID, board, i, j)
+    __slots__ = ()
     def print_info(self) :
         print('isPosAnchor : ', self.isPosAnchor)
         print('isNode    : ', self.isNode)
@@ -139,12 +230,9 @@ class ConnectingElement(Element) :
 class PrimaryElement(Element):
     '''Primary elements can only connect to a pair of opite directions i.e.\
        up and down, left and right. It has direction.'''
-    def __init__(self, elemID, board, i, j):
-        self.direction = 'U'
-        self.pm        = None
-        super().__init__(elemID, board, i, j)
+    __slots__ = ()
     def set_direction(self, direction) :
-        CircuitBoard._directionFormate(self.board, self.i, self.j, direction)
+        self.board._set_direction(self.i, self.j, direction)
     def print_info(self) :
         print('direction : ', self.direction)
         print('pm        : ', self.pm)
@@ -181,117 +269,239 @@ arguments provided are not enough for every element in the storage.'
         for i in range(len(self.storage)) :
             method(self.storage[i], pmove, vmove)
 
-class Resistor(PrimaryElement)  : pass
-class Inductor(PrimaryElement)  : pass
-class Capacitor(PrimaryElement) : pass
-class IndCurt(PrimaryElement)   : pass
-class DepCurt(PrimaryElement)   : pass
-class IndVolt(PrimaryElement)   : pass
-class DepVolt(PrimaryElement)   : pass
-class Box(PrimaryElement)       : pass
-class Mesh(PrimaryElement)      : pass
-class OperationalAmplifier(PrimaryElement)      : pass
-class Ground(ConnectingElement)      : pass
-class UnNumberedWire(ConnectingElement) : pass
+class Resistor(PrimaryElement)  : __slots__ = ()
+class Inductor(PrimaryElement)  : __slots__ = ()
+class Capacitor(PrimaryElement) : __slots__ = ()
+class IndCurt(PrimaryElement)   : __slots__ = ()
+class DepCurt(PrimaryElement)   : __slots__ = ()
+class IndVolt(PrimaryElement)   : __slots__ = ()
+class DepVolt(PrimaryElement)   : __slots__ = ()
+class Box(PrimaryElement)       : __slots__ = ()
+class Mesh(PrimaryElement)      : __slots__ = ()
+class OperationalAmplifier(PrimaryElement)      : __slots__ = ()
+class Ground(ConnectingElement)      : __slots__ = ()
+class UnNumberedWire(ConnectingElement) : __slots__ = ()
 class Arrow(PrimaryElement) :
-    shape = 'mid'
+    __slots__ = ()
+    shape = _settingProperty('shape', 'mid')
     def set_shape(self, shape) :
         self.shape = shape
 class Wire(PrimaryElement) :
-    isGround = 'F'
+    __slots__ = ()
+    isGround = _settingProperty('isGround', 'F')
     def set_ground(self, isGround) :
         self.isGround = isGround
 class Node(ConnectingElement) :
-    fill = 'T'
+    __slots__ = ()
+    fill = _settingProperty('fill', 'T')
     def set_fill(self, fill) :
         self.fill = fill
 
+elemClasses = {
+    'R' : Resistor,  'L' : Inductor, 'C' : Capacitor, 'I' : IndCurt,
+    'i' : DepCurt,   'V' : IndVolt,  'v' : DepVolt,   'm' : Mesh,
+    'n' : Node,      'A' : Arrow,    'w' : Wire,      'b' : Box,
+    'g' : Ground,    'O' : OperationalAmplifier,
+}
+def _stateSetting(name) :
+    default = settingDefaults[name]
+    return property(lambda self : self.settings.get(name, default))
+class ElemState :
+    '''\
+    Read-only snapshot of the element at (i, j), made in bulk by ElemArray.states.
+    Reading it needs no array indexing nor lookups in the board, thus conversion
+    reads elements by their states instead of views.'''
+    __slots__ = ('i', 'j', 'elemCode', 'label', 'direction', 'isNode', 'isPosAnchor', 'settings')
+    def __init__(self, pos, elemCode, label, direction, isNode, isPosAnchor, settings) :
+        self.i, self.j   = pos
+        self.elemCode    = elemCode
+        self.label       = label
+        self.direction   = direction
+        self.isNode      = isNode
+        self.isPosAnchor = isPosAnchor
+        self.settings    = settings
+    @property
+    def value(self) :
+        if 'value' in self.settings : return self.settings['value']
+        return None if self.label is None else self.elemCode + '_' + self.label
+    valuePos  = _stateSetting('valuePos')
+    pmPos     = _stateSetting('pmPos')
+    move      = _stateSetting('move')
+    pmMove    = _stateSetting('pmMove')
+    valueMove = _stateSetting('valueMove')
+    pmSep     = _stateSetting('pmSep')
+    pm        = _stateSetting('pm')
+    shape     = _stateSetting('shape')
+    isGround  = _stateSetting('isGround')
+    fill      = _stateSetting('fill')
 def make_elemIDArray(circuitCode) :
-    '''Return an array that store element ID at each ition.'''
+    '''\
+    Return an array that store element ID at each ition.
+    Lines are padded into one buffer and viewed as (Nv, Nh, 3) characters, each cell is
+    an element ID and a separating space. Raise ValueError with line and column of every
+    malformed cell.'''
     lines = circuitCode.split('\n')
-    Nv = 0
-    maxLength = 0
-    for line in lines :
-        if len(line) == 0 or line[0] != '#' :
-            Nv += 1
-            if len(line.rstrip()) > maxLength :
-                maxLength = len(line.rstrip())
+    Nv = sum(1 for line in lines if len(line) == 0 or line[0] != '#')
+    rows = [line.rstrip() for line in lines[:Nv]]
+    maxLength = max((len(row) for row in rows), default = 0)
     Nh = ( maxLength + 1 ) // 3
-    output = np.empty([Nv, Nh], dtype = object)
-    for i in range(Nv):
-        for j in range(Nh) :
-            contains = lines[i][3*j : 3*j+2]
-            if contains in ('', ' ') : output[i, j] = '  '
-            else : output[i, j] = lines[i][3*j : 3*j+2]
-    return output
-def make_elemArray(board, elemIDArray) :
-    '''Return an array that store element object at each ition'''
-    Nv = elemIDArray.shape[0]
-    Nh = elemIDArray.shape[1]
-    def make_element(elemCode, i, j) :
-        if elemCode[0] == 'R' : return Resistor(elemCode, board, i, j)
-        if elemCode[0] == 'L' : return Inductor(elemCode, board, i, j)
-        if elemCode[0] == 'C' : return Capacitor(elemCode, board, i, j)
-        if elemCode[0] == 'I' : return IndCurt(elemCode, board, i, j)
-        if elemCode[0] == 'i' : return DepCurt(elemCode, board, i, j)
-        if elemCode[0] == 'V' : return IndVolt(elemCode, board, i, j)
-        if elemCode[0] == 'v' : return DepVolt(elemCode, board, i, j)
-        if elemCode[0] == 'm' : return Mesh(elemCode, board, i, j)
-        if elemCode[0] == 'n' : return Node(elemCode, board, i, j)
-        if elemCode[0] == 'A' : return Arrow(elemCode, board, i, j)
-        if elemCode[0] == 'w' : return Wire(elemCode, board, i, j)
-        if elemCode[0] == 'b' : return Box(elemCode, board, i, j)
-        if elemCode[0] == 'g' : return Ground(elemCode, board, i, j)
-        if elemCode[0] == 'O' : return OperationalAmplifier(elemCode, board, i, j)
-    
-    elemArray = np.empty([Nv, Nh], dtype = object)
-    for i in range(Nv):
-        for j in range(Nh) :
-            if elemIDArray[i, j] in ('..', ',,') :
-                elemArray[i, j] = UnNumberedWire('..', board, i, j)
-            elif elemIDArray[i, j] != '  ' :
-                elemArray[i, j] = make_element(elemIDArray[i, j], i, j)
-            else : 
-                elemArray[i, j] = None
-    return elemArray
+    # cover every character, a partial cell at the end of a row is malformed.
+    width = 3 * (( maxLength + 2 ) // 3)
+    buffer = ''.join(row.ljust(width) for row in rows)
+    chars = np.frombuffer(buffer.encode('utf-32-le'), dtype = '<U1').reshape(Nv, width // 3, 3)
+    check_elemIDChars(chars)
+    return np.ascontiguousarray(chars[:, :Nh, :2]).view('<U2').reshape(Nv, Nh)
+# white spaces besides ' ', which is checked as an incomplete cell.
+whiteSpaces = tuple('\t\r\x0b\x0c\xa0\u3000')
+def check_elemIDChars(chars, maxReport = 20) :
+    '''Raise ValueError if cells of the (Nv, Nh, 3) character array are malformed.'''
+    code, label, separator = chars[:, :, 0], chars[:, :, 1], chars[:, :, 2]
+    isEmpty = (code == ' ') & (label == ' ')
+    isIncomplete = (code == ' ') ^ (label == ' ')
+    isCell = ~isEmpty & ~isIncomplete
+    isWire = np.isin(code, ('.', ','))
+    problems = (
+        # (cells, offset of column, message)
+        (isIncomplete, 0, 'element ID must be 2 characters'),
+        (isCell & ~isWire & ~np.isin(code, tuple(elemClasses)), 0, 'unknown element code'),
+        (isCell & isWire & (code != label), 0, 'unnumbered wire must be \'..\' or \',,\''),
+        (isCell & ~isWire & np.isin(label, whiteSpaces), 1, 'label can not be a white space'),
+        (separator != ' ', 2, 'cells must be separated by a space'),
+    )
+    errors = []
+    for isMalformed, offset, message in problems :
+        for i, j in zip(*np.nonzero(isMalformed)) :
+            got = ''.join(chars[i, j, :2]) if offset < 2 else chars[i, j, 2]
+            errors.append((i, 3*j + offset, f'{message}, got {got!r}'))
+    report_errors('circuit string is malformed', errors, maxReport)
+def report_errors(title, errors, maxReport = None) :
+    '''\
+    Raise ValueError that lists every error, errors are (line, column, message) counted
+    from 0. Only the first maxReport errors are listed if maxReport is given.'''
+    if not errors : return
+    errors = sorted(errors)
+    shown = errors if maxReport is None else errors[:maxReport]
+    report = [f'line {i+1}, column {column+1} : {message}' for i, column, message in shown]
+    if len(errors) > len(shown) : report.append(f'... and {len(errors) - len(shown)} more')
+    raise ValueError(title + '\n' + '\n'.join(report))
+class ElemArray :
+    '''Elements of a board by position, elemArray[i, j] is the element at (i, j)\
+       or None. Elements are views made when they are accessed.'''
+    def __init__(self, board) :
+        self.board = board
+        self.shape = board.elemIDArray.shape
+    def __getitem__(self, pos) :
+        i, j = pos
+        elemID = self.board.elemIDArray[i, j]
+        if elemID in ('..', ',,') : return UnNumberedWire(self.board, i, j)
+        if elemID == '  ' : return None
+        elemClass = elemClasses.get(elemID[0])
+        return None if elemClass is None else elemClass(self.board, i, j)
+    def states(self, positions) :
+        '''ElemState of elements at positions (None for empty cells), arrays are read at once.'''
+        if not positions : return []
+        board = self.board
+        I, J = np.array(positions).T
+        noSettings = {}
+        states = []
+        for pos, elemID, direction, isNode, isPosAnchor in zip(
+                positions, board.elemIDArray[I, J].tolist(), board.directionArray[I, J].tolist(),
+                board.isNodeArray[I, J].tolist(), board.isPosAnchorArray[I, J].tolist()) :
+            elemCode = elemID[0]
+            if elemID not in ('..', ',,') and elemCode not in elemClasses :
+                states.append(None)
+                continue
+            label = None if elemCode in unlabeledCodes else elemID[1]
+            states.append(ElemState(pos, '.' if elemCode == ',' else elemCode, label, direction,
+                                    isNode, isPosAnchor, board.elemSettings.get(pos, noSettings)))
+        return states
+# escape sequences in arguments, '!' followed by other characters is kept as it is.
+settingEscapes = {' ' : ' ', '!' : '!', 'n' : '', 'N' : ''}
+def tokenize_setting(settingSheetStr) :
+    '''\
+    Split a setting sheet into commands, each line is "name : setting = arguments".
+    Return commands and errors :
+        command : (line, name, setting, arguments, columns), columns are the columns
+                  of name, setting and every argument.
+        error   : (line, column, message).
+    Lines and columns are counted from 0. Empty lines and lines start with '#' are skipped.
+    Arguments are separated by white spaces, escapes : '! ' (space), '!!' (!), '!n' or
+    '!N' (null).'''
+    commands, errors = [], []
+    for lineNo, line in enumerate(settingSheetStr.split('\n')) :
+        line = line.rstrip()
+        if line == '' or line[0] == '#' : continue
+        colon = line.find(':')
+        equal = line.find('=', colon + 1)
+        if colon < 0 or equal < 0 :
+            missing = '\':\'' if colon < 0 else '\'=\''
+            errors.append((lineNo, len(line), f'expect "name : setting = arguments", {missing} is missing'))
+            continue
+        name, nameColumn = _strip_token(line, 0, colon)
+        setting, settingColumn = _strip_token(line, colon + 1, equal)
+        if name == '' :
+            errors.append((lineNo, nameColumn, 'element or container name is missing'))
+        if setting == '' :
+            errors.append((lineNo, settingColumn, 'setting is missing'))
+        if name == '' or setting == '' : continue
+        arguments, columns = [], [nameColumn, settingColumn]
+        k = equal + 1
+        while k < len(line) :
+            if line[k].isspace() :
+                k += 1
+                continue
+            columns.append(k)
+            argument = []
+            while k < len(line) and not line[k].isspace() :
+                if line[k] == '!' and line[k+1 : k+2] in settingEscapes :
+                    argument.append(settingEscapes[line[k+1]])
+                    k += 2
+                else :
+                    argument.append(line[k])
+                    k += 1
+            arguments.append(''.join(argument))
+        commands.append((lineNo, name, setting, arguments, columns))
+    return commands, errors
+def _strip_token(line, start, end) :
+    '''Return line[start:end] without surrounding white spaces and its column.'''
+    token = line[start:end]
+    column = start + len(token) - len(token.lstrip())
+    return token.strip(), min(column, end)
 def decode(settingSheetStr) :
-    lines = settingSheetStr.split('\n')
-    try :
-        commandCount = sum(1 for line in lines if line[0] != "#")
-    except IndexError :
-        raise IndexError('setting sheet is incorrectly formatted') from None
-    if commandCount == 0 : return None
-    def parse_line(s):
-        # replace escape sequence as __xx__ 
-        s = s.replace('! ', '__sp__') # space
-        s = s.replace('!!', '__ex__') # exclamation mark
-        s = s.replace('!n', '__NU__') # null
-        s = s.replace('!N', '__NU__') # null
-        # tear apart elemCode, setting and argument
-        try :
-            parts = s.split(':', 1)
-            elemCode = parts[0].strip()
-            setting, arguments = parts[1].strip().split('=', 1)
-        except ValueError :
-            raise ValueError('setting sheet is incorrectly formatted') from None
-        return elemCode, setting.strip(), arguments.strip()
-    
-    commands = np.zeros([len(lines), 3], dtype=object)
-    for i in range(commandCount) :
-        commands[i, :] = parse_line(lines[i])
-    # command[i, 0] : elemCode
-    # command[i, 1] : setting
-    # command[i, 2] : arguments
-    processedCommands = []
-    for i in range(commandCount) :
-        arguments = commands[i][2].split()
-        arguments = [argument.replace('__sp__', ' ') for argument in arguments]
-        arguments = [argument.replace('__ex__', '!') for argument in arguments]
-        arguments = [argument.replace('__NU__', '')  for argument in arguments]
-        processedCommands.append( (commands[i][0], commands[i][1], arguments) )
-    return processedCommands
+    '''\
+    Return commands (name, setting, arguments) of a setting sheet, or None if it has no
+    command. Raise ValueError if any line is malformed.'''
+    commands, errors = tokenize_setting(settingSheetStr)
+    report_errors('setting sheet is malformed', errors)
+    if not commands : return None
+    return [(name, setting, arguments) for _, name, setting, arguments, _ in commands]
+
+# direction -> the direction of its connect bit pair, bit and bit + 4.
+directionPairs = {'U' : 'U', 'D' : 'U', 'L' : 'R', 'R' : 'R',
+                  'RU' : 'RU', 'LD' : 'RU', 'RD' : 'LU', 'LU' : 'LU'}
+def _check_elemID(elemID) :
+    '''Raise ValueError if elemID is not an element ID, '  ' is for no element.'''
+    if elemID == '  ' : return
+    if len(elemID) != 2 or ' ' in elemID :
+        raise ValueError(f'element ID must be 2 characters, got {elemID!r}')
+    if elemID[0] in ('.', ',') :
+        if elemID not in ('..', ',,') :
+            raise ValueError(f'unnumbered wire must be \'..\' or \',,\', got {elemID!r}')
+    elif elemID[0] not in elemClasses :
+        raise ValueError(f'unknown element code, got {elemID!r}')
+    elif elemID[1] in whiteSpaces :
+        raise ValueError(f'label can not be a white space, got {elemID!r}')
 
 class CircuitBoard :
+    # cells that editing a cell may change the connections, anchors and nodes of, are
+    # at most editRadius cells away from it.
+    editRadius = 3
+    # boards filled less than sparseFillRatio are formated over occupied cells only.
+    sparseFillRatio = 0.3
+    # containers are made for elements with these codes.
+    _containerCodes = ('R', 'L', 'C', 'I', 'i', 'V', 'v', 'm', 'n', 'A', 'w', 'b', 'g')
+    # directions are formated when they are set, besides while editing, see _edit.
+    _isEditing = False
     def _dirc2ij(self, i, j, direction) :
         if direction == 'U' :  return i-1, j
         if direction == 'D' :  return i+1, j
@@ -310,364 +520,781 @@ class CircuitBoard :
         Desi, Desj = self._dirc2ij(i, j, direction)
         if Desi<0 or Desi>=self.Nv or Desj<0 or Desj>=self.Nh : return False
         else : return self.haveDiagOnlyElemBoolArray[Desi, Desj]  
+    def _check_direction(self, direction) :
+        if direction not in directionPairs :
+            raise ValueError(f'{direction} is not an avaliable direction. Support : {", ".join(directionPairs)}')
+    def _set_direction(self, i, j, direction) :
+        '''\
+        Direction set by setting sheet. Directions are kept in directionSettings in the
+        order they are set, thus they can be formated again.'''
+        self._check_direction(direction)
+        self.directionSettings.append(((i, j), direction))
+        if not self._isEditing : self._directionFormate(i, j, direction)
     def _directionFormate(self, i, j, direction, disconnectAll = False) :
         '''First clear every connection that involve this primary element.\
            Then make connection on the correspond direction.'''
+        C = self.connectArray
         if self.Ai[i, j][0] != 'g' :
-            self.Ae[i, j].connectD = False
-            self.Ae[i, j].connectU = False
-            self.Ae[i, j].connectR = False
-            self.Ae[i, j].connectL = False
-            self.Ae[i, j].connectLD = False
-            self.Ae[i, j].connectRU = False
-            self.Ae[i, j].connectLU = False
-            self.Ae[i, j].connectRD = False
-            if self.haveElem(i, j, 'U') : self.Ae[self._dirc2ij(i, j, 'U')].connectD = False
-            if self.haveElem(i, j, 'D') : self.Ae[self._dirc2ij(i, j, 'D')].connectU = False
-            if self.haveElem(i, j, 'L') : self.Ae[self._dirc2ij(i, j, 'L')].connectR = False
-            if self.haveElem(i, j, 'R') : self.Ae[self._dirc2ij(i, j, 'R')].connectL = False
-            if self.haveElem(i, j, 'RU') : self.Ae[self._dirc2ij(i, j, 'RU')].connectLD = False
-            if self.haveElem(i, j, 'LD') : self.Ae[self._dirc2ij(i, j, 'LD')].connectRU = False
-            if self.haveElem(i, j, 'RD') : self.Ae[self._dirc2ij(i, j, 'RD')].connectLU = False
-            if self.haveElem(i, j, 'LU') : self.Ae[self._dirc2ij(i, j, 'LU')].connectRD = False
+            C[i, j] = 0
+            for bit, (di, dj) in enumerate(connectMove) :
+                if self.haveElem(i+di, j+dj) : C[i+di, j+dj] &= 0xff ^ (1 << (bit+4) % 8)
         
         if not disconnectAll :
-            self.Ae[i, j].direction = direction
-            if direction in ('U', 'D') : 
-                self.Ae[i, j].connectU = True
-                self.Ae[i, j].connectD = True
-                if self.haveElem(i, j, 'U') : self.Ae[self._dirc2ij(i, j, 'U')].connectD = True
-                if self.haveElem(i, j, 'D') : self.Ae[self._dirc2ij(i, j, 'D')].connectU = True
-            if direction in ('L', 'R') :  
-                self.Ae[i, j].connectL = True
-                self.Ae[i, j].connectR = True
-                if self.haveElem(i, j, 'L') : self.Ae[self._dirc2ij(i, j, 'L')].connectR = True
-                if self.haveElem(i, j, 'R') : self.Ae[self._dirc2ij(i, j, 'R')].connectL = True
-            if direction in ('RU', 'LD') :
-                self.Ae[i, j].connectRU = True
-                self.Ae[i, j].connectLD = True
-                if self.haveElem(i, j, 'RU') : self.Ae[self._dirc2ij(i, j, 'RU')].connectLD = True
-                if self.haveElem(i, j, 'LD') : self.Ae[self._dirc2ij(i, j, 'LD')].connectRU = True
-            if direction in ('RD', 'LU') :
-                self.Ae[i, j].connectRD = True
-                self.Ae[i, j].connectLU = True
-                if self.haveElem(i, j, 'RD') : self.Ae[self._dirc2ij(i, j, 'RD')].connectLU = True
-                if self.haveElem(i, j, 'LU') : self.Ae[self._dirc2ij(i, j, 'LU')].connectRD = True
+            self._check_direction(direction)
+            self.directionArray[i, j] = direction
+            pairBit = connectBit[directionPairs[direction]]
+            for bit in (pairBit, pairBit+4) :
+                di, dj = connectMove[bit]
+                C[i, j] |= 1 << bit
+                if self.haveElem(i+di, j+dj) : C[i+di, j+dj] |= 1 << (bit+4) % 8
 
+    def _shifted(self, array, bit) :
+        '''Return array at the neighbour of each position in the direction of bit, \
+           neighbours outside the board are 0.'''
+        di, dj = connectMove[bit]
+        padded = np.pad(array, 1)
+        return padded[1+di : 1+di+self.Nv, 1+dj : 1+dj+self.Nh]
+    @property
+    def isSparse(self) :
+        H = self.haveElemBoolArray
+        return np.count_nonzero(H) < self.sparseFillRatio * H.size
+    def _cells(self) :
+        '''\
+        Return (gather, scatter, shifted, nonzero) that _autoFormate works with.
+        Dense boards work on the whole grid in place. Sparse boards work on the list of
+        occupied cells, a neighbour of each cell is looked up in the sorted flat indices,
+        thus time and memory scale with element count rather than board area.
+            gather(array)          : array at every cell.
+            scatter(array, values) : write values of every cell back to array.
+            shifted(values, bit)   : values at the neighbour in the direction of bit,
+                                     empty neighbours and neighbours outside the board are 0.
+            nonzero(values)        : positions (I, J) of cells that values are true.'''
+        if not self.isSparse :
+            def scatter(array, values) :
+                if values is not array : array[...] = values
+            return (lambda array : array), scatter, self._shifted, np.nonzero
+        I, J = np.nonzero(self.haveElemBoolArray)
+        flat = I * self.Nh + J
+        N = len(flat)
+        neighbours = []
+        for bit in range(8) :
+            di, dj = connectMove[bit]
+            ni, nj = I + di, J + dj
+            inside = (0 <= ni) & (ni < self.Nv) & (0 <= nj) & (nj < self.Nh)
+            k = np.searchsorted(flat, ni * self.Nh + nj)
+            found = inside & (k < N)
+            found[found] = flat[k[found]] == (ni * self.Nh + nj)[found]
+            # N is the index of a padded 0
+            neighbours.append(np.where(found, k, N))
+        def gather(array) : return array[I, J]
+        def scatter(array, values) : array[I, J] = values
+        def shifted(values, bit) :
+            return np.concatenate([values, np.zeros(1, dtype = values.dtype)])[neighbours[bit]]
+        def nonzero(values) : return I[values], J[values]
+        return gather, scatter, shifted, nonzero
     def _autoFormate(self, * ,setAnchorAndNodeOnly = False, autoNode) :
         '''\
         1. Auto generated nodes will be located.
         2. The ition anchors (used in drawing wires) will be located.
         3. The avalibale connecting directions of all elements will be set.
-        4. The direction of pirmary elements will be adjust according to avalibale connection.'''    
-        def set_possibleConnections(i, j) :
+        4. The direction of pirmary elements will be adjust according to avalibale connection.
+        Every step works on all cells at once with neighbour arrays, see _cells.'''
+        gather, scatter, shifted, nonzero = self._cells()
+        H = gather(self.haveElemBoolArray)
+        G = gather(self.haveDiagOnlyElemBoolArray)
+        C = gather(self.connectArray)
+        codes = gather(self.codeArray)
+        haveElemAt = [shifted(H, bit) for bit in range(8)]
+        def set_possibleConnections() :
             # every diagonal connection must contain at least one diagonal wire. 
             # diagonal wire can not have connection on U D L R directions.
-            if not self.haveDiagOnlyElem(i, j) :
-                if self.haveElem(i, j, 'U') and not self.haveDiagOnlyElem(i, j, 'U') : self.Ae[i, j].connectU  = True
-                if self.haveElem(i, j, 'D') and not self.haveDiagOnlyElem(i, j, 'D') : self.Ae[i, j].connectD  = True
-                if self.haveElem(i, j, 'L') and not self.haveDiagOnlyElem(i, j, 'L') : self.Ae[i, j].connectL  = True
-                if self.haveElem(i, j, 'R') and not self.haveDiagOnlyElem(i, j, 'R') : self.Ae[i, j].connectR  = True
-                if self.haveElem(i, j, 'LU') and self.haveDiagOnlyElem(i, j, 'LU')   : self.Ae[i, j].connectLU = True
-                if self.haveElem(i, j, 'RU') and self.haveDiagOnlyElem(i, j, 'RU')   : self.Ae[i, j].connectRU = True
-                if self.haveElem(i, j, 'RD') and self.haveDiagOnlyElem(i, j, 'RD')   : self.Ae[i, j].connectRD = True
-                if self.haveElem(i, j, 'LD') and self.haveDiagOnlyElem(i, j, 'LD')   : self.Ae[i, j].connectLD = True
-            if self.haveDiagOnlyElem(i, j) :
-                if self.haveElem(i, j, 'LU') : self.Ae[i, j].connectLU = True
-                if self.haveElem(i, j, 'RU') : self.Ae[i, j].connectRU = True
-                if self.haveElem(i, j, 'RD') : self.Ae[i, j].connectRD = True
-                if self.haveElem(i, j, 'LD') : self.Ae[i, j].connectLD = True
-        def modify_connection(i, j) :
-            haveElemAt = {
-                'U'  : self.haveElem(i, j, 'U'),
-                'D'  : self.haveElem(i, j, 'D'),
-                'L'  : self.haveElem(i, j, 'L'),
-                'R'  : self.haveElem(i, j, 'R'),
-                'RU' : self.haveElem(i, j, 'RU'),
-                'LU' : self.haveElem(i, j, 'LU'),
-                'RD' : self.haveElem(i, j, 'RD'),
-                'LD' : self.haveElem(i, j, 'LD')
-            }    
-            #    (1)         (2)         (3)         (4)
-            #    .. .. ..    ,, xx ..    .. xx ,,    .. .. ..
-            #    .. oo xx    xx oo ..    .. oo xx    xx oo ..
-            #    .. xx ,,    .. .. ..    .. .. ..    ,, xx ..
-            #
-            #    (5)         (6)         (7)         (8)
-            #    ,, xx xx    xx xx ,,    .. .. ..    .. .. ..
-            #    xx oo xx    xx oo xx    xx oo xx    xx oo xx
-            #    .. .. ..    .. .. ..    ,, xx xx    xx xx ,,
-            
-            case1 =     haveElemAt['LU'] and     haveElemAt['U'] and     haveElemAt['RU'] and \
-                        haveElemAt['L']  and        True         and not haveElemAt['R'] and \
-                        haveElemAt['LD'] and not haveElemAt['D'] and     haveElemAt['RD'] 
-            case2 =     haveElemAt['LU'] and not haveElemAt['U'] and     haveElemAt['RU'] and \
-                    not haveElemAt['L']  and        True         and     haveElemAt['R'] and \
-                        haveElemAt['LD'] and     haveElemAt['D'] and     haveElemAt['RD'] 
-            case3 =     haveElemAt['LU'] and not haveElemAt['U'] and     haveElemAt['RU'] and \
-                        haveElemAt['L']  and        True         and not haveElemAt['R'] and \
-                        haveElemAt['LD'] and     haveElemAt['D'] and     haveElemAt['RD']
-            case4 =     haveElemAt['LU'] and     haveElemAt['U'] and     haveElemAt['RU'] and \
-                    not haveElemAt['L']  and        True         and     haveElemAt['R'] and \
-                        haveElemAt['LD'] and not haveElemAt['D'] and     haveElemAt['RD']
-            case5 =     haveElemAt['LU'] and not haveElemAt['U'] and not haveElemAt['RU'] and \
-                    not haveElemAt['L']  and        True         and not haveElemAt['R'] and \
-                        haveElemAt['LD'] and     haveElemAt['D'] and     haveElemAt['RD']
-            case6 = not haveElemAt['LU'] and not haveElemAt['U'] and     haveElemAt['RU'] and \
-                    not haveElemAt['L']  and        True         and not haveElemAt['R'] and \
-                        haveElemAt['LD'] and     haveElemAt['D'] and     haveElemAt['RD']
-            case7 =     haveElemAt['LU'] and     haveElemAt['U'] and     haveElemAt['RU'] and \
-                    not haveElemAt['L']  and        True         and not haveElemAt['R'] and \
-                        haveElemAt['LD'] and not haveElemAt['D'] and not haveElemAt['RD']
-            case8 =     haveElemAt['LU'] and     haveElemAt['U'] and     haveElemAt['RU'] and \
-                    not haveElemAt['L']  and        True         and not haveElemAt['R'] and \
-                    not haveElemAt['LD'] and not haveElemAt['D'] and     haveElemAt['RD']
-            # remove connection to up
-            if case1 or case4 or case7 or case8 :
-                if self.haveElem(i, j, 'U') : 
-                    self.Ae[self._dirc2ij(i, j, 'U')].connectD = False
-                    self.Ae[i, j].connectU = False
-            # remove connection to down
-            if case2 or case3 or case5 or case6 :
-                if self.haveElem(i, j, 'D') : 
-                    self.Ae[self._dirc2ij(i, j, 'D')].connectU = False
-                    self.Ae[i, j].connectD = False
-            # remove connection to left
-            if case1 or case3 :
-                if self.haveElem(i, j, 'L') : 
-                    self.Ae[self._dirc2ij(i, j, 'L')].connectR = False
-                    self.Ae[i, j].connectL = False
-            # remove connection to right
-            if case2 or case4 :
-                if self.haveElem(i, j, 'R') : 
-                    self.Ae[self._dirc2ij(i, j, 'R')].connectL = False
-                    self.Ae[i, j].connectR = False
-            # remove connection of LU-RD connection 
-            if case1 or case2 or case5 or case8:
-                self.Ae[i, j].connectRU,  self.Ae[i, j].connectLD = False, False
-                if self.haveElem(i, j, 'RU') : self.Ae[self._dirc2ij(i, j, 'RU')].connectLD = False
-                if self.haveElem(i, j, 'LD') : self.Ae[self._dirc2ij(i, j, 'LD')].connectRU = False; 
-            # remove connection of LD-RU connection 
-            if case3 or case4 or case6 or case7:
-                self.Ae[i, j].connectLU,  self.Ae[i, j].connectRD = False, False
-                if self.haveElem(i, j, 'LU') : self.Ae[self._dirc2ij(i, j, 'LU')].connectRD = False
-                if self.haveElem(i, j, 'RD') : self.Ae[self._dirc2ij(i, j, 'RD')].connectLU = False                
-        def set_anchorAndNode(i, j) :
-            connectN, connectDircN = 0, 0
-            haveElemUD, haveElemLR, haveElemLURD, haveElemRULD = False, False, False, False
-            if self.Ae[i, j].connectU and self.haveElem(i, j, 'U') \
-               and self.Ae[self._dirc2ij(i, j, 'U')].connectD :
-                connectN+=1; haveElemUD = True
-            if self.Ae[i, j].connectD and self.haveElem(i, j, 'D') \
-               and self.Ae[self._dirc2ij(i, j, 'D')].connectU :
-                connectN+=1; haveElemUD = True
-            if self.Ae[i, j].connectL and self.haveElem(i, j, 'L') \
-               and self.Ae[self._dirc2ij(i, j, 'L')].connectR :
-                connectN+=1; haveElemLR = True
-            if self.Ae[i, j].connectR and self.haveElem(i, j, 'R') \
-               and self.Ae[self._dirc2ij(i, j, 'R')].connectL :
-                connectN+=1; haveElemLR = True
-            if self.Ae[i, j].connectRU and self.haveElem(i, j, 'RU') \
-               and self.Ae[self._dirc2ij(i, j, 'RU')].connectLD: 
-                connectN+=1; haveElemRULD = True
-            if self.Ae[i, j].connectRD and self.haveElem(i, j, 'RD') \
-               and self.Ae[self._dirc2ij(i, j, 'RD')].connectLU : 
-               connectN+=1; haveElemLURD = True
-            if self.Ae[i, j].connectLU and self.haveElem(i, j, 'LU') \
-               and self.Ae[self._dirc2ij(i, j, 'LU')].connectRD : 
-               connectN+=1; haveElemLURD = True
-            if self.Ae[i, j].connectLD and self.haveElem(i, j, 'LD') \
-               and self.Ae[self._dirc2ij(i, j, 'LD')].connectRU :
-               connectN+=1; haveElemRULD = True
-            if haveElemUD : connectDircN += 1
-            if haveElemLR : connectDircN += 1
-            if haveElemRULD : connectDircN += 1
-            if haveElemLURD : connectDircN += 1
-
-            self.Ae[i, j].isPosAnchor = False
-            if autoNode : self.Ae[i, j].isNode      = False
-            # is end point 
-            if connectN == 1 :
-                self.Ae[i, j].isPosAnchor = True 
-            # is intersection or turning point
-            if connectDircN >= 2 : 
-                self.Ae[i, j].isPosAnchor = True
-                # is intersection
-                if connectN >= 3 and autoNode: self.Ae[i, j].isNode = True 
-        def set_priObjDirc(i, j) :
-            isEndPoint = True
+            for bit in range(8) :
+                diagOnlyAt = shifted(G, bit)
+                if bit % 2 == 0 : connect = ~G & haveElemAt[bit] & ~diagOnlyAt
+                else :            connect = haveElemAt[bit] & (G | diagOnlyAt)
+                C[H & connect] |= 1 << bit
+        def modify_connection() :
+            # neighbourhood of each position as 8 bits, cut connections by table.
+            neighbourhood = np.zeros(H.shape, dtype = np.uint8)
+            for bit in range(8) :
+                neighbourhood |= haveElemAt[bit].astype(np.uint8) << bit
+            cut = pruneTable[neighbourhood]
+            cut[~H | (gather(self.Ai) == '..')] = 0
+            cutNeighbour = np.zeros_like(cut)
+            for bit in range(8) :
+                # connection from neighbour is cut if neighbour cuts the connection to here
+                oppsite = (bit + 4) % 8
+                cutNeighbour |= (shifted(cut, oppsite) >> bit & 1) << oppsite
+            C[:] &= ~(cut | cutNeighbour)
+        def set_anchorAndNode() :
+            mutual = [(C >> bit & 1).astype(bool) & (shifted(C, bit) >> (bit+4) % 8 & 1).astype(bool)
+                      for bit in range(8)]
+            connectN = sum(m.astype(np.int8) for m in mutual)
+            # UD, LR, RU-LD and LU-RD are directions 
+            connectDircN = sum((mutual[bit] | mutual[bit+4]).astype(np.int8) for bit in range(4))
+            # is end point, intersection or turning point
+            isPosAnchor = (connectN == 1) | (connectDircN >= 2)
+            # is intersection
+            isNode = (connectDircN >= 2) & (connectN >= 3)
+            scatter(self.isPosAnchorArray, isPosAnchor & H)
+            if autoNode : scatter(self.isNodeArray, isNode & H)
+        def set_priObjDirc() :
+            R, RU, U, LU, L, LD, D, RD = haveElemAt
+            isPair = (RU & LD) | (LU & RD) | (U & D) | (L & R)
             # UD LR have higher proprity then diagonal direction
-            if self.haveElem(i, j, 'RU') and self.haveElem(i, j, 'LD') : 
-                self.Ae[i, j].set_direction('RU'); isEndPoint = False
-            if self.haveElem(i, j, 'LU') and self.haveElem(i, j, 'RD') : 
-                self.Ae[i, j].set_direction('RD'); isEndPoint = False
-            if self.haveElem(i, j, 'U') and self.haveElem(i, j, 'D') : 
-                self.Ae[i, j].set_direction('U'); isEndPoint = False
-            if self.haveElem(i, j, 'L') and self.haveElem(i, j, 'R') : 
-                self.Ae[i, j].set_direction('R'); isEndPoint = False
-            if isEndPoint :
-                if self.haveElem(i, j, 'RU') or self.haveElem(i, j, 'LD') : 
-                    self.Ae[i, j].set_direction('RU')
-                if self.haveElem(i, j, 'LU') or self.haveElem(i, j, 'RD') : 
-                    self.Ae[i, j].set_direction('RD')
-                if self.haveElem(i, j, 'U') or self.haveElem(i, j, 'D') : 
-                    self.Ae[i, j].set_direction('U')
-                if self.haveElem(i, j, 'L') or self.haveElem(i, j, 'R') : 
-                    self.Ae[i, j].set_direction('R')
+            direction = np.select(
+                [L & R, U & D, LU & RD, RU & LD,
+                 ~isPair & (L | R), ~isPair & (U | D), ~isPair & (LU | RD), ~isPair & (RU | LD)],
+                ['R', 'U', 'RD', 'RU', 'R', 'U', 'RD', 'RU'], '')
+            # unnermered wire and node has no direction
+            isPrimary = ~np.isin(codes, (' ', ',', '.', 'n', 'g'))
+            formated = isPrimary & (direction != '')
+            # Same as calling set_direction in order (row by row) : a connection
+            # bit is written by its element and the neighbour at that direction,
+            # the one formated later wins.
+            pairBits = np.zeros(H.shape, dtype = np.uint8)
+            for dirc, oppsiteDirc in (('R', 'L'), ('RU', 'LD'), ('U', 'D'), ('RD', 'LU')) :
+                pairBits[direction == dirc] = 1 << connectBit[dirc] | 1 << connectBit[oppsiteDirc]
+            formatedC = np.zeros_like(C)
+            for bit in range(8) :
+                oppsite = (bit + 4) % 8
+                neighbourFormated = shifted(formated, bit) & H
+                # neighbours at R, LD, D, RD are formated after this element
+                if bit not in (0, 5, 6, 7) : neighbourFormated &= ~formated
+                selfFormated = formated & ~neighbourFormated
+                connect = np.where(neighbourFormated, shifted(pairBits, bit) >> oppsite & 1,
+                          np.where(selfFormated, pairBits >> bit & 1, C >> bit & 1))
+                formatedC |= connect.astype(np.uint8) << bit
+            C[:] = formatedC
+            directions = gather(self.directionArray)
+            directions[formated] = direction[formated]
+            scatter(self.directionArray, directions)
 
         if not setAnchorAndNodeOnly :
-            for i in range(self.Nv):
-                for j in range(self.Nh) :
-                    if self.haveElem(i, j) :
-                        set_possibleConnections(i, j)
-            for i in range(self.Nv):
-                for j in range(self.Nh) :
-                    if self.haveElem(i, j) and not self.Ai[i, j] == '..':
-                        modify_connection(i, j)
-            for i in range(self.Nv):
-                for j in range(self.Nh) :
-                    # unnermered wire and node has no direction
-                    if self.Ai[i, j][0] not in (' ', ',', '.', 'n', 'g') : 
-                        set_priObjDirc(i, j)
-        for i in range(self.Nv):
-            for j in range(self.Nh) :
-                if self.haveElem(i, j) :
-                    if self.Ai[i, j][0] == 'm' or \
-                    (self.Ai[i, j][0] == 'A' and self.Ae[i, j].shape =='end') :
-                        self._directionFormate(i, j, None, disconnectAll = True)
-        for i in range(self.Nv):
-            for j in range(self.Nh) :
-                if self.haveElem(i, j) :
-                    set_anchorAndNode(i, j)
+            set_possibleConnections()
+            modify_connection()
+            set_priObjDirc()
+            scatter(self.connectArray, C)
+        for i, j in zip(*nonzero(H & np.isin(codes, ('m', 'A')))) :
+            if self.Ai[i, j][0] == 'm' or self.Ae[i, j].shape == 'end' :
+                self._directionFormate(i, j, None, disconnectAll = True)
+        C = gather(self.connectArray)
+        set_anchorAndNode()
             
     def _prepare_kitForSetting(self) :
+        self._make_views()
+        self.connectArray     = np.zeros([self.Nv, self.Nh], dtype = np.uint8)
+        self.directionArray   = np.full([self.Nv, self.Nh], 'U', dtype = '<U2')
+        self.isPosAnchorArray = np.zeros([self.Nv, self.Nh], dtype = bool)
+        self.isNodeArray      = np.zeros([self.Nv, self.Nh], dtype = bool)
+        # settings of elements that are set, (i, j) -> {setting : value}
+        self.elemSettings = {}
+        # directions set by setting sheet in order, ((i, j), direction)
+        self.directionSettings = []
+    def _make_views(self) :
+        '''Arrays made from elemIDArray.'''
+        self.elemArray = ElemArray(self)
         self.Ae = self.elemArray
         self.Ai = self.elemIDArray
         self.Nv = self.Ae.shape[0]
         self.Nh = self.Ae.shape[1]
-        self.haveElemBoolArray = np.zeros([self.Nv, self.Nh], dtype = bool)
-        for i in range(self.Nv) :
-            for j in range(self.Nh) :
-                if self.Ai[i, j] != '  ' : self.haveElemBoolArray[i, j] = True
+        self.haveElemBoolArray = np.asarray(self.Ai != '  ', dtype = bool)
         # element code ',,' is for the wire that can only connect diagonally.
-        self.haveDiagOnlyElemBoolArray = np.zeros([self.Nv, self.Nh], dtype = bool)
-        for i in range(self.Nv):
-            for j in range(self.Nh) :
-                if self.Ai[i, j] == ',,' : self.haveDiagOnlyElemBoolArray[i, j] = True
+        self.haveDiagOnlyElemBoolArray = np.asarray(self.Ai == ',,', dtype = bool)
+        # element code and label are views of element ID
+        elemIDChars = self.Ai.view('<U1').reshape(self.Nv, self.Nh, 2)
+        self.codeArray  = elemIDChars[:, :, 0]
+        self.labelArray = elemIDChars[:, :, 1]
 
+    def _make_index(self) :
+        '''\
+        Indexes of the board, made in one pass :
+            occupiedPos : positions that have an element, row by row.
+            namePos     : element ID -> its first position.
+            codePos     : element code -> positions of elements with the code, row by row.
+        Unnumbered wires have no element ID and are not in namePos and codePos.'''
+        occupiedI, occupiedJ = np.nonzero(self.haveElemBoolArray)
+        self.occupiedPos = list(zip(occupiedI.tolist(), occupiedJ.tolist()))
+        self.namePos = {}
+        self.codePos = {}
+        for pos, elemID in zip(self.occupiedPos, self.Ai[occupiedI, occupiedJ].tolist()) :
+            if elemID in ('..', ',,') : continue
+            self.namePos.setdefault(elemID, pos)
+            self.codePos.setdefault(elemID[0], []).append(pos)
     def _make_objRef(self) :
         self.objRef = {}
-        def make_containerObjRef(elemCode, refs) :
-            if len(refs) < 2 : return 
-            refs = sorted(refs, key = lambda x : x[1])
-            self.objRef[elemCode] = Container([self.objRef[ref] for ref in refs])
-        RRefs = []
-        LRefs = []
-        CRefs = []
-        IRefs = []
-        iRefs = []
-        VRefs = []
-        vRefs = []
-        mRefs = []
-        nRefs = []
-        ARefs = []
-        wRefs = []
-        bRefs = []
-        gRefs = []
-        for i in range(self.Nv):
-            for j in range(self.Nh) :
-                if self.Ai[i, j] not in ('  ', '..', ',,') :
-                    if self.Ai[i, j][0] == 'R' : RRefs.append(self.Ai[i, j])
-                    if self.Ai[i, j][0] == 'L' : LRefs.append(self.Ai[i, j])
-                    if self.Ai[i, j][0] == 'C' : CRefs.append(self.Ai[i, j])
-                    if self.Ai[i, j][0] == 'I' : IRefs.append(self.Ai[i, j])
-                    if self.Ai[i, j][0] == 'i' : iRefs.append(self.Ai[i, j]) 
-                    if self.Ai[i, j][0] == 'V' : VRefs.append(self.Ai[i, j]) 
-                    if self.Ai[i, j][0] == 'v' : vRefs.append(self.Ai[i, j]) 
-                    if self.Ai[i, j][0] == 'm' : mRefs.append(self.Ai[i, j]) 
-                    if self.Ai[i, j][0] == 'n' : nRefs.append(self.Ai[i, j]) 
-                    if self.Ai[i, j][0] == 'A' : ARefs.append(self.Ai[i, j]) 
-                    if self.Ai[i, j][0] == 'w' : wRefs.append(self.Ai[i, j]) 
-                    if self.Ai[i, j][0] == 'b' : bRefs.append(self.Ai[i, j]) 
-                    if self.Ai[i, j][0] == 'g' : gRefs.append(self.Ai[i, j]) 
-                    self.objRef[self.Ai[i, j]] = self.Ae[i, j]
-        make_containerObjRef('R', RRefs)
-        make_containerObjRef('L', LRefs)
-        make_containerObjRef('C', CRefs)
-        make_containerObjRef('I', IRefs)
-        make_containerObjRef('i', iRefs)
-        make_containerObjRef('V', VRefs)
-        make_containerObjRef('v', vRefs)
-        make_containerObjRef('m', mRefs)
-        make_containerObjRef('n', nRefs)
-        make_containerObjRef('A', ARefs)
-        make_containerObjRef('w', wRefs)
-        make_containerObjRef('b', bRefs)
-        make_containerObjRef('g', gRefs)
+        for positions in self.codePos.values() :
+            for pos in positions : self.objRef[str(self.Ai[pos])] = self.Ae[pos]
+        for elemCode in self._containerCodes : self._make_containerRef(elemCode)
+    def _make_containerRef(self, elemCode) :
+        refs = [str(self.Ai[pos]) for pos in self.codePos.get(elemCode, ())]
+        if len(refs) < 2 :
+            self.objRef.pop(elemCode, None)
+            return
+        refs = sorted(refs, key = lambda x : x[1])
+        self.objRef[elemCode] = Container([self.objRef[ref] for ref in refs])
+    def _update_index(self, pos, oldID, newID) :
+        '''Update occupiedPos and codePos after the element ID at pos is changed.'''
+        if oldID == '  ' :   bisect.insort(self.occupiedPos, pos)
+        elif newID == '  ' : del self.occupiedPos[bisect.bisect_left(self.occupiedPos, pos)]
+        if oldID not in ('  ', '..', ',,') :
+            positions = self.codePos[oldID[0]]
+            del positions[bisect.bisect_left(positions, pos)]
+            if not positions : del self.codePos[oldID[0]]
+        if newID not in ('  ', '..', ',,') :
+            bisect.insort(self.codePos.setdefault(newID[0], []), pos)
+    def _update_names(self, names) :
+        '''Make namePos and objRef of element IDs in names and containers of them again.'''
+        for name in names :
+            positions = [pos for pos in self.codePos.get(name[0], ()) if self.Ai[pos] == name]
+            if positions :
+                self.namePos[name] = positions[0]
+                # the last one is referred, same as _make_objRef
+                self.objRef[name] = self.Ae[positions[-1]]
+            else :
+                self.namePos.pop(name, None)
+                self.objRef.pop(name, None)
+        for elemCode in {name[0] for name in names} :
+            if elemCode in self._containerCodes : self._make_containerRef(elemCode)
 
     def find_elemPos(self, objectName) :
-        for i in range(self.Nv):
-            for j in range(self.Nh) :
-                if self.Ai[i, j] == objectName : return i, j
+        return self.namePos.get(objectName)
 
+    def cut_connections(self, pairs) :
+        '''\
+        Cut connections between pairs of neighbouring positions, pairs is
+        [((i, j), (i', j'))]. Anchors and nodes are made again.'''
+        for (i, j), (ni, nj) in pairs :
+            bit = connectMove.index((ni - i, nj - j))
+            self.connectArray[i, j]   &= 0xff ^ (1 << bit)
+            self.connectArray[ni, nj] &= 0xff ^ (1 << (bit + 4) % 8)
+        self.make_anchorAndNode()
+    def make_anchorAndNode(self) :
+        '''Locate anchors and nodes again, e.g. after setters that change connections are called.'''
+        self._autoFormate(setAnchorAndNodeOnly = True, autoNode = self.autoNode)
+
+    # setting -> (setter, class of elements or containers that have the setting)
     _settingMethod = {
-        'value'      : Element.set_value,
-        'values'     : Container.set_values,
-        'direction'  : PrimaryElement.set_direction,
-        'directions' : Container.set_directions,
-        'pm'         : Element.set_pm,
-        'shape'      : Arrow.set_shape,
-        'fill'       : Node.set_fill,
-        'fills'      : Container.set_fills,
-        'ground'     : Wire.set_ground,
-        'valuePos'   : PosAdjustable.set_valuePos,
-        'valuePoss'  : Container.set_valuePoss,
-        'pmPos'      : PosAdjustable.set_pmPos,
-        'move'       : PosAdjustable.set_move,
-        'valueMove'  : PosAdjustable.set_valueMove,
-        'allValueMove' : Container.set_allValueMove,
-        'pmMove'     : PosAdjustable.set_pmMove,
-        'pmSep'      : PosAdjustable.set_pmSep,
+        'value'      : (Element.set_value,              Element),
+        'values'     : (Container.set_values,           Container),
+        # grounds are drawn by direction too
+        'direction'  : (PrimaryElement.set_direction,   Element),
+        'directions' : (Container.set_directions,       Container),
+        'pm'         : (Element.set_pm,                 Element),
+        'shape'      : (Arrow.set_shape,                Arrow),
+        'fill'       : (Node.set_fill,                  Node),
+        'fills'      : (Container.set_fills,            Container),
+        'ground'     : (Wire.set_ground,                Wire),
+        'valuePos'   : (PosAdjustable.set_valuePos,     PosAdjustable),
+        'valuePoss'  : (Container.set_valuePoss,        Container),
+        'pmPos'      : (PosAdjustable.set_pmPos,        PosAdjustable),
+        'move'       : (PosAdjustable.set_move,         PosAdjustable),
+        'valueMove'  : (PosAdjustable.set_valueMove,    PosAdjustable),
+        'allValueMove' : (Container.set_allValueMove,   Container),
+        'pmMove'     : (PosAdjustable.set_pmMove,       PosAdjustable),
+        'pmSep'      : (PosAdjustable.set_pmSep,        PosAdjustable),
     }
-    def _apply_setting(self) :
-        commands = decode(self.settingSheetStr)
-        if commands == None : return
+    def compile_setting(self, settingSheetStr) :
+        '''\
+        Resolve every command of a setting sheet against the elements and containers
+        of the board. Return calls and errors :
+            call  : (line, column, setter, arguments), setter is bound to its element.
+            error : (line, column, message).'''
+        commands, errors = tokenize_setting(settingSheetStr)
+        calls = []
         for command in commands :
-            objName = command[0]
-            setting = command[1]
-            arguments = command[2]
-            try :
-                method = self._settingMethod[setting]
-            except KeyError :
-                raise KeyError(f'{setting} is not an available setting.') from None
+            call, commandErrors = self._compile_command(command)
+            errors += commandErrors
+            if call is not None : calls.append(call)
+        return calls, errors
+    def _compile_command(self, command) :
+        '''Resolve a command of tokenize_setting, return (call or None, errors).'''
+        lineNo, objName, setting, arguments, columns = command
+        errors = []
+        method, settingClass = self._settingMethod.get(setting, (None, None))
+        target = self.objRef.get(objName)
+        if settingClass is None :
+            errors.append((lineNo, columns[1], f'{setting} is not an available setting.'))
+        if target is None :
+            errors.append((lineNo, columns[0], f'element or container {objName} does not exist.'))
+        if settingClass is None or target is None : return None, errors
+        if not isinstance(target, settingClass) :
+            errors.append((lineNo, columns[1], f'{objName} have no setting about {setting}'))
+            return None, errors
+        setter = types.MethodType(method, target)
+        try :
+            inspect.signature(setter).bind(*arguments)
+        except TypeError :
+            parameters = inspect.signature(setter).parameters
+            errors.append((lineNo, columns[1], f'{setting} takes {len(parameters)} arguments, '
+                                               f'got {len(arguments)}'))
+            return None, errors
+        return (lineNo, (columns[2:] or columns[1:])[0], setter, arguments), errors
+    def _apply_setting(self) :
+        self._tokenize_sheet()
+        errors = self._sheetErrors + self._run_commands(range(len(self._commands)))
+        report_errors('setting sheet is malformed', errors)
+    def apply_setting(self, settingSheetStr) :
+        '''\
+        Apply a setting sheet. Settings that change connections (direction, shape...)
+        are only valid while constructing the board. Every valid command is applied,
+        then ValueError that lists every error with line and column is raised.'''
+        report_errors('setting sheet is malformed', self._run_setting(settingSheetStr))
+    def _run_setting(self, settingSheetStr) :
+        '''Apply every valid command of a setting sheet, return errors.'''
+        calls, errors = self.compile_setting(settingSheetStr)
+        for lineNo, column, setter, arguments in calls :
             try :
-                method(self.objRef[objName], *arguments)
-            except KeyError :
-                raise KeyError(f'element or container {objName} does not exist.') from None
-            except AttributeError :
-                raise AttributeError(f'{objName} have no setting about {setting}') from None
+                setter(*arguments)
+            except (ValueError, IndexError) as error :
+                errors.append((lineNo, column, str(error)))
+        return errors
+
+    # Commands of the setting sheet are recorded : positions each command sets (targets)
+    # and directions it sets. Editing only runs commands again that set edited cells or
+    # refer to elements changed, see _affected_commands. _commands is None for boards
+    # made by from_state until they are edited.
+    _commands = None
+    def _tokenize_sheet(self) :
+        self._commands, self._sheetErrors = tokenize_setting(self.settingSheetStr)
+        self._commandTargets    = [()] * len(self._commands)
+        self._commandDirections = [()] * len(self._commands)
+        self._posCommands  = {}
+        self._nameCommands = {}
+        for k, (_, objName, setting, arguments, _) in enumerate(self._commands) :
+            self._nameCommands.setdefault(objName, []).append(k)
+        self._pmCommands = [(k, arguments[1]) for k, (_, _, setting, arguments, _) in enumerate(self._commands)
+                            if setting == 'pm' and len(arguments) == 3]
+    def _record_commands(self) :
+        '''Record commands of the setting sheet, settings of the board are kept.'''
+        elemSettings, directionSettings = self.elemSettings, self.directionSettings
+        self.elemSettings, self.directionSettings = {}, []
+        self._tokenize_sheet()
+        self._isEditing = True
+        try :
+            self._run_commands(range(len(self._commands)))
+        finally :
+            self._isEditing = False
+            self.elemSettings, self.directionSettings = elemSettings, directionSettings
+    def _set_commandTargets(self, k, targets) :
+        for pos in self._commandTargets[k] :
+            commands = self._posCommands[pos]
+            commands.discard(k)
+            if not commands : del self._posCommands[pos]
+        self._commandTargets[k] = targets
+        for pos in targets : self._posCommands.setdefault(pos, set()).add(k)
+    @staticmethod
+    def _targetPositions(target) :
+        if target is None : return ()
+        # a container may refer to an element twice if element IDs are repeated
+        if isinstance(target, Container) : return tuple({(elem.i, elem.j) : None for elem in target.storage})
+        return ((target.i, target.j),)
+    def _run_commands(self, commands) :
+        '''Apply commands of the setting sheet in order and record them, return errors.'''
+        errors = []
+        for k in sorted(commands) :
+            call, commandErrors = self._compile_command(self._commands[k])
+            targets, directions = (), ()
+            if call is not None :
+                lineNo, column, setter, arguments = call
+                start = len(self.directionSettings)
+                try :
+                    setter(*arguments)
+                except (ValueError, IndexError) as error :
+                    commandErrors.append((lineNo, column, str(error)))
+                targets = self._targetPositions(setter.__self__)
+                directions = tuple(self.directionSettings[start:])
+            errors += commandErrors
+            self._set_commandTargets(k, targets)
+            self._commandDirections[k] = directions
+        return errors
+    def _affected_commands(self, edited, names) :
+        '''\
+        Return commands to apply again after cells in edited are changed and elements in
+        names are added, removed or moved, and every position they set. They are commands
+        that set edited cells, refer to names or their containers, and commands that set
+        cells those commands set before or set now.'''
+        pending = set()
+        for name in set(names) | {name[0] for name in names} :
+            pending.update(self._nameCommands.get(name, ()))
+        positions = set(edited)
+        for pos in edited : pending.update(self._posCommands.get(pos, ()))
+        commands = set()
+        while pending :
+            commands |= pending
+            newPositions = set()
+            for k in pending :
+                newPositions.update(self._commandTargets[k])
+                newPositions.update(self._targetPositions(self.objRef.get(self._commands[k][1])))
+            newPositions -= positions
+            positions |= newPositions
+            pending = {k for pos in newPositions for k in self._posCommands.get(pos, ())} - commands
+        return commands, positions
 
     def __init__(self, circuitCodeStr, settingSheetStr, autoNode = True) :
-        self.circuitCodeStr = circuitCodeStr
+        self._circuitCodeStr = circuitCodeStr
+        self.autoNode = autoNode
         self.elemIDArray = make_elemIDArray(circuitCodeStr)
-        self.elemArray = make_elemArray(self, self.elemIDArray)
         self._prepare_kitForSetting()
+        self._make_index()
         self.settingSheetStr = settingSheetStr
         self._make_objRef()
         self._autoFormate(autoNode = autoNode)
         self._apply_setting()
         self._autoFormate(setAnchorAndNodeOnly=True, autoNode = autoNode)
+        # drawing objects made by convert.make_drawingObjs, they are independent of
+        # scale. Set it to None after modifying the board without editing methods.
+        self.drawingObjs = None
+        # positions edited and rows or columns moved since drawing objects are made.
+        self.dirtyPos = set()
+        self.shifts = []
+
+    @property
+    def circuitCodeStr(self) :
+        '''Circuit string of the board, it is made from elemIDArray after editing.'''
+        if self._circuitCodeStr is None :
+            rows = (' '.join(row).rstrip() for row in self.Ai.tolist())
+            self._circuitCodeStr = '\n'.join(rows) + '\n#'
+        return self._circuitCodeStr
+
+    # State : the arrays and settings a board is made of, without views, indexes and
+    # elements that are made from them. It is plain data (numpy arrays, strings,
+    # tuples) thus can be stored compactly without pickling, see cache.
+    _stateArrays = ('elemIDArray', 'connectArray', 'directionArray', 'isPosAnchorArray', 'isNodeArray')
+    def to_state(self) :
+        '''Return the state of the board, see from_state.'''
+        state = {name : getattr(self, name) for name in self._stateArrays}
+        state.update(circuitCodeStr = self.circuitCodeStr, settingSheetStr = self.settingSheetStr,
+                     autoNode = self.autoNode, elemSettings = self.elemSettings,
+                     directionSettings = self.directionSettings)
+        return state
+    @classmethod
+    def from_state(cls, state) :
+        '''Make a board from its state without constructing it again.'''
+        board = cls.__new__(cls)
+        for name in cls._stateArrays : setattr(board, name, state[name])
+        board._circuitCodeStr    = state['circuitCodeStr']
+        board.settingSheetStr    = state['settingSheetStr']
+        board.autoNode           = state['autoNode']
+        board.elemSettings       = state['elemSettings']
+        board.directionSettings  = state['directionSettings']
+        board._make_views()
+        board._make_index()
+        board._make_objRef()
+        board.drawingObjs = None
+        board.dirtyPos    = set()
+        board.shifts      = []
+        return board
 
-def to_txt(circuitBoard, filename, * ,autoNode = True, blockWidth = 6) :
-    '''Store circuit code string and setting sheet in an txt file.'''
+    # Editing : 
+    #   Cells, the setting sheet, rows and columns of a board can be edited. Commands of
+    #   the setting sheet affected are applied again after each edit, connections, anchors
+    #   and nodes are made again only around cells edited, see _edit. If the setting sheet
+    #   fails after an edit, the edit is undone and ValueError is raised. Positions changed are marked in dirtyPos,
+    #   convert.update_drawingCache only makes drawing objects of them again.
+    def set_cell(self, i, j, elemID) :
+        '''Set element ID of cell (i, j), '  ' removes the element.'''
+        self.set_cells({(i, j) : elemID})
+    def set_cells(self, cells) :
+        '''Set element IDs of cells, cells is {(i, j) : elemID}.'''
+        for (i, j), elemID in cells.items() :
+            if not (0 <= i < self.Nv and 0 <= j < self.Nh) :
+                raise IndexError(f'({i}, {j}) is out of the board of size {self.Nv}x{self.Nh}')
+            _check_elemID(elemID)
+        edited = {(i, j) : elemID for (i, j), elemID in cells.items() if self.Ai[i, j] != elemID}
+        if not edited : return
+        if self._commands is None : self._record_commands()
+        oldIDs = {pos : str(self.Ai[pos]) for pos in edited}
+        names = self._replace_cells(edited)
+        try :
+            self._edit(set(edited), renamed = names)
+        except ValueError :
+            self._replace_cells(oldIDs)
+            raise
+    def _replace_cells(self, cells) :
+        '''Write element IDs of cells and update indexes, return names changed.'''
+        names = set()
+        for pos, elemID in cells.items() :
+            oldID = str(self.Ai[pos])
+            self.Ai[pos] = elemID
+            self.haveElemBoolArray[pos] = elemID != '  '
+            self.haveDiagOnlyElemBoolArray[pos] = elemID == ',,'
+            self._update_index(pos, oldID, elemID)
+            names |= {name for name in (oldID, elemID) if name not in ('  ', '..', ',,')}
+        self._update_names(names)
+        self._circuitCodeStr = None
+        return names
+    def set_settingSheet(self, settingSheetStr) :
+        '''\
+        Replace the setting sheet. Settings applied by apply_setting are replaced as well,
+        only elements whose settings are changed are updated. If the sheet has errors, the
+        board is not changed.'''
+        if self._commands is None : self._record_commands()
+        recordNames = ('settingSheetStr', '_commands', '_sheetErrors', '_commandTargets',
+                       '_commandDirections', '_posCommands', '_nameCommands', '_pmCommands')
+        records = [getattr(self, name) for name in recordNames]
+        self.settingSheetStr = settingSheetStr
+        self._tokenize_sheet()
+        try :
+            self._edit(set(), everyCommand = True)
+        except ValueError :
+            for name, record in zip(recordNames, records) : setattr(self, name, record)
+            raise
+    def insert_row(self, i) :    self._shift(0, i, 1)
+    def delete_row(self, i) :    self._shift(0, i, -1)
+    def insert_column(self, j) : self._shift(1, j, 1)
+    def delete_column(self, j) : self._shift(1, j, -1)
+    def _shift(self, axis, index, count) :
+        '''\
+        Insert (count > 0) or delete (count < 0) rows (axis 0) or columns (axis 1) at index.
+        Every position after index is moved, thus arrays and indexes are made again. Cells
+        next to index are edited, connections, anchors and nodes are made again around
+        them, commands that set them or refer to elements deleted are applied again. If
+        the setting sheet fails, the board is restored.'''
+        size = self.Ai.shape[axis]
+        if not 0 <= index <= (size if count > 0 else size + count) :
+            raise IndexError(f'{index} is out of the board of size {self.Nv}x{self.Nh}')
+        if self._commands is None : self._record_commands()
+        # positions from end are moved, positions deleted are in index ~ end-1
+        end = index if count > 0 else index - count
+        deletedCells = self.Ai[index:end] if axis == 0 else self.Ai[:, index:end]
+        deleted = {str(elemID) for elemID in np.unique(deletedCells)} - {'  ', '..', ',,'}
+        def moved(pos) :
+            if pos[axis] < index : return pos
+            if pos[axis] < end : return None
+            return (pos[0] + count, pos[1]) if axis == 0 else (pos[0], pos[1] + count)
+        if count > 0 :
+            def shifted(array, value) : return np.insert(array, [index] * count, value, axis = axis)
+        else :
+            def shifted(array, value) : return np.delete(array, np.s_[index:end], axis = axis)
+        # shifting makes new arrays and indexes, old ones are kept to undo it.
+        shiftedNames = ('elemIDArray', 'connectArray', 'directionArray', 'isPosAnchorArray', 'isNodeArray',
+                        'elemSettings', 'directionSettings', '_commandTargets', '_commandDirections',
+                        '_posCommands', '_circuitCodeStr', 'dirtyPos', 'shifts')
+        unshifted = [getattr(self, name) for name in shiftedNames]
+        self.elemIDArray      = shifted(self.Ai, '  ')
+        self.connectArray     = shifted(self.connectArray, 0)
+        self.directionArray   = shifted(self.directionArray, 'U')
+        self.isPosAnchorArray = shifted(self.isPosAnchorArray, False)
+        self.isNodeArray      = shifted(self.isNodeArray, False)
+        self.elemSettings = {moved(pos) : settings for pos, settings in self.elemSettings.items()
+                             if moved(pos) is not None}
+        self.directionSettings = [(moved(pos), direction) for pos, direction in self.directionSettings
+                                  if moved(pos) is not None]
+        self._commandTargets = [tuple(moved(pos) for pos in targets if moved(pos) is not None)
+                                for targets in self._commandTargets]
+        self._commandDirections = [tuple((moved(pos), direction) for pos, direction in directions
+                                         if moved(pos) is not None) for directions in self._commandDirections]
+        self._posCommands = {}
+        for k, targets in enumerate(self._commandTargets) :
+            for pos in targets : self._posCommands.setdefault(pos, set()).add(k)
+        self._make_views()
+        self._make_index()
+        self._make_objRef()
+        self._circuitCodeStr = None
+        if self.drawingObjs is not None :
+            self.dirtyPos = {moved(pos) for pos in self.dirtyPos if moved(pos) is not None}
+            self.shifts = self.shifts + [(axis, index, count)]
+        # cells next to inserted or deleted cells
+        seam = [k for k in (index - 1, index + max(count, 0)) if 0 <= k < self.Ai.shape[axis]]
+        if axis == 0 : edited = {(i, j) for i in seam for j in range(self.Nh)}
+        else :         edited = {(i, j) for j in seam for i in range(self.Nv)}
+        try :
+            self._edit(edited, renamed = deleted, pmMoved = True)
+        except ValueError :
+            for name, value in zip(shiftedNames, unshifted) : setattr(self, name, value)
+            self._make_views()
+            self._make_index()
+            self._make_objRef()
+            raise
+    def _edit(self, edited, renamed = (), everyCommand = False, pmMoved = False) :
+        '''\
+        Update the board after cells in edited are changed. renamed are element IDs whose
+        positions are changed. Commands of the setting sheet affected are applied again
+        (every command if everyCommand), directions are recorded instead of being formated.
+        If any command fails, settings are restored and ValueError is raised before the
+        board is formated. Connections, anchors and nodes are made again around edited
+        cells and elements whose direction or shape setting is changed. pm refers to
+        renamed are made again (every pm if pmMoved).'''
+        if everyCommand :
+            commands, positions = range(len(self._commands)), None
+            oldSettings, self.elemSettings = self.elemSettings, {}
+        else :
+            commands, positions = self._affected_commands(edited, renamed)
+            oldSettings = {pos : self.elemSettings.pop(pos) for pos in positions if pos in self.elemSettings}
+        oldRecords = {k : (self._commandTargets[k], self._commandDirections[k]) for k in commands}
+        oldDirections, self.directionSettings = self.directionSettings, []
+        self._isEditing = True
+        try :
+            errors = self._run_commands(commands)
+        finally :
+            self._isEditing = False
+        if everyCommand : errors = self._sheetErrors + errors
+        if errors :
+            if positions is None : self.elemSettings = oldSettings
+            else :
+                for pos in positions : self.elemSettings.pop(pos, None)
+                self.elemSettings.update(oldSettings)
+            for k, (targets, directions) in oldRecords.items() :
+                self._set_commandTargets(k, targets)
+                self._commandDirections[k] = directions
+            self.directionSettings = oldDirections
+            report_errors('setting sheet is malformed', errors)
+        self.directionSettings = [direction for directions in self._commandDirections for direction in directions]
+        noSetting = {}
+        checked = oldSettings.keys() | self.elemSettings.keys() if positions is None else positions
+        settingChanged = {pos for pos in checked
+                          if oldSettings.get(pos, noSetting) != self.elemSettings.get(pos, noSetting)}
+        formatePos = set(edited)
+        formatePos |= {pos for pos in settingChanged if oldSettings.get(pos, noSetting).get('shape')
+                                                     != self.elemSettings.get(pos, noSetting).get('shape')}
+        # directions are formated in order, formate again from the first one changed.
+        directions = itertools.zip_longest(oldDirections, self.directionSettings)
+        for n, (oldDirection, newDirection) in enumerate(directions) :
+            if oldDirection != newDirection :
+                formatePos |= {pos for pos, _ in oldDirections[n:] + self.directionSettings[n:]}
+                break
+        changed = set()
+        for box in self._make_formateBoxes(formatePos) : changed |= self._formate_box(*box)
+        if self.drawingObjs is not None :
+            self.dirtyPos |= set(edited) | settingChanged | changed
+            for k, destination in self._pmCommands :
+                if pmMoved or destination in renamed : self.dirtyPos.update(self._commandTargets[k])
+    def _make_formateBoxes(self, positions) :
+        '''\
+        Return boxes (i0, i1, j0, j1) that cover cells editRadius away from positions, the
+        bounding box is used if it is smaller than boxes of every position.'''
+        r = self.editRadius
+        boxes = [(i - r, i + r + 1, j - r, j + r + 1) for i, j in positions]
+        if len(boxes) < 2 : return boxes
+        i0, i1 = min(box[0] for box in boxes), max(box[1] for box in boxes)
+        j0, j1 = min(box[2] for box in boxes), max(box[3] for box in boxes)
+        if (i1 - i0) * (j1 - j0) <= len(boxes) * (2*r + 1) ** 2 : return [(i0, i1, j0, j1)]
+        return boxes
+    def _formate_box(self, i0, i1, j0, j1) :
+        '''\
+        Make connections, anchors and nodes of cells in rows i0 ~ i1-1 and columns j0 ~ j1-1
+        again. They are made on a sub board with editRadius more cells at each side, the
+        same way as constructing, thus they are the same as formating the whole board.
+        Return positions that are changed.'''
+        r = self.editRadius
+        i0, i1, j0, j1 = max(i0, 0), min(i1, self.Nv), max(j0, 0), min(j1, self.Nh)
+        if i0 >= i1 or j0 >= j1 : return set()
+        a0, a1, b0, b1 = max(i0 - r, 0), min(i1 + r, self.Nv), max(j0 - r, 0), min(j1 + r, self.Nh)
+        sub = CircuitBoard.__new__(CircuitBoard)
+        sub.elemIDArray = self.Ai[a0:a1, b0:b1].copy()
+        sub._prepare_kitForSetting()
+        sub.elemSettings = {(i - a0, j - b0) : settings for (i, j), settings in self.elemSettings.items()
+                            if a0 <= i < a1 and b0 <= j < b1}
+        sub._autoFormate(autoNode = self.autoNode)
+        for (i, j), direction in self.directionSettings :
+            if a0 <= i < a1 and b0 <= j < b1 : sub._directionFormate(i - a0, j - b0, direction)
+        sub._autoFormate(setAnchorAndNodeOnly = True, autoNode = self.autoNode)
+        box, subBox = np.s_[i0:i1, j0:j1], np.s_[i0-a0 : i1-a0, j0-b0 : j1-b0]
+        changed = np.zeros([i1 - i0, j1 - j0], dtype = bool)
+        for arrayName in ('connectArray', 'directionArray', 'isPosAnchorArray', 'isNodeArray') :
+            array, subArray = getattr(self, arrayName), getattr(sub, arrayName)
+            changed |= array[box] != subArray[subBox]
+            array[box] = subArray[subBox]
+        changedI, changedJ = np.nonzero(changed)
+        return set(zip((changedI + i0).tolist(), (changedJ + j0).tolist()))
+
+def to_txt(circuitBoard, filename, * ,autoNode = True, blockWidth = 6, blocks = None) :
+    '''\
+    Store circuit code string, setting sheet and blocks in an txt file. circuitBoard is
+    a CircuitBoard or a subcircuit.SubCircuit, blocks of a SubCircuit are its own.'''
+    blocks = getattr(circuitBoard, 'blocks', blocks)
+    _, check, expected = txtVariables['blocks']
+    if not check(blocks) : raise ValueError(f'blocks must be {expected}, got {blocks!r}')
+    def literal(s) :
+        # the line break after the opening quotes is escaped, thus lines are as they are.
+        return "'''\\\n" + s.replace('\\', '\\\\').replace("'", "\\'") + "'''"
     circuitTxt = open(filename, 'w')
-    circuitTxt.write("circuit = '''\\\n")
-    circuitTxt.write(circuitBoard.circuitCodeStr.replace('\\', '\\\\'))
-    circuitTxt.write("'''\nsetting = '''\\\n")
-    circuitTxt.write(circuitBoard.settingSheetStr.replace('\\', '\\\\'))
-    circuitTxt.write("'''\n")
+    circuitTxt.write("circuit = " + literal(circuitBoard.circuitCodeStr))
+    circuitTxt.write("\nsetting = " + literal(circuitBoard.settingSheetStr))
+    circuitTxt.write("\n")
     circuitTxt.write("autoNode = ")
     circuitTxt.write(str(autoNode))
     circuitTxt.write("\nblockWidth = ")
     circuitTxt.write(str(blockWidth))
-    circuitTxt.close()
\ No newline at end of file
+    if blocks :
+        circuitTxt.write("\nblocks = {\n")
+        for name, (blockCircuit, blockSetting) in blocks.items() :
+            circuitTxt.write(f"{name!r} : ({literal(blockCircuit)}, {literal(blockSetting)}),\n")
+        circuitTxt.write("}")
+    circuitTxt.close()
+
+# Variables of a txt file -> (default, check of the value, what the value must be).
+# Files are only assignments of literals to these variables, they are parsed and
+# never run, thus any file can be loaded safely.
+txtVariables = {
+    'circuit'    : (None,  lambda v : isinstance(v, str), 'a string'),
+    'setting'    : ('',    lambda v : isinstance(v, str), 'a string'),
+    'autoNode'   : (True,  lambda v : isinstance(v, bool), 'True or False'),
+    'blockWidth' : (6,     lambda v : isinstance(v, (int, float)) and not isinstance(v, bool) and v > 0,
+                           'a positive number'),
+    'blocks'     : (None,  lambda v : v is None or (isinstance(v, dict) and all(
+                           isinstance(name, str) and isinstance(block, (tuple, list)) and len(block) == 2
+                           and all(isinstance(s, str) for s in block) for name, block in v.items())),
+                           'a dict of name : (circuit, setting)'),
+}
+def load_txt(contents) :
+    '''\
+    Return variables of the content of a txt file (see to_txt) as a dict, variables
+    not given take defaults of txtVariables. Raise ValueError that lists every error.'''
+    try :
+        module = ast.parse(contents)
+    except SyntaxError as error :
+        report_errors('txt file is malformed', [((error.lineno or 1) - 1, max((error.offset or 1) - 1, 0),
+                                                 f'invalid syntax, {error.msg}')])
+    except (RecursionError, MemoryError, ValueError) :
+        report_errors('txt file is malformed', [(0, 0, 'file is too complex to parse')])
+    variables, given, errors = {}, set(), []
+    for statement in module.body :
+        line, column = statement.lineno - 1, statement.col_offset
+        # a string alone is a comment
+        if isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant) \
+           and isinstance(statement.value.value, str) : continue
+        if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)) :
+            errors.append((line, column, 'only assignments like name = value are allowed'))
+            continue
+        name = statement.targets[0].id
+        if name not in txtVariables :
+            errors.append((line, column, f'{name} is not a variable, '
+                                         f'available : {", ".join(txtVariables)}'))
+            continue
+        given.add(name)
+        valueNode = statement.value
+        try :
+            value = ast.literal_eval(valueNode)
+        except (ValueError, TypeError, SyntaxError, RecursionError, MemoryError) :
+            errors.append((valueNode.lineno - 1, valueNode.col_offset, f'value of {name} must be a literal'))
+            continue
+        _, check, expected = txtVariables[name]
+        if not check(value) :
+            errors.append((valueNode.lineno - 1, valueNode.col_offset, f'{name} must be {expected}, got {value!r}'))
+            continue
+        variables[name] = value
+    if 'circuit' not in given :
+        errors.append((0, 0, 'circuit is not given'))
+    report_errors('txt file is malformed', errors)
+    for name, (default, _, _) in txtVariables.items() :
+        variables.setdefault(name, default)
+    return variables
+def from_txt(filename) :
+    '''Load variables of a txt file written by to_txt or by hand, see load_txt.'''
+    with open(filename, 'r') as circuitTxt :
+        return load_txt(circuitTxt.read())
+
+def make_inputHash(circuitCodeStr, settingSheetStr, * ,autoNode = True, blockWidth = 6,
+                   blocks = None) :
+    '''Return a hash of the input that is stable across runs, processes and machines.\
+       Line endings are normalized before hashing. blocks are sub-circuits, see subcircuit.'''
+    def normalize(s) :
+        return s.replace('\r\n', '\n')
+    content = '\0'.join((normalize(circuitCodeStr), normalize(settingSheetStr),
+                         str(bool(autoNode)), repr(float(blockWidth))))
+    for name in sorted(blocks or ()) :
+        content += '\0'.join(('', name, *map(normalize, blocks[name])))
+    return hashlib.sha256(content.encode('utf8')).hexdigest()
\ No newline at end of file
@@ -10,6 +10,9 @@
 #     Centered Drawing SVG code :
 #     >> SVG code = 'e', elemCode, x, y, pmove, vmove, direction
 #     >> SVG code = 't',     text, x, y, pmove, vmove, direction
+#     >> SVG code = 't',     text, x, y, pmove, vmove, direction, group (labelGroups)
+#     group : texts of one label share a group, they are moved together by
+#             automatic label placement. It is None for labels positioned by user.
 #     Path Drawing SVG Objects :
 #     >> SVG code = 'w', elemCode, strx, stry, endx, endy
 #     pmove, vmove : 
@@ -23,18 +26,34 @@
 #         N : hollow node
 #         a : arrow with shape 'end' (----->) 
 #         g : ground
+import bisect
+from collections import OrderedDict
 import numpy as np
 import re
+from typing import NamedTuple
+class ConvertContext(NamedTuple) :
+    '''Parameters of a conversion. It is immutable and passed to every make_* function,\
+       conversions with different parameters never interfere with each other.'''
+    blockWidth     : float = 6.
+    remove_anchors : bool  = False
+    labelGroups    : bool  = False
+def make_convertContext(* ,remove_anchors = False, blockWidth = 6, labelGroups = False) :
+    try :
+        float(blockWidth)
+    except ValueError :
+        raise ValueError(f'{blockWidth} is not a numerical value') from None
+    if blockWidth < 2 or blockWidth > 14 :
+        raise ValueError('block width must in between 2~14')
+    return ConvertContext(float(blockWidth), bool(remove_anchors), bool(labelGroups))
 # Coordinate :
 # -------------------> (+x, +j)
 # |          .
 # |          .
 # |. . . . . o (x, y) 
-# |            = blockWidth_*(j, i)
+# |            = ctx.blockWidth*(j, i)
 # v (+y, +i)
-blockWidth_ = 6
-def ij2xy(i, j) :
-    return j * blockWidth_, i * blockWidth_
+def ij2xy(i, j, ctx) :
+    return j * ctx.blockWidth, i * ctx.blockWidth
 # Direction :
 #  3  2  1
 #   \ | /
@@ -57,45 +76,38 @@ svgDirc = {
 #    (offset)^     ^(offset)  
 primElemWidth = 8
 
+# Offsets are shared tables, one for each shape of the region an object occupies.
+def _make_offsetTable(l, diag) :
+    return (( l,     0   ), ( diag, -diag), ( 0,    -l   ), (-diag, -diag),
+            (-l,     0   ), (-diag,  diag), ( 0,     l   ), ( diag,  diag))
+# hollow node occupies the region of a circle.
+circleOffset = _make_offsetTable(primElemWidth/8, primElemWidth/8/np.sqrt(2))
+# primary elements occupy the region of a squre.
+squareOffset = _make_offsetTable(primElemWidth/2, primElemWidth/2)
+# wires connet to the center of other objects.
+zeroOffset   = ((0, 0),) * 8
+def get_offsetTable(elemCode) :
+    if elemCode == 'N' : return circleOffset
+    if elemCode in ('n', 'anchor', 'A', 'm', 'g', 'O') : return zeroOffset
+    if elemCode in 'RLCVvIiab' or elemCode == 'empty' : return squareOffset
+    return zeroOffset
+
 class CenteredDrawingObj :
-    '''primary elements are draw by a given direction and center position.'''
-    def __init__(self, elemObj) :
-        self.elemCode = elemObj.elemCode
+    '''primary elements are draw by a given direction and center position.\
+       elemCode is the element code in protocol, the element is never modified.'''
+    __slots__ = ('elemCode', 'i', 'j', 'move', 'svgDirc', 'offset')
+    def __init__(self, elemObj, elemCode) :
+        self.elemCode = elemCode
         self.i        = elemObj.i
         self.j        = elemObj.j
         self.move     = elemObj.move
         self.svgDirc  = svgDirc[elemObj.direction] \
                       if hasattr(elemObj, 'direction') else 0
-        self.offset   = np.zeros(8, dtype=object)
-        if elemObj.elemCode in 'RLCVvIiabN' or elemObj.elemCode == 'empty':
-            # those object occupies the region of a circle.
-            if elemObj.elemCode == 'N' : 
-                l = primElemWidth/8
-                s = np.sqrt(2)
-                self.offset[0] =  l,  0
-                self.offset[1] =  l/s, -l/s
-                self.offset[2] =  0, -l
-                self.offset[3] = -l/s, -l/s
-                self.offset[4] = -l,  0
-                self.offset[5] = -l/s,  l/s
-                self.offset[6] =  0,  l
-                self.offset[7] =  l/s,  l/s
-            # those object occupies the region of a squre.
-            else :
-                l = primElemWidth / 2
-                self.offset[0] =  l,  0  
-                self.offset[1] =  l, -l  
-                self.offset[2] =  0, -l  
-                self.offset[3] = -l, -l  
-                self.offset[4] = -l,  0  
-                self.offset[5] = -l,  l  
-                self.offset[6] =  0,  l  
-                self.offset[7] =  l,  l  
-        if elemObj.elemCode in ('n', 'anchor', 'A', 'm', 'g', 'O') :
-            # those object have zero offset, wires connet to their center
-            self.offset[:] = [(0, 0) for _ in range(8)]
+        self.offset   = get_offsetTable(elemCode)
 class WireDrawingObj :
-    '''Wires are drawn by a given starting and ending point'''
+    '''Wires are drawn by a given starting and ending point.\
+       A point is (i, j, dx, dy, mx, my), see pos2xy. It does not depend on blockWidth.'''
+    __slots__ = ('elemCode', 'strPos', 'endPos')
     def __init__ (self, elemCode, strPos, endPos) : 
         self.elemCode = elemCode
         self.strPos = strPos
@@ -103,352 +115,600 @@ class WireDrawingObj :
 class TextDrawingObj :
     '''Texts are drawn by a given reference position, direction, \
        along with horizontail and vertical move from its reference position.'''
-    def __init__(self, text, refi, refj, vmove, pmove, refDirection) :
+    __slots__ = ('text', 'refi', 'refj', 'vmove', 'pmove', 'refSvgDirc', 'group')
+    def __init__(self, text, refi, refj, vmove, pmove, refDirection, group = None) :
         self.text  = text
         self.refi  = refi
         self.refj  = refj
         self.vmove = vmove
         self.pmove = pmove
         self.refSvgDirc = svgDirc[refDirection]
+        self.group = group
 
+def to_protocolCode(elemObj) :
+    '''Element code in protocol for an element drawn as itself.'''
+    if elemObj.elemCode == 'n' and elemObj.fill == 'F' :
+        # in protocol, n is filled node while N is hollow node.
+        return 'N'
+    if elemObj.elemCode == 'A' and elemObj.shape == 'end' :
+        # in protocol, a is end Arrow while A is mid arrow.
+        return 'a'
+    return elemObj.elemCode
+def pos2xy(pos, ctx) :
+    '''Point (i, j, dx, dy, mx, my) of wire drawing object is at\
+       (x, y) = ctx.blockWidth*(j, i) + (dx, dy) + (mx, my).'''
+    i, j, dx, dy, mx, my = pos
+    x, y = ij2xy(i, j, ctx)
+    return x + dx + mx, y + dy + my
+def make_centeredWire(elemObj) :
+    # some wires are considered as centered drawing object, however it should be
+    # acheveie by wire drawing object. (sudo centered drawing object) 
+    l = primElemWidth / 2
+    if elemObj.direction in ('R', 'L')   : extend = (l, 0)
+    if elemObj.direction in ('U', 'D')   : extend = (0, l)
+    if elemObj.direction in ('RU', 'LD') : extend = (l, -l)
+    if elemObj.direction in ('LU', 'RD') : extend = (l, l)
+    i, j, move = elemObj.i, elemObj.j, elemObj.move
+    strPos = i, j, -extend[0], -extend[1], move[0], move[1]
+    endPos = i, j, +extend[0], +extend[1], move[0], move[1]
+    return WireDrawingObj(elemObj.elemCode, strPos, endPos)
+def make_elemCenteredDrawingObjs(elemObj) :
+    '''Return centered drawing objects and sudo centered drawing objects of an element.'''
+    elemCode = elemObj.elemCode
+    # put auto generated nodes and anchors
+    if elemCode in ('.', ',') :
+        if elemObj.isNode : elemCode = 'n'
+        elif elemObj.isPosAnchor : elemCode = 'anchor'
+        # skip for unnerbered wires that are not node nor anchor. 
+        else : return (), ()
+    # put centered wires
+    elif elemCode == 'w' :
+        sudoCenteredDrawingObjs = (make_centeredWire(elemObj), )
+        # after makeing the wire, left an empty object at this position, it will be remove later
+        centeredDrawingObjs = (CenteredDrawingObj(elemObj, 'empty'), )
+        if elemObj.isGround == 'T' :
+            centeredDrawingObjs += (CenteredDrawingObj(elemObj, 'g'), )
+        # skip thus it is already made as a sudo centered drawing object.
+        return centeredDrawingObjs, sudoCenteredDrawingObjs
+    else :
+        elemCode = to_protocolCode(elemObj)
+    return (CenteredDrawingObj(elemObj, elemCode), ), ()
 def make_centeredDrawingObjs(circuitboard) :
     # put primary drawing objects, along with nodes and position anchors.
-    def make_centeredWire(elemObj) :
-        # some wires are considered as centered drawing object, however it should be
-        # acheveie by wire drawing object. (sudo centered drawing object) 
-        nonlocal sudoCenteredDrawingObjs
-        nonlocal centeredDrawingObjs
-        midPos = ij2xy(elemObj.i, elemObj.j)
-        l = primElemWidth / 2
-        if elemObj.direction in ('R', 'L')   : extend = (l, 0)
-        if elemObj.direction in ('U', 'D')   : extend = (0, l)
-        if elemObj.direction in ('RU', 'LD') : extend = (l, -l)
-        if elemObj.direction in ('LU', 'RD') : extend = (l, l)
-        x1, x2 = midPos[0] - extend[0], midPos[0] + extend[0]
-        y1, y2 = midPos[1] - extend[1], midPos[1] + extend[1]
-        # position adjustment
-        x1 += elemObj.move[0]; x2 += elemObj.move[0]
-        y1 += elemObj.move[1]; y2 += elemObj.move[1]
-        sudoCenteredDrawingObjs.append(WireDrawingObj(elemObj.elemCode, (x1, y1), (x2, y2)))
-        # after makeing the wire, left an empty object at this position, it will be remove later
-        elemObj.elemCode = 'empty'
-        centeredDrawingObjs.append(CenteredDrawingObj(elemObj))
     centeredDrawingObjs = []
     sudoCenteredDrawingObjs = []
-    Ae = circuitboard.elemArray
-    Nv = circuitboard.Nv
-    Nh = circuitboard.Nh
-    for i in range(Nv) :
-        for j in range(Nh) :
-            if circuitboard.haveElem(i, j) :
-                elemObj = Ae[i, j]
-                # put auto generated nodes and anchors
-                if elemObj.elemCode in ('.', ',') :
-                    if elemObj.isNode : elemObj.elemCode = 'n'
-                    elif elemObj.isPosAnchor : elemObj.elemCode = 'anchor'
-                    # skip for unnerbered wires that are not node nor anchor. 
-                    else : continue 
-                # put centered wires
-                elif elemObj.elemCode == 'w' :
-                    make_centeredWire(elemObj)
-                    if elemObj.isGround == 'T' : elemObj.elemCode = 'g'
-                    else : continue
-                    # skip thus it is already made as a sudo centered drawing object.
-                else :
-                    if elemObj.elemCode == 'n' and elemObj.fill == 'F' :
-                        # in protocol, n is filled node while N is hollow node.
-                        elemObj.elemCode = 'N'
-                    if elemObj.elemCode == 'A' and elemObj.shape == 'end' :
-                        # in protocol, a is end Arrow while A is mid arrow.
-                        elemObj.elemCode = 'a'
-                centeredDrawingObjs.append(CenteredDrawingObj(elemObj))
+    for elemObj in circuitboard.elemArray.states(circuitboard.occupiedPos) :
+        if elemObj is None : continue
+        centered, sudo = make_elemCenteredDrawingObjs(elemObj)
+        centeredDrawingObjs += centered
+        sudoCenteredDrawingObjs += sudo
     return centeredDrawingObjs, sudoCenteredDrawingObjs
+# moves (di, dj) of the 8 directions
+dircMove = (
+    ( 0, +1), (-1, +1), (-1,  0), (-1, -1),
+    ( 0, -1), (+1, -1), (+1,  0), (+1, +1)
+)
+def make_nextStopTable(connectingBoolArray, isStopArray) :
+    '''Return an array nextStop[i, j, direction] that stores the flat index (i*Nh + j)\
+       of the stop reached by walking from (i, j) toward the direction, -1 if there is none.
+       Walking continues while the next position connects back to the opposite direction
+       and is not a stop. Each direction is built in one sweep along rows (or columns),
+       from the far end of the walk backward, thus every wire end point is found in O(1).'''
+    Nv, Nh = isStopArray.shape
+    flatIndex = np.arange(Nv * Nh).reshape(Nv, Nh)
+    nextStop = np.full([Nv, Nh, 8], -1, dtype = np.int64)
+    for direction in range(8) :
+        di, dj = dircMove[direction]
+        oppsiteDirection = (direction + 4) % 8
+        reachable = connectingBoolArray[:, :, oppsiteDirection]
+        table = nextStop[:, :, direction]
+        def sweep(strSlice, desSlice) :
+            # cells in strSlice walk one step to cells in desSlice
+            result = np.where(isStopArray[desSlice], flatIndex[desSlice], table[desSlice])
+            table[strSlice] = np.where(reachable[desSlice], result, -1)
+        if dj != 0 :
+            # sweep columns, the column next to the far end first
+            columns = range(Nh-2, -1, -1) if dj > 0 else range(1, Nh)
+            for j in columns :
+                if   di > 0 : strRows, desRows = slice(0, Nv-1), slice(1, Nv)
+                elif di < 0 : strRows, desRows = slice(1, Nv), slice(0, Nv-1)
+                else        : strRows, desRows = slice(0, Nv), slice(0, Nv)
+                sweep((strRows, j), (desRows, j+dj))
+        else :
+            rows = range(Nv-2, -1, -1) if di > 0 else range(1, Nv)
+            for i in rows :
+                sweep((i, slice(None)), (i+di, slice(None)))
+    return nextStop
 def make_WireDrawingObjs(circuitboard, centeredDrawingObjs) : 
     #  1. Starts with each element, connect to the nearst anchor or element.
     #  2. Consider anchors, make sure every anchor connects.
     wireDrawingObjs = []
-    Ai = circuitboard.elemIDArray
-    Ae = circuitboard.elemArray
-    Nv = circuitboard.Nv
     Nh = circuitboard.Nh
-    connectingBoolArray = np.zeros([Nv, Nh, 8], dtype = bool)
-    for i in range(Nv) :
-        for j in range(Nh) :
-            if circuitboard.haveElem(i, j) :
-                connectingBoolArray[i, j, 0] = Ae[i, j].connectR
-                connectingBoolArray[i, j, 1] = Ae[i, j].connectRU
-                connectingBoolArray[i, j, 2] = Ae[i, j].connectU
-                connectingBoolArray[i, j, 3] = Ae[i, j].connectLU
-                connectingBoolArray[i, j, 4] = Ae[i, j].connectL
-                connectingBoolArray[i, j, 5] = Ae[i, j].connectLD
-                connectingBoolArray[i, j, 6] = Ae[i, j].connectD
-                connectingBoolArray[i, j, 7] = Ae[i, j].connectRD
-            else :
-                connectingBoolArray[i, j, :] = [0 for _ in range(8)]
-    def canReach(i, j, direction) :
-        if i<0 or i>=Nv or j<0 or j>=Nh : return False
-        else :
-            if direction  < 4 : oppsiteDirection = direction + 4
-            if direction >= 4 : oppsiteDirection = direction - 4
-            return connectingBoolArray[i, j, oppsiteDirection]
-    def find_connectPoint(i, j, direction) :
-        def walk(i, j, direction, step) :
-            if direction == 0 : move =     0, +step
-            if direction == 1 : move = -step, +step
-            if direction == 2 : move = -step,     0
-            if direction == 3 : move = -step, -step
-            if direction == 4 : move =     0, -step
-            if direction == 5 : move = +step, -step
-            if direction == 6 : move = +step,     0
-            if direction == 7 : move = +step, +step
-            return i + move[0], j + move[1]
-        def check(i, j) :
-            # No element or anchor in this position
-            if not circuitboard.haveElem(i, j) : 
-                return None
-            # It connect to element
-            elif Ai[i, j][0] not in ('.', 'w', ',') : 
-                return True
-            # It connect to anchor
-            elif Ae[i, j].isPosAnchor : 
-                return True
-            # Keep finding
-            else : return False
-        for step in range( max(Nv, Nh) ) :
-            destination = walk(i, j, direction, step+1)
-            if not canReach(*destination, direction) :
-                return None, None
-            else :
-                result = check(*destination)
-                if   result == False : continue # keep going
-                elif result == True  : return destination
-                elif result == None  : return None, None
+    # drawing object at each position
+    objAt = {(obj.i, obj.j) : obj for obj in reversed(centeredDrawingObjs)}
+    if circuitboard.isSparse :
+        # walk from every element, a table over the whole board costs more than walks.
+        strI = np.repeat(np.array([obj.i for obj in centeredDrawingObjs], dtype = int), 8)
+        strJ = np.repeat(np.array([obj.j for obj in centeredDrawingObjs], dtype = int), 8)
+        directions = np.tile(np.arange(8), len(centeredDrawingObjs))
+        stopI, stopJ = walk_toStops(circuitboard, strI, strJ, directions)
+        for n in np.flatnonzero(stopI >= 0).tolist() :
+            strObj = centeredDrawingObjs[n // 8]
+            desObj = objAt[int(stopI[n]), int(stopJ[n])]
+            wireDrawingObjs.append(make_wire(strObj, desObj, n % 8))
+        return wireDrawingObjs
+    # bits of connectArray are in svg direction order.
+    connectingBoolArray = (circuitboard.connectArray[:, :, None] >> np.arange(8) & 1).astype(bool)
+    connectingBoolArray &= circuitboard.haveElemBoolArray[:, :, None]
+    # A stop is an element or an anchor, wires end at stops.
+    isStopArray = circuitboard.haveElemBoolArray & \
+                  (~np.isin(circuitboard.codeArray, ('.', 'w', ',')) | circuitboard.isPosAnchorArray)
+    nextStop = make_nextStopTable(connectingBoolArray, isStopArray)
 
     for strObj in centeredDrawingObjs :
         stri = strObj.i
         strj = strObj.j
         for direction in range(8) :
-            desi, desj = find_connectPoint(stri, strj, direction)
-            if desi != None :
-                desObj = [obj for obj in centeredDrawingObjs if \
-                            obj.i == desi and obj.j == desj][0]
-                endi = desObj.i
-                endj = desObj.j
-                # make a wire that connects starting point and desination
-                strx, stry = ij2xy(stri, strj)
-                endx, endy = ij2xy(endi, endj)
-                if direction  < 4 : oppsiteDirection = direction + 4
-                if direction >= 4 : oppsiteDirection = direction - 4
-
-                strPos = strx + strObj.offset[direction][0], \
-                         stry + strObj.offset[direction][1]
-                endPos = endx + desObj.offset[oppsiteDirection][0], \
-                         endy + desObj.offset[oppsiteDirection][1]
-                wireDrawingObjs.append(WireDrawingObj('w', strPos, endPos))
+            stop = nextStop[stri, strj, direction]
+            if stop >= 0 :
+                desObj = objAt[divmod(int(stop), Nh)]
+                wireDrawingObjs.append(make_wire(strObj, desObj, direction))
     return wireDrawingObjs
-def make_textDrawingObjs(circuitboard) :
-    textDrawingObjs = []
-    Ai = circuitboard.elemIDArray
-    Ae = circuitboard.elemArray
-    Nv = circuitboard.Nv
-    Nh = circuitboard.Nh
-    def to_mathExpr(rawStr) :
-        mathExpr = ''
-        def process_escapeSequence(s) :
-            # !i --> mathit, !r --> mathrm, !b --> mathbf.
-            # !s --> mathrm + mathsf. !p{A} --> \phase{A^{\circ}}
-            n = 1
-            while n > 0:
-                s, n = re.subn(r'!i\{(.*?)\}', r'\\mathit{\1}', s)
-                s, n = re.subn(r'!r\{(.*?)\}', r'\\mathrm{\1}', s)
-                s, n = re.subn(r'!s\{(.*?)\}', r'\\mathrm{\\mathsf{\1}}', s)
-                s, n = re.subn(r'!b\{(.*?)\}', r'\\mathbf{\1}', s)
-                s, n = re.subn(r'!p\{(.*?)\}', r'∠\\mathrm{\\mathsf{\1}}^{\\circ}', s)
-            return s
-        if '!' in rawStr :
-            # !0{A} make what's inside as raw string.
-            if bool(re.search(r"!0\{.*\}", rawStr)) :
-                mathExpr = re.sub(r'!0\{(.*?)\}|\{(.*?)\}', r'\1\2', rawStr)
-            else :
-                mathExpr = '$' + process_escapeSequence(rawStr) + '$'
+def make_wire(strObj, desObj, direction) :
+    # make a wire that connects starting point and desination
+    oppsiteDirection = (direction + 4) % 8
+    strPos = strObj.i, strObj.j, *strObj.offset[direction], 0, 0
+    endPos = desObj.i, desObj.j, *desObj.offset[oppsiteDirection], 0, 0
+    return WireDrawingObj('w', strPos, endPos)
+def is_stop(circuitboard, i, j) :
+    '''Same as isStopArray of make_WireDrawingObjs, for one position.'''
+    return circuitboard.haveElemBoolArray[i, j] and \
+           (circuitboard.codeArray[i, j] not in ('.', 'w', ',') or circuitboard.isPosAnchorArray[i, j])
+def walk_toStop(circuitboard, i, j, direction) :
+    '''Return the stop reached by walking from (i, j) toward the direction, None if there\
+       is none. Same as nextStop of make_nextStopTable, for one position.'''
+    di, dj = dircMove[direction]
+    oppsiteBit = 1 << (direction + 4) % 8
+    C, H = circuitboard.connectArray, circuitboard.haveElemBoolArray
+    i, j = i + di, j + dj
+    while 0 <= i < circuitboard.Nv and 0 <= j < circuitboard.Nh :
+        if not (H[i, j] and C[i, j] & oppsiteBit) : return None
+        if is_stop(circuitboard, i, j) : return i, j
+        i, j = i + di, j + dj
+    return None
+def walk_toStops(circuitboard, I, J, directions) :
+    '''Same as walk_toStop for many walks at once, walks take one step together.\
+       Return arrays (stopI, stopJ), -1 for walks that reach no stop.'''
+    C, H = circuitboard.connectArray, circuitboard.haveElemBoolArray
+    moves = np.array([dircMove[direction] for direction in range(8)])
+    oppsiteBits = (1 << (np.asarray(directions) + 4) % 8).astype(np.uint8)
+    di, dj = moves[directions, 0], moves[directions, 1]
+    stopI, stopJ = np.full(len(I), -1), np.full(len(I), -1)
+    walking = np.arange(len(I))
+    I, J = np.asarray(I), np.asarray(J)
+    while len(walking) :
+        I, J = I + di, J + dj
+        inside = (0 <= I) & (I < circuitboard.Nv) & (0 <= J) & (J < circuitboard.Nh)
+        walking, I, J, di, dj, oppsiteBits = (a[inside] for a in (walking, I, J, di, dj, oppsiteBits))
+        connected = H[I, J] & (C[I, J] & oppsiteBits != 0)
+        walking, I, J, di, dj, oppsiteBits = (a[connected] for a in (walking, I, J, di, dj, oppsiteBits))
+        isStop = ~np.isin(circuitboard.codeArray[I, J], ('.', 'w', ',')) | circuitboard.isPosAnchorArray[I, J]
+        stopI[walking[isStop]], stopJ[walking[isStop]] = I[isStop], J[isStop]
+        walking, I, J, di, dj, oppsiteBits = (a[~isStop] for a in (walking, I, J, di, dj, oppsiteBits))
+    return stopI, stopJ
+def to_mathExpr(rawStr) :
+    mathExpr = ''
+    def process_escapeSequence(s) :
+        # !i --> mathit, !r --> mathrm, !b --> mathbf.
+        # !s --> mathrm + mathsf. !p{A} --> \phase{A^{\circ}}
+        n = 1
+        while n > 0:
+            s, n = re.subn(r'!i\{(.*?)\}', r'\\mathit{\1}', s)
+            s, n = re.subn(r'!r\{(.*?)\}', r'\\mathrm{\1}', s)
+            s, n = re.subn(r'!s\{(.*?)\}', r'\\mathrm{\\mathsf{\1}}', s)
+            s, n = re.subn(r'!b\{(.*?)\}', r'\\mathbf{\1}', s)
+            s, n = re.subn(r'!p\{(.*?)\}', r'∠\\mathrm{\\mathsf{\1}}^{\\circ}', s)
+        return s
+    if '!' in rawStr :
+        # !0{A} make what's inside as raw string.
+        if bool(re.search(r"!0\{.*\}", rawStr)) :
+            mathExpr = re.sub(r'!0\{(.*?)\}|\{(.*?)\}', r'\1\2', rawStr)
         else :
-            mathExpr = '$' + rawStr + '$'
-        # containsSubOrSup = bool(re.search(r"\\mathsf\{.*_.*\}", mathExpr)) or\
-        # bool(re.search(r"\\mathsf\{.*\^.*\}", mathExpr))
-        # if containsSubOrSup:
-        #     raise Exception(r'no subscript and superscript is allowed within \mathsf{}')
-        return mathExpr
-    def vmoveModification(elemCode, direction) :
-        isUD = bool( direction in ('U', 'D') )
-        isLR = bool( direction in ('L', 'R') )
-        isDiag = (not isUD) and (not isLR) 
-
-        scalar = 1
-        if elemCode in ('m', 'b', 'n') :
-            scalar = 0
-        if elemCode in ('A', 'a') and isLR :
-            scalar = 0.6
-        if elemCode in ('A', 'a') and isUD :
-            scalar = 0.3
-        if elemCode in ('A', 'a') and isDiag :
-            scalar = 0.6
-        if elemCode in ('R', 'L') and isUD :
-            scalar = 0.4
-        if elemCode == 'C'        and isUD :
-            scalar = 0.7
-        if elemCode in ('i', 'v', 'I', 'V') and isLR :
-            scalar = 1.5
-        if elemCode in ('i', 'v') and isUD :
-            scalar = 1.2
-        if elemCode in ('I', 'V') and isUD :
-            scalar = 1.0
-        if elemCode in ('i', 'v', 'I', 'V') and isDiag :
-            scalar = 1.4
-        return scalar
-    
-    for i in range(Nv):
-        for j in range(Nh) :
-            if circuitboard.haveElem(i, j) :
-                elem = Ae[i, j]
-                #### value
-                if hasattr(elem, 'value') and elem.value != None and elem.value != '' :
-                    rawtext = elem.value
-                    # The default setting for values of R L C V I : 
-                    # 1. are smooth font.
-                    # 2. imaginary number j will be mathit.
-                    if '!' not in rawtext and Ai[i, j][0] in ('RLCVI') \
-                    and '_' not in rawtext :
-                        text = '$\\mathrm{\\mathsf{'+ rawtext + '}}$'
-                        text = text.replace('j', '\\mathit{j}\\;')
-                        text = text.replace('Ω', '\\;Ω')
-                        # due to matplotlib text box error, insert a space infront of 
-                        # mathit font 'j' to make it display correctly.
-                        text = ' ' + text + ' '
-                    else : 
-                        text = to_mathExpr(rawtext) 
-                    if elem.valuePos == 'RHS' : vmove = 1
-                    if elem.valuePos == 'LHS' : vmove = -1
-                    # for text attach to object without direction, it's set to be U.
-                    direction = elem.direction if hasattr(elem, 'direction') else 'U'
-                    vmove *= vmoveModification(elem.elemCode, direction)
-                    # position adjustments
-                    vmove += elem.valueMove[0]
-                    pmove  = elem.valueMove[1]
-                    textDrawingObj = TextDrawingObj(text, i, j, vmove, pmove, direction)
-                    textDrawingObjs.append( textDrawingObj )
-                #### pm with format : sign1, sign2, text
-                if hasattr(elem, 'pm') and elem.pm != None and Ae[i, j].pm[1] in ('+', '-') :
-                    sign1  = '$' + elem.pm[0] + '$'
-                    sign2  = '$' + elem.pm[1] + '$'
-                    text   = to_mathExpr(elem.pm[2])
-                    if elem.pmPos == 'RHS' : vmove = 1
-                    if elem.pmPos == 'LHS' : vmove = -1
-                    vmove = vmove * vmoveModification(elem.elemCode, elem.direction)
-                    # position adjustments
-                    vmove += elem.pmMove[0]
-                    pmove  = elem.pmMove[1]
-                    sign1Obj = TextDrawingObj(sign1, i, j, vmove, +1+pmove+elem.pmSep, elem.direction)
-                    sign2Obj = TextDrawingObj(sign2, i, j, vmove, -1+pmove-elem.pmSep, elem.direction)
-                    textObj  = TextDrawingObj( text, i, j, vmove,  pmove, elem.direction)
-                    textDrawingObjs.append(sign1Obj)
-                    textDrawingObjs.append(sign2Obj)
-                    textDrawingObjs.append(textObj)
-                #### pm with format : local sign, destination, text
-                if hasattr(elem, 'pm') and elem.pm != None and elem.pm[1] not in ('+', '-') :
-                    strSign = elem.pm[0]
-                    if strSign == '+' : desSign = '-'
-                    if strSign == '-' : desSign = '+'
-                    strSign =  '$' + strSign + '$'
-                    desSign = '$' + desSign   + '$'
-                    text    =  to_mathExpr(elem.pm[2])
+            mathExpr = '$' + process_escapeSequence(rawStr) + '$'
+    else :
+        mathExpr = '$' + rawStr + '$'
+    # containsSubOrSup = bool(re.search(r"\\mathsf\{.*_.*\}", mathExpr)) or\
+    # bool(re.search(r"\\mathsf\{.*\^.*\}", mathExpr))
+    # if containsSubOrSup:
+    #     raise Exception(r'no subscript and superscript is allowed within \mathsf{}')
+    return mathExpr
+def vmoveModification(elemCode, direction) :
+    isUD = bool( direction in ('U', 'D') )
+    isLR = bool( direction in ('L', 'R') )
+    isDiag = (not isUD) and (not isLR) 
 
-                    desObjName = Ae[i, j].pm[1]
-                    desi, desj = circuitboard.find_elemPos(desObjName)
-                    midPoint   = (i+desi) / 2 , (j+desj) / 2
-                    pmove = 0
-                    if i == desi :   # UD
-                        refDirc = 'U'
-                        if j > desj :    vmove = -1
-                        else :           vmove = 1
-                    elif j == desj : # LR
-                        refDirc = 'R'
-                        if i > desi :    vmove = -1
-                        else :           vmove = 1
-                    else :           # diagonal
-                        refDirc = 'R'
-                        if j > desj :    vmove = -1
-                        else :           vmove = 1 
-                        if i > desi :    pmove = -1
-                        else :           pmove = 1
-                    vmove = vmove * vmoveModification(elem.elemCode, refDirc)
-                    # position adjustment
-                    vmove += elem.pmMove[1]
-                    pmove += elem.pmMove[0]
-                    strSignObj = TextDrawingObj(strSign,    i,    j,  vmove,  +pmove-elem.pmSep, refDirc)
-                    desSignObj = TextDrawingObj(desSign, desi, desj, -vmove,  +pmove+elem.pmSep, refDirc)
-                    textObj    = TextDrawingObj( text,  *midPoint,    0,       pmove, refDirc)
-                    textDrawingObjs.append(strSignObj)
-                    textDrawingObjs.append(desSignObj)
-                    textDrawingObjs.append(textObj)
+    scalar = 1
+    if elemCode in ('m', 'b', 'n') :
+        scalar = 0
+    if elemCode in ('A', 'a') and isLR :
+        scalar = 0.6
+    if elemCode in ('A', 'a') and isUD :
+        scalar = 0.3
+    if elemCode in ('A', 'a') and isDiag :
+        scalar = 0.6
+    if elemCode in ('R', 'L') and isUD :
+        scalar = 0.4
+    if elemCode == 'C'        and isUD :
+        scalar = 0.7
+    if elemCode in ('i', 'v', 'I', 'V') and isLR :
+        scalar = 1.5
+    if elemCode in ('i', 'v') and isUD :
+        scalar = 1.2
+    if elemCode in ('I', 'V') and isUD :
+        scalar = 1.0
+    if elemCode in ('i', 'v', 'I', 'V') and isDiag :
+        scalar = 1.4
+    return scalar
+# texts of one label share a group key, labels positioned by user are
+# fixed (None) and are not moved by automatic label placement.
+def groupKey(i, j, label) :
+    return f'{i},{j}:{label}'
+def valueGroup(elem, i, j) :
+    if elem.valuePos != 'RHS' or elem.valueMove != (0, 0) : return None
+    return groupKey(i, j, 'value')
+def pmGroup(elem, i, j) :
+    if elem.pmPos != 'LHS' or elem.pmMove != (0, 0) or elem.pmSep != 0 : return None
+    return groupKey(i, j, 'pm')
+def make_elemTextDrawingObjs(circuitboard, i, j, elem = None) :
+    '''\
+    Return text drawing objects of the element at (i, j). elem is the element or its
+    state (see construct.ElemState), read from the board if it is not given.'''
+    textDrawingObjs = []
+    if elem is None : elem = circuitboard.elemArray[i, j]
+    #### value
+    rawtext = elem.value
+    if rawtext != None and rawtext != '' :
+        # The default setting for values of R L C V I : 
+        # 1. are smooth font.
+        # 2. imaginary number j will be mathit.
+        if '!' not in rawtext and elem.elemCode in ('RLCVI') \
+        and '_' not in rawtext :
+            text = '$\\mathrm{\\mathsf{'+ rawtext + '}}$'
+            text = text.replace('j', '\\mathit{j}\\;')
+            text = text.replace('Ω', '\\;Ω')
+            # due to matplotlib text box error, insert a space infront of 
+            # mathit font 'j' to make it display correctly.
+            text = ' ' + text + ' '
+        else : 
+            text = to_mathExpr(rawtext) 
+        if elem.valuePos == 'RHS' : vmove = 1
+        if elem.valuePos == 'LHS' : vmove = -1
+        # for text attach to object without direction, it's set to be U.
+        direction = elem.direction
+        vmove *= vmoveModification(to_protocolCode(elem), direction)
+        # position adjustments
+        vmove += elem.valueMove[0]
+        pmove  = elem.valueMove[1]
+        group = valueGroup(elem, i, j)
+        textDrawingObj = TextDrawingObj(text, i, j, vmove, pmove, direction, group)
+        textDrawingObjs.append( textDrawingObj )
+    pm = elem.pm
+    #### pm with format : sign1, sign2, text
+    if pm != None and pm[1] in ('+', '-') :
+        sign1  = '$' + elem.pm[0] + '$'
+        sign2  = '$' + elem.pm[1] + '$'
+        text   = to_mathExpr(elem.pm[2])
+        if elem.pmPos == 'RHS' : vmove = 1
+        if elem.pmPos == 'LHS' : vmove = -1
+        vmove = vmove * vmoveModification(to_protocolCode(elem), elem.direction)
+        # position adjustments
+        vmove += elem.pmMove[0]
+        pmove  = elem.pmMove[1]
+        group = pmGroup(elem, i, j)
+        sign1Obj = TextDrawingObj(sign1, i, j, vmove, +1+pmove+elem.pmSep, elem.direction, group)
+        sign2Obj = TextDrawingObj(sign2, i, j, vmove, -1+pmove-elem.pmSep, elem.direction, group)
+        textObj  = TextDrawingObj( text, i, j, vmove,  pmove, elem.direction, group)
+        textDrawingObjs.append(sign1Obj)
+        textDrawingObjs.append(sign2Obj)
+        textDrawingObjs.append(textObj)
+    #### pm with format : local sign, destination, text
+    if pm != None and pm[1] not in ('+', '-') :
+        strSign = elem.pm[0]
+        if strSign == '+' : desSign = '-'
+        if strSign == '-' : desSign = '+'
+        strSign =  '$' + strSign + '$'
+        desSign = '$' + desSign   + '$'
+        text    =  to_mathExpr(elem.pm[2])
 
+        desObjName = pm[1]
+        desi, desj = circuitboard.find_elemPos(desObjName)
+        midPoint   = (i+desi) / 2 , (j+desj) / 2
+        pmove = 0
+        if i == desi :   # UD
+            refDirc = 'U'
+            if j > desj :    vmove = -1
+            else :           vmove = 1
+        elif j == desj : # LR
+            refDirc = 'R'
+            if i > desi :    vmove = -1
+            else :           vmove = 1
+        else :           # diagonal
+            refDirc = 'R'
+            if j > desj :    vmove = -1
+            else :           vmove = 1 
+            if i > desi :    pmove = -1
+            else :           pmove = 1
+        vmove = vmove * vmoveModification(to_protocolCode(elem), refDirc)
+        # position adjustment
+        vmove += elem.pmMove[1]
+        pmove += elem.pmMove[0]
+        group = pmGroup(elem, i, j)
+        strSignObj = TextDrawingObj(strSign,    i,    j,  vmove,  +pmove-elem.pmSep, refDirc, group)
+        desSignObj = TextDrawingObj(desSign, desi, desj, -vmove,  +pmove+elem.pmSep, refDirc, group)
+        textObj    = TextDrawingObj( text,  *midPoint,    0,       pmove, refDirc, group)
+        textDrawingObjs.append(strSignObj)
+        textDrawingObjs.append(desSignObj)
+        textDrawingObjs.append(textObj)
     return textDrawingObjs
-def make_elemSvgCodes(centeredDrawingObjs) :
-    elemSvgCodes = []
-    for obj in centeredDrawingObjs :
-        posx, posy = ij2xy(obj.i, obj.j)
-        vmove, pmove = obj.move[0], obj.move[1]
-        #### temparary approach ####
-        if obj.elemCode == 'A' : # mid arrow
-            elemSvgCode = 'e', obj.elemCode, posx+vmove, posy+pmove, 0, 0, obj.svgDirc
-        else :
-            elemSvgCode = 'e', obj.elemCode, posx, posy, vmove, pmove, obj.svgDirc
-        #### temparary approach ####
-        elemSvgCodes.append(elemSvgCode)
-    return elemSvgCodes
-def make_wireSvgCodes(wireDrawingObjs) :
-    wireSvgCodes = set() # use set to avoid duplicated wire drawing.
-    for obj in wireDrawingObjs :
-        strPos, endPos = list(obj.strPos), list(obj.endPos)
-        # make wires draw from smaller x to larger x
-        pos1, pos2 = sorted([strPos, endPos], key = lambda x : x[0])
-        # if it was vertical or horizontal wire, make sure it comes
-        # form up to down, left to right.
-        if (pos1[0] == pos2[0]) or (pos1[1] == pos2[1]) :
-            pos1[0], pos2[0] = tuple(sorted( [pos1[0], pos2[0]] ) )
-            pos1[1], pos2[1] = tuple(sorted( [pos1[1], pos2[1]] ) )
-        wireSvgCode = 'e', 'w', pos1[0], pos2[0], pos1[1], pos2[1]
-        wireSvgCodes.add(wireSvgCode)
-    return list(wireSvgCodes)
-def make_textSvgCodes(textDrawingObjs) :
-    textSvgCodes = []
-    for obj in textDrawingObjs :
-        refx, refy = ij2xy(obj.refi, obj.refj)
-        textSvgCode = 't', obj.text, refx, refy, obj.vmove, obj.pmove, obj.refSvgDirc
-        textSvgCodes.append(textSvgCode)
-    return textSvgCodes
+def make_textDrawingObjs(circuitboard) :
+    textDrawingObjs = []
+    for elem in circuitboard.elemArray.states(circuitboard.occupiedPos) :
+        if elem is None : continue
+        textDrawingObjs += make_elemTextDrawingObjs(circuitboard, elem.i, elem.j, elem)
+    return textDrawingObjs
+def to_elemSvgCode(obj, ctx) :
+    posx, posy = ij2xy(obj.i, obj.j, ctx)
+    vmove, pmove = obj.move[0], obj.move[1]
+    #### temparary approach ####
+    if obj.elemCode == 'A' : # mid arrow
+        return 'e', obj.elemCode, posx+vmove, posy+pmove, 0, 0, obj.svgDirc
+    return 'e', obj.elemCode, posx, posy, vmove, pmove, obj.svgDirc
+    #### temparary approach ####
+def to_wireSvgCode(obj, ctx) :
+    x1, y1 = pos2xy(obj.strPos, ctx)
+    x2, y2 = pos2xy(obj.endPos, ctx)
+    # make wires draw from smaller x to larger x
+    if x2 < x1 : x1, y1, x2, y2 = x2, y2, x1, y1
+    # if it was vertical or horizontal wire, make sure it comes
+    # form up to down, left to right.
+    if (x1 == x2 or y1 == y2) and y2 < y1 : y1, y2 = y2, y1
+    return 'e', 'w', x1, x2, y1, y2
+def to_textSvgCode(obj, ctx) :
+    refx, refy = ij2xy(obj.refi, obj.refj, ctx)
+    textSvgCode = 't', obj.text, refx, refy, obj.vmove, obj.pmove, obj.refSvgDirc
+    if ctx.labelGroups : textSvgCode += (obj.group, )
+    return textSvgCode
+def make_elemSvgCodes(centeredDrawingObjs, ctx) :
+    return [to_elemSvgCode(obj, ctx) for obj in centeredDrawingObjs]
+def make_wireSvgCodes(wireDrawingObjs, ctx) :
+    # use set to avoid duplicated wire drawing.
+    wireSvgCodes = {to_wireSvgCode(obj, ctx) for obj in wireDrawingObjs}
+    # sorted, thus the output does not depend on hash randomization of set.
+    return sorted(wireSvgCodes)
+def make_textSvgCodes(textDrawingObjs, ctx) :
+    return [to_textSvgCode(obj, ctx) for obj in textDrawingObjs]
 def remove_anchor(elemSvgCodes) :
     elemSvgCodes[:] = [c for c in elemSvgCodes if 'anchor' not in c]
 def remove_empty(elemSvgCodes) :
     elemSvgCodes[:] = [c for c in elemSvgCodes if 'empty' not in c]
 
 
-def to_svgCodes(circuitboard, * ,remove_anchors = False,  blockWidth = 6) :
-    global blockWidth_
-    try :
-        float(blockWidth)
-    except ValueError :
-        raise ValueError(f'{blockWidth} is not a numerical value') from None
-    if blockWidth < 2 or blockWidth > 14 :
-        raise ValueError('block width must in between 2~14')
-    blockWidth_ = float(blockWidth)
-    centeredDrawingObjs, sudoCenteredDrawingObjs = make_centeredDrawingObjs(circuitboard)
-    WireDrawingObjs = make_WireDrawingObjs(circuitboard, centeredDrawingObjs)
-    WireDrawingObjs += sudoCenteredDrawingObjs
-    textDrawingObjs = make_textDrawingObjs(circuitboard)
-    elemSvgCodes = make_elemSvgCodes(centeredDrawingObjs)
-    wireSvgCodes = make_wireSvgCodes(WireDrawingObjs)
-    textSvgCodes = make_textSvgCodes(textDrawingObjs)
-    if remove_anchors : remove_anchor(elemSvgCodes)
+# Drawing objects and svg codes are cached by position. Edits of the board mark
+# positions as dirty (circuitboard.dirtyPos), only those positions and wires that
+# pass them are made again. Rows and columns inserted or deleted are recorded in
+# circuitboard.shifts, objects after them are moved instead of made again. The cache
+# lives on the board (drawingObjs) and conversion updates it and clears dirtyPos and
+# shifts, nothing else of the board is changed. It is not thread-safe : a board must
+# not be converted or edited by two threads at the same time.
+class DrawingCache :
+    '''\
+    Drawing objects of a board by position, kept in circuitboard.drawingObjs.
+    objs[pos] = centered, sudo, wires, texts : drawing objects of the element at pos,
+    wires are those start from its centered drawing objects. Positions without any
+    object are not stored. svgCodes[ctx] is a SvgCodeCache of objs for a context, only
+    maxContexts contexts used last are kept.'''
+    __slots__ = ('objs', 'svgCodes')
+    maxContexts = 4
+    def __init__(self, objs) :
+        self.objs     = objs
+        self.svgCodes = OrderedDict()
+    def codes_of(self, ctx) :
+        '''Return the SvgCodeCache of ctx, the one used least recently is dropped.'''
+        codeCache = self.svgCodes.get(ctx)
+        if codeCache is None :
+            codeCache = self.svgCodes[ctx] = SvgCodeCache(self.objs, ctx)
+            while len(self.svgCodes) > self.maxContexts : self.svgCodes.popitem(last = False)
+        self.svgCodes.move_to_end(ctx)
+        return codeCache
+class SvgCodeCache :
+    '''\
+    svg codes of a DrawingCache for one context, codes[pos] = elem, wire, text svg codes.
+    A wire svg code can be made at several positions, wireCount counts the positions
+    and sortedWires are wire svg codes in order, see make_wireSvgCodes.'''
+    __slots__ = ('codes', 'wireCount', 'sortedWires')
+    def __init__(self, objs, ctx) :
+        self.codes     = {}
+        self.wireCount = {}
+        for pos, posObjs in objs.items() :
+            codes = self._make_codes(posObjs, ctx)
+            self.codes[pos] = codes
+            for code in codes[1] : self.wireCount[code] = self.wireCount.get(code, 0) + 1
+        self.sortedWires = sorted(self.wireCount)
+    def _make_codes(self, posObjs, ctx) :
+        centered, sudo, wires, texts = posObjs
+        # wires of a position are only counted, they are sorted in sortedWires
+        return (make_elemSvgCodes(centered, ctx), {to_wireSvgCode(obj, ctx) for obj in sudo + wires},
+                make_textSvgCodes(texts, ctx))
+    def update(self, pos, posObjs, ctx) :
+        '''Make svg codes of pos again, posObjs is None if pos has no object.'''
+        old = self.codes.pop(pos, None)
+        if old is not None :
+            for code in old[1] :
+                self.wireCount[code] -= 1
+                if self.wireCount[code] == 0 :
+                    del self.wireCount[code]
+                    del self.sortedWires[bisect.bisect_left(self.sortedWires, code)]
+        if posObjs is None : return
+        codes = self._make_codes(posObjs, ctx)
+        self.codes[pos] = codes
+        for code in codes[1] :
+            if code not in self.wireCount :
+                self.wireCount[code] = 0
+                bisect.insort(self.sortedWires, code)
+            self.wireCount[code] += 1
+
+def make_drawingCache(circuitboard) :
+    objs = {}
+    centeredDrawingObjs = []
+    positions = circuitboard.occupiedPos
+    for pos, elemObj in zip(positions, circuitboard.elemArray.states(positions)) :
+        if elemObj is None : continue
+        centered, sudo = make_elemCenteredDrawingObjs(elemObj)
+        texts = tuple(make_elemTextDrawingObjs(circuitboard, *pos, elemObj))
+        if centered or sudo or texts : objs[pos] = centered, sudo, (), texts
+        centeredDrawingObjs += centered
+    wiresFrom = {}
+    for wire in make_WireDrawingObjs(circuitboard, centeredDrawingObjs) :
+        wiresFrom.setdefault(wire.strPos[:2], []).append(wire)
+    for pos, wires in wiresFrom.items() :
+        centered, sudo, _, texts = objs[pos]
+        objs[pos] = centered, sudo, tuple(wires), texts
+    return DrawingCache(objs)
+def find_wireStarts(circuitboard, cache, dirtyPos) :
+    '''\
+    Return positions out of dirtyPos that have wires pass or end at a dirty position.
+    Cells out of dirtyPos are not changed, thus walking backward from dirty positions
+    finds these wires both before and after the change.'''
+    C, H = circuitboard.connectArray, circuitboard.haveElemBoolArray
+    starts = set()
+    for dirti, dirtj in dirtyPos :
+        for direction in range(8) :
+            # wires toward the oppsite direction reach the dirty position from here
+            di, dj = dircMove[direction]
+            bit = 1 << direction
+            i, j = dirti + di, dirtj + dj
+            while 0 <= i < circuitboard.Nv and 0 <= j < circuitboard.Nh and (i, j) not in dirtyPos :
+                posObjs = cache.objs.get((i, j))
+                if posObjs is not None and posObjs[0] : starts.add((i, j))
+                if not (H[i, j] and C[i, j] & bit) or is_stop(circuitboard, i, j) : break
+                i, j = i + di, j + dj
+    return starts
+def remake_drawingCache(circuitboard, cache, dirtyPos) :
+    '''Make drawing objects of dirty positions and wires that pass them again.'''
+    Ae = circuitboard.elemArray
+    changed = dirtyPos | find_wireStarts(circuitboard, cache, dirtyPos)
+    for pos in dirtyPos :
+        cache.objs.pop(pos, None)
+        elemObj = Ae[pos]
+        if elemObj is None : continue
+        centered, sudo = make_elemCenteredDrawingObjs(elemObj)
+        texts = tuple(make_elemTextDrawingObjs(circuitboard, *pos, elemObj))
+        cache.objs[pos] = centered, sudo, (), texts
+    for pos in changed :
+        posObjs = cache.objs.get(pos)
+        if posObjs is None : continue
+        centered, sudo, _, texts = posObjs
+        wires = []
+        for strObj in centered :
+            for direction in range(8) :
+                stop = walk_toStop(circuitboard, *pos, direction)
+                if stop is None : continue
+                # drawing object at a stop is its first centered drawing object
+                wires.append(make_wire(strObj, cache.objs[stop][0][0], direction))
+        if centered or sudo or wires or texts : cache.objs[pos] = centered, sudo, tuple(wires), texts
+        else : del cache.objs[pos]
+    for ctx, codeCache in cache.svgCodes.items() :
+        for pos in changed : codeCache.update(pos, cache.objs.get(pos), ctx)
+def shift_drawingCache(cache, axis, index, count) :
+    '''\
+    Move drawing objects for count rows (axis 0) or columns (axis 1) inserted (count > 0)
+    or deleted (count < 0) at index. Objects of deleted cells are dropped, wires that cross
+    index are left to be made again by the edit that marks cells around index as dirty.
+    svg codes are made again since coordinates after index are changed.'''
+    # positions from index to end are moved, positions deleted are in index ~ end-1
+    end = index if count > 0 else index - count
+    def moved(k) :
+        return k + count if k >= end else k
+    def movedPos(pos) :
+        pos = list(pos)
+        pos[axis] = moved(pos[axis])
+        return tuple(pos)
+    objs = {}
+    for pos, posObjs in cache.objs.items() :
+        if index <= pos[axis] < end and count < 0 : continue
+        centered, sudo, wires, texts = posObjs
+        if pos[axis] >= end :
+            for obj in centered :
+                obj.i, obj.j = movedPos((obj.i, obj.j))
+            for obj in sudo + wires :
+                obj.strPos = movedPos(obj.strPos[:2]) + obj.strPos[2:]
+                obj.endPos = movedPos(obj.endPos[:2]) + obj.endPos[2:]
+            for obj in texts :
+                obj.refi, obj.refj = movedPos((obj.refi, obj.refj))
+                if obj.group is not None :
+                    obj.group = groupKey(*movedPos(pos), obj.group.split(':')[-1])
+        objs[movedPos(pos)] = posObjs
+    cache.objs = objs
+    cache.svgCodes.clear()
+def update_drawingCache(circuitboard) :
+    '''\
+    Return the drawing cache of a board. It is made at the first call, after that only
+    dirty positions of the board and wires that pass them are made again. Shifts are
+    cleared as they are applied, dirtyPos is left to be cleared by clear_dirty once the
+    result is made, thus a failed conversion makes them again at the next call.'''
+    cache = circuitboard.drawingObjs
+    if cache is None :
+        cache = circuitboard.drawingObjs = make_drawingCache(circuitboard)
+        circuitboard.shifts.clear()
+        return cache
+    while circuitboard.shifts :
+        shift_drawingCache(cache, *circuitboard.shifts.pop(0))
+    if circuitboard.dirtyPos :
+        remake_drawingCache(circuitboard, cache, circuitboard.dirtyPos)
+    return cache
+def clear_dirty(circuitboard) :
+    circuitboard.dirtyPos.clear()
+def make_drawingObjs(circuitboard) :
+    '''Return centered, wire and text drawing objects of a board. They do not depend on\
+       blockWidth, thus they are made once and cached in circuitboard.drawingObjs, see
+       DrawingCache.'''
+    cache = update_drawingCache(circuitboard)
+    centeredDrawingObjs, wireDrawingObjs, textDrawingObjs = [], [], []
+    for pos in circuitboard.occupiedPos :
+        posObjs = cache.objs.get(pos)
+        if posObjs is None : continue
+        centered, sudo, wires, texts = posObjs
+        centeredDrawingObjs += centered
+        wireDrawingObjs += wires + sudo
+        textDrawingObjs += texts
+    clear_dirty(circuitboard)
+    return centeredDrawingObjs, wireDrawingObjs, textDrawingObjs
+
+def to_svgCodes(circuitboard, * ,remove_anchors = False,  blockWidth = 6, labelGroups = False) :
+    '''Same as make_svgCodes(make_drawingObjs(circuitboard), ctx), svg codes of positions\
+       that are not edited since the last call are reused. Not thread-safe, see
+       DrawingCache.'''
+    ctx = make_convertContext(remove_anchors = remove_anchors, blockWidth = blockWidth,
+                              labelGroups = labelGroups)
+    cache = update_drawingCache(circuitboard)
+    codeCache = cache.codes_of(ctx)
+    elemSvgCodes, textSvgCodes = [], []
+    for pos in circuitboard.occupiedPos :
+        codes = codeCache.codes.get(pos)
+        if codes is None : continue
+        elemSvgCodes += codes[0]
+        textSvgCodes += codes[2]
+    if ctx.remove_anchors : remove_anchor(elemSvgCodes)
+    remove_empty(elemSvgCodes)
+    svgCodes = elemSvgCodes + codeCache.sortedWires + textSvgCodes
+    clear_dirty(circuitboard)
+    return svgCodes
+def make_svgCodes(drawingObjs, ctx) :
+    centeredDrawingObjs, WireDrawingObjs, textDrawingObjs = drawingObjs
+    elemSvgCodes = make_elemSvgCodes(centeredDrawingObjs, ctx)
+    wireSvgCodes = make_wireSvgCodes(WireDrawingObjs, ctx)
+    textSvgCodes = make_textSvgCodes(textDrawingObjs, ctx)
+    if ctx.remove_anchors : remove_anchor(elemSvgCodes)
     remove_empty(elemSvgCodes)
     svgCodes = elemSvgCodes + wireSvgCodes + textSvgCodes
     return svgCodes
\ No newline at end of file
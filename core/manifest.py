@@ -0,0 +1,123 @@
+# Manifest of batch builds, see build.py.
+#
+# Every output folder has its own manifest next to the files drawn in it. Every file
+# drawn is one JSON line of the manifest, appended as soon as the file is drawn, thus
+# an interrupted build resumes where it stopped. The last line of an input is its
+# entry :
+#     input   : resolved path of the txt file.
+#     key     : hash of everything the outputs depend on, see make_buildKey.
+#     outputs : {path : hash} of every file or folder written for the input (svg
+#               file, theme variants, netlists, tiles) when it was written.
+#     seconds : time taken to draw it, 0 if it is copied from an identical input.
+# An input is up to date if its key is the same and none of its outputs is changed
+# since. Older lines of inputs are dropped when the manifest is loaded.
+import os
+import json
+import hashlib
+import pathlib
+import functools
+from core.construct import make_inputHash
+
+coreDir = pathlib.Path(__file__).parent
+manifestName = 'build-manifest.jsonl'
+# command line flags that change what is written for a txt file
+outputFlags = ('theme', 'dark_theme', 'theme_variants', 'embed_hash', 'auto_place',
+               'netlist', 'tiles', 'stream')
+
+def hash_file(path) :
+    '''sha256 of the content of a file.'''
+    with open(path, 'rb') as f :
+        return hashlib.sha256(f.read()).hexdigest()
+
+def hash_output(path) :
+    '''sha256 of a file, or of relative paths and contents of every file in a folder.'''
+    path = pathlib.Path(path)
+    if not path.is_dir() : return hash_file(path)
+    digest = hashlib.sha256()
+    for file in sorted(p for p in path.rglob('*') if p.is_file()) :
+        digest.update(file.relative_to(path).as_posix().encode('utf8') + b'\0')
+        digest.update(hash_file(file).encode('ascii') + b'\0')
+    return digest.hexdigest()
+
+@functools.lru_cache
+def make_toolVersion(*paths) :
+    '''Hash of the source of the drawer : modules and templates of core, and paths.'''
+    digest = hashlib.sha256()
+    for path in sorted(coreDir.glob('*.py')) + sorted(coreDir.glob('*.svg')) + list(map(pathlib.Path, paths)) :
+        digest.update(path.name.encode('utf8') + b'\0' + path.read_bytes())
+    return digest.hexdigest()
+
+def make_buildKey(inputs, flags, toolVersion, name = None) :
+    '''\
+    Hash of a build. inputs is {circuit, setting, autoNode, blockWidth, blocks}, flags
+    are command line arguments, those in outputFlags are hashed. name is the name of
+    the file, it is in netlists.'''
+    inputHash = make_inputHash(inputs['circuit'], inputs['setting'], autoNode = inputs['autoNode'],
+                               blockWidth = inputs['blockWidth'], blocks = inputs['blocks'])
+    options = {flag : flags[flag] for flag in outputFlags}
+    if flags['netlist'] : options['name'] = name
+    content = json.dumps([inputHash, options, toolVersion], sort_keys = True)
+    return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+class BuildManifest :
+    '''Entries of a manifest file by input, the file is created by the first record.'''
+    def __init__(self, path) :
+        self.path    = pathlib.Path(path)
+        self.entries = {}
+        if not self.path.exists() : return
+        with open(self.path, encoding = 'utf8') as f :
+            content = f.read()
+        lines = content.splitlines()
+        for line in lines :
+            try :
+                entry = json.loads(line)
+                self.entries[entry['input']] = entry
+            except (ValueError, KeyError, TypeError) :
+                # a line cut by an interrupted build
+                pass
+        if len(lines) > len(self.entries) or not content.endswith('\n') :
+            self._compact()
+
+    @staticmethod
+    def input_of(txtfile) :
+        return pathlib.Path(txtfile).resolve().as_posix()
+
+    def _compact(self) :
+        temp = self.path.with_name(self.path.name + '.tmp')
+        with open(temp, 'w', encoding = 'utf8') as f :
+            for entry in self.entries.values() :
+                f.write(json.dumps(entry, ensure_ascii = False) + '\n')
+        os.replace(temp, self.path)
+
+    def is_upToDate(self, txtfile, key, outputs) :
+        '''If outputs of txtfile were drawn with key and none of them is changed since.'''
+        entry = self.entries.get(self.input_of(txtfile))
+        if entry is None or entry['key'] != key : return False
+        hashes = entry.get('outputs')
+        if not isinstance(hashes, dict) or set(hashes) != {pathlib.Path(p).as_posix() for p in outputs} :
+            return False
+        try :
+            return all(hash_output(path) == outputHash for path, outputHash in hashes.items())
+        except OSError :
+            return False
+
+    def record(self, txtfile, key, outputs, seconds) :
+        '''Record that outputs of txtfile are drawn with key, written to the file at once.'''
+        entry = {'input' : self.input_of(txtfile), 'key' : key,
+                 'outputs' : {pathlib.Path(path).as_posix() : hash_output(path) for path in outputs},
+                 'seconds' : round(seconds, 3)}
+        self.entries[entry['input']] = entry
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        with open(self.path, 'a', encoding = 'utf8') as f :
+            f.write(json.dumps(entry, ensure_ascii = False) + '\n')
+
+class BuildManifests :
+    '''Manifests of output folders, each one is loaded when an output is first in it.'''
+    def __init__(self) :
+        self.manifests = {}
+    def of(self, output) :
+        '''The manifest next to output.'''
+        folder = pathlib.Path(output).resolve().parent
+        if folder not in self.manifests :
+            self.manifests[folder] = BuildManifest(folder / manifestName)
+        return self.manifests[folder]
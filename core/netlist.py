@@ -0,0 +1,159 @@
+# Netlist : connectivity of a CircuitBoard.
+#
+# Conductors (unnumbered wires, nodes, numbered wires, grounds and mid arrows) that
+# connect to each other are merged into nets by union-find over the connection bits
+# of the board, made once for every occupied cell, thus near linear in element count.
+# Two-terminal elements have a terminal at each side :
+#     p : the side the element points to (its direction), + of voltage sources and
+#         the side current sources drive current to.
+#     n : the other side.
+# A terminal joins the net of the neighbour it connects to.
+#
+# Names of nets :
+#     0          : nets with a ground (g, or w with ground = T).
+#     n1, w1 ... : element IDs of nodes and then numbered wires of the net, row by row.
+#                  Other names of the net are its aliases.
+#     N1, N2 ... : other nets, numbered row by row.
+# Element names are element IDs, elements with the same ID are named R1, R1_2, R1_3...
+import json
+from typing import NamedTuple
+from core.construct import connectBit, connectMove
+
+# elements with two terminals
+twoTerminalCodes = ('R', 'L', 'C', 'I', 'i', 'V', 'v', 'b')
+# elements that conduct, mesh currents and OP are not connected to anything.
+conductorCodes = ('.', ',', 'n', 'w', 'g', 'A')
+
+class Net(NamedTuple) :
+    name      : str
+    aliases   : tuple    # other node names of the net
+    terminals : tuple    # (element name, 'p' or 'n')
+class Branch(NamedTuple) :
+    '''A two-terminal element, p and n are names of the nets of its terminals.'''
+    name  : str
+    code  : str
+    value : str
+    pos   : tuple
+    p     : str
+    n     : str
+class Netlist(NamedTuple) :
+    nets     : tuple
+    branches : tuple
+    def net_of(self, name) :
+        '''Return the net named name, or the net that name is an alias of.'''
+        for net in self.nets :
+            if net.name == name or name in net.aliases : return net
+        raise KeyError(f'net {name} does not exist.')
+
+def make_netlist(circuitboard) :
+    '''Return the Netlist of a board.'''
+    Ae, C = circuitboard.elemArray, circuitboard.connectArray
+    positions = [pos for pos in circuitboard.occupiedPos
+                 if circuitboard.codeArray[pos] in conductorCodes + twoTerminalCodes]
+    # item k is the cell positions[k], or the p terminal of a two-terminal element.
+    # the n terminal of a two-terminal element is item nItem[k].
+    index = {pos : k for k, pos in enumerate(positions)}
+    parent = list(range(len(positions)))
+    nItem, pBit = {}, {}
+    for k, pos in enumerate(positions) :
+        if circuitboard.codeArray[pos] in twoTerminalCodes :
+            nItem[k] = len(parent)
+            parent.append(len(parent))
+            pBit[k] = connectBit[Ae[pos].direction]
+    def find(k) :
+        while parent[k] != k :
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+    def item(k, bit) :
+        if k in nItem and bit != pBit[k] : return nItem[k]
+        return k
+    for k, (i, j) in enumerate(positions) :
+        c = int(C[i, j])
+        for bit in range(4) :
+            if not c >> bit & 1 : continue
+            di, dj = connectMove[bit]
+            m = index.get((i + di, j + dj))
+            oppsite = (bit + 4) % 8
+            if m is None or not int(C[i + di, j + dj]) >> oppsite & 1 : continue
+            a, b = find(item(k, bit)), find(item(m, oppsite))
+            if a != b : parent[max(a, b)] = min(a, b)
+
+    names = make_elemNames(circuitboard, positions)
+    # members of every net, in the order nets are first met row by row.
+    members = {}
+    for k, pos in enumerate(positions) :
+        elemID, elemObj = names[k], Ae[pos]
+        if k in nItem :
+            members.setdefault(find(k), [[], False, []])[2].append((elemID, 'p'))
+            members.setdefault(find(nItem[k]), [[], False, []])[2].append((elemID, 'n'))
+            continue
+        netMembers = members.setdefault(find(k), [[], False, []])
+        code = circuitboard.codeArray[pos]
+        if code in ('n', 'w') : netMembers[0].append((code != 'n', elemID))
+        if code == 'g' or (code == 'w' and elemObj.isGround == 'T') : netMembers[1] = True
+    nets, netName = [], {}
+    unnamed = 0
+    for root, (nodeNames, isGround, terminals) in members.items() :
+        nodeNames = [name for _, name in sorted(nodeNames, key = lambda x : x[0])]
+        if not (nodeNames or isGround or terminals) : continue
+        if isGround : name = '0'
+        elif nodeNames : name, nodeNames = nodeNames[0], nodeNames[1:]
+        else :
+            unnamed += 1
+            name = f'N{unnamed}'
+        netName[root] = name
+        nets.append(Net(name, tuple(nodeNames), tuple(terminals)))
+    branches = []
+    for k, pos in enumerate(positions) :
+        if k not in nItem : continue
+        branches.append(Branch(names[k], str(circuitboard.codeArray[pos]), Ae[pos].value, pos,
+                               netName[find(k)], netName[find(nItem[k])]))
+    return Netlist(tuple(nets), tuple(branches))
+
+def make_elemNames(circuitboard, positions) :
+    '''Unique names of elements at positions, None for unnumbered wires.'''
+    names, count = [], {}
+    for pos in positions :
+        elemID = str(circuitboard.Ai[pos])
+        if elemID in ('..', ',,') :
+            names.append(None)
+            continue
+        count[elemID] = count.get(elemID, 0) + 1
+        names.append(elemID if count[elemID] == 1 else f'{elemID}_{count[elemID]}')
+    return names
+
+def to_json(netlist) :
+    '''Return the netlist as a JSON string.'''
+    return json.dumps({
+        'nets' : [{'name' : net.name, 'aliases' : list(net.aliases),
+                   'terminals' : [list(terminal) for terminal in net.terminals]}
+                  for net in netlist.nets],
+        'elements' : [{'name' : branch.name, 'type' : branch.code, 'value' : branch.value,
+                       'position' : list(branch.pos), 'p' : branch.p, 'n' : branch.n}
+                      for branch in netlist.branches],
+    }, ensure_ascii = False, indent = 2)
+
+# SPICE : name n+ n- value. Current sources drive current from n+ to n- through the
+# source, thus into the circuit at n-.
+def to_spice(netlist, title = 'circuit') :
+    '''\
+    Return the netlist in SPICE style. Values are written as they are labeled,
+    dependent sources and boxes are comments since what controls them is not known.'''
+    lines = [f'* {title}']
+    for branch in netlist.branches :
+        nodes = (branch.n, branch.p) if branch.code == 'I' else (branch.p, branch.n)
+        line = f'{branch.name} {nodes[0]} {nodes[1]} {branch.value or ""}'.rstrip()
+        if branch.code in ('i', 'v', 'b') : line = '* ' + line
+        lines.append(line)
+    lines.append('.end')
+    return '\n'.join(lines) + '\n'
+
+# extension of netlist files of each format
+netlistExtensions = {'json' : '.json', 'spice' : '.cir'}
+def write_netlist(circuitboard, filename, format = 'json', title = 'circuit') :
+    '''Write the netlist of a board in format ('json' or 'spice').'''
+    netlist = make_netlist(circuitboard)
+    content = to_spice(netlist, title) if format == 'spice' else to_json(netlist)
+    with open(filename, 'w', encoding = 'utf8') as outFile :
+        outFile.write(content)
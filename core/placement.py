@@ -0,0 +1,162 @@
+# Automatic label placement.
+#
+# Texts of a label (the value of an element, or the signs and text of a pm)
+# are moved together as a group. For each movable group, a few candidates are
+# tried : the original position, the other side of the element (RHS <-> LHS)
+# and small moves along the element. The candidate that overlaps the least
+# with elements, wires and labels already placed is chosen.
+#
+# Boxes and wires are held in a grid hash, thus finding what a candidate
+# overlaps only looks at its neighbourhood. Placing every label is linear in
+# label count as long as labels are not piled up in a few cells.
+#
+# Box : (x0, y0, x1, y1), x0 <= x1, y0 <= y1.
+
+# candidates (scale of c, shift of d), in order of preference.
+candidates = (
+    ( 1,    0), (-1,    0),
+    ( 1,  0.5), ( 1, -0.5),
+    (-1,  0.5), (-1, -0.5),
+    ( 1.4,  0), (-1.4,  0),
+)
+# prefer earlier candidates when overlaps are almost the same.
+preferencePenalty = 1
+
+
+class GridHash:
+    """Boxes and segments bucketed by the grid cells they touch."""
+
+    def __init__(self, cellSize=32):
+        self.cellSize = cellSize
+        self.cells = {}
+        self.boxes = []
+        self.segments = []
+
+    def _cellRange(self, box):
+        s = self.cellSize
+        x0, y0, x1, y1 = box
+        for cx in range(int(x0 // s), int(x1 // s) + 1):
+            for cy in range(int(y0 // s), int(y1 // s) + 1):
+                yield cx, cy
+
+    def insert_box(self, box):
+        self.boxes.append(box)
+        key = ('b', len(self.boxes) - 1)
+        for cell in self._cellRange(box):
+            self.cells.setdefault(cell, []).append(key)
+
+    def insert_segment(self, x1, y1, x2, y2, width=3):
+        self.segments.append((x1, y1, x2, y2, width))
+        key = ('s', len(self.segments) - 1)
+        # walk the segment by steps shorter than a cell
+        length = max(abs(x2 - x1), abs(y2 - y1))
+        steps = int(length // (self.cellSize / 2)) + 1
+        touched = set()
+        for k in range(steps + 1):
+            x = x1 + (x2 - x1) * k / steps
+            y = y1 + (y2 - y1) * k / steps
+            touched.update(self._cellRange((x - width, y - width, x + width, y + width)))
+        for cell in touched:
+            self.cells.setdefault(cell, []).append(key)
+
+    def keys(self, box):
+        """Return keys ('b' or 's', index) of boxes and segments in cells box touches.
+        Only cells that hold something are looked at when box covers more cells."""
+        keys = set()
+        s = self.cellSize
+        x0, y0, x1, y1 = box
+        cellCount = (int(x1 // s) - int(x0 // s) + 1) * (int(y1 // s) - int(y0 // s) + 1)
+        if cellCount > len(self.cells):
+            for (cx, cy), cellKeys in self.cells.items():
+                if x0 // s <= cx <= x1 // s and y0 // s <= cy <= y1 // s:
+                    keys.update(cellKeys)
+        else:
+            for cell in self._cellRange(box):
+                keys.update(self.cells.get(cell, ()))
+        return keys
+
+    def overlap(self, box):
+        """Return overlapping area of box with every box and segment held."""
+        area = 0
+        for kind, n in self.keys(box):
+            if kind == 'b':
+                area += box_overlap(box, self.boxes[n])
+            else:
+                x1, y1, x2, y2, width = self.segments[n]
+                area += clip_length(box, x1, y1, x2, y2) * width
+        return area
+
+
+def box_overlap(box1, box2):
+    w = min(box1[2], box2[2]) - max(box1[0], box2[0])
+    h = min(box1[3], box2[3]) - max(box1[1], box2[1])
+    if w <= 0 or h <= 0:
+        return 0
+    return w * h
+
+
+def clip_length(box, x1, y1, x2, y2):
+    """Length of segment inside box."""
+    clipped = clip_segment(box, x1, y1, x2, y2)
+    if clipped is None:
+        return 0
+    t0, t1 = clipped
+    return (t1 - t0) * ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
+
+
+def clip_segment(box, x1, y1, x2, y2):
+    """Return (t0, t1), the part of segment inside box is from t0 to t1 of it
+    (Liang-Barsky clipping), None if no part of it is inside box."""
+    x0, y0, xm, ym = box
+    dx, dy = x2 - x1, y2 - y1
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x1 - x0), (dx, xm - x1), (-dy, y1 - y0), (dy, ym - y1)):
+        if p == 0:
+            if q < 0:
+                return None
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+    if t0 > t1 or (t0 == t1 and (dx or dy)):
+        return None
+    return t0, t1
+
+
+def place_labels(groups, boxOf, obstacles, cellSize=32):
+    """
+    groups: list of (movable, members). members is a list of (key, c, d).
+    boxOf: function (key, c, d) -> box of that text at c, d.
+    obstacles: GridHash with boxes of elements and segments of wires.
+
+    Fixed groups are put first, movable groups are placed in order.
+    Return a dict key -> (c, d) for every member.
+    """
+    placed = {}
+    if obstacles is None:
+        obstacles = GridHash(cellSize)
+    for movable, members in groups:
+        if not movable:
+            for key, c, d in members:
+                placed[key] = c, d
+                obstacles.insert_box(boxOf(key, c, d))
+    for movable, members in groups:
+        if not movable:
+            continue
+        best, bestCost = None, None
+        for n, (cScale, dShift) in enumerate(candidates):
+            moved = [(key, c * cScale, d + dShift) for key, c, d in members]
+            boxes = [boxOf(key, c, d) for key, c, d in moved]
+            cost = sum(obstacles.overlap(box) for box in boxes) \
+                + n * preferencePenalty
+            if bestCost is None or cost < bestCost:
+                best, bestCost = (moved, boxes), cost
+            if cost == 0:
+                break
+        moved, boxes = best
+        for (key, c, d), box in zip(moved, boxes):
+            placed[key] = c, d
+            obstacles.insert_box(box)
+    return placed
@@ -1,8 +1,10 @@
 import re
+import hashlib
 from lxml import etree
 from copy import deepcopy
 import numpy as np
 from core.pathparser import pathparser
+from core.theme import make_themeCss
 
 namespace = '{http://www.w3.org/2000/svg}'
 
@@ -11,9 +13,44 @@ def formatFloat(f):
     return f'{f:.2f}'.rstrip('0').rstrip('.')
 
 
-def postprocessing(filename='output.svg'):
-    tree = etree.parse(filename)
-    root = tree.getroot()
+def glyphID(d, usedIDs):
+    """Return an id derived from the path data of a glyph, so that the id of
+    a glyph does not depend on the order or the number of texts in the figure.
+    Only letters are used, the float simplification below never touches it."""
+    digest = hashlib.sha1(d.encode('utf8')).hexdigest()
+    letters = ''.join(chr(ord('a') + int(h, 16)) for h in digest)
+    length = 6
+    while usedIDs.get('t' + letters[:length], d) != d:
+        length += 1
+    usedIDs['t' + letters[:length]] = d
+    return 't' + letters[:length]
+
+
+def postprocessing(filename='output.svg', theme='light', darkTheme=None,
+                   inputHash=None):
+    """Optimize SVG file size. Colours refer to CSS custom properties,
+    which are assigned by 'theme' (and 'darkTheme' for dark color scheme).
+    Output is byte-identical for identical input. if inputHash is given, it is
+    embedded as 'data-input-hash' attribute of the svg tag."""
+    root = etree.parse(filename).getroot()
+    optimize(root)
+    output = serialize(root, theme, darkTheme, inputHash)
+    with open(filename, 'w') as outFile:
+        outFile.write(output)
+
+
+def unescape_styles(string):
+    """Write '>' of css selectors in <style> as is, lxml escapes it as '&gt;'.
+    Texts and attributes out of <style> are left escaped."""
+    return re.sub(r'(<style(?: [^>]*)?>)(.*?)(</style>)',
+                  lambda m: m.group(1) + m.group(2).replace('&gt;', '>') + m.group(3),
+                  string, flags=re.S)
+
+
+def optimize(root):
+    """Optimize the tree of an svg file of svgGenerator in place : texts become
+    glyphs in <defs>, shapes become <use> of components, wires are merged and
+    the css rules needed are set. See postprocessing."""
     defs = root.find(f'{namespace}defs')
 
     for child in root.findall(f'.//{namespace}g[@id="text_1"]/{namespace}g'):
@@ -210,7 +247,8 @@ def postprocessing(filename='output.svg'):
         start, end = coord.split(' ')
         start_x, start_y, end_x, end_y = map(
             float, start.split(',')+end.split(','))
-        wire_list.append(((start_x, start_y), (end_x, end_y)))
+        wire_class = path.attrib.get('class', '')
+        wire_list.append(((start_x, start_y), (end_x, end_y), wire_class))
 
     # print(len(wire_list))
 
@@ -228,16 +266,18 @@ def postprocessing(filename='output.svg'):
             # y = sx + b
             # b = y - sx
             return point[1] - slope*point[0]
-        current_start, current_end = wire_list[current]
+        current_start, current_end, current_class = wire_list[current]
         current_slope = getSlope(current_start, current_end)  # dy/dx
         current_intercept = getIntercept(current_slope, current_start)
         new_wire = None
         for other in range(current+1, len(wire_list)):
-            start, end = wire_list[other]
+            start, end, wire_class = wire_list[other]
             slope = getSlope(start, end)  # dy/dx
             intercept = getIntercept(slope, start)
 
-            if (current_slope == slope or abs(current_slope - slope) < 0.000001) and \
+            # wires of different class (color) are never merged
+            if wire_class == current_class and \
+                    (current_slope == slope or abs(current_slope - slope) < 0.000001) and \
                     abs(current_intercept - intercept) < 0.000001:
                 point_list = np.array([start, end, current_start, current_end])
                 if slope == float('inf'):  # vertical, x same
@@ -253,7 +293,7 @@ def postprocessing(filename='output.svg'):
                 # two lines are not overlap
                 if not sort_seq[0]+sort_seq[1] in [1, 5]:
                     new_wire = (point_list[sort_seq[0]],
-                                point_list[sort_seq[3]])
+                                point_list[sort_seq[3]], wire_class)
 
             if new_wire is not None:
                 del wire_list[other]
@@ -264,16 +304,18 @@ def postprocessing(filename='output.svg'):
         current += 1
     # print(len(wire_list))
     new_wire_list = []
-    for wire_coord in wire_list:
+    for *wire_coord, wire_class in wire_list:
         start_x, start_y, end_x, end_y = [
             formatFloat(coord) for coord_pair in wire_coord for coord in coord_pair]
         new_wire = etree.Element(
             f'{namespace}path', {'d': f'M{start_x},{start_y} {end_x},{end_y}'})
+        if wire_class:
+            new_wire.attrib['class'] = wire_class
         new_wire_list.append(new_wire)
     root[:0] = new_wire_list
 
     # remove same element, use `use` tag instead
-    i = 0
+    usedIDs = {}
     text_g = root.find(f'.//{namespace}g[@id="txt"]')
     text_container = etree.SubElement(
         root, 'g', {'transform': 'scale(3125e-6 -3125e-6)'})
@@ -286,7 +328,8 @@ def postprocessing(filename='output.svg'):
             parent = path.getparent()
             parent.getparent().remove(parent)
             continue
-        path.attrib['id'] = f'txt{i}'
+        pathID = glyphID(d, usedIDs)
+        path.attrib['id'] = pathID
         finds = text_g.findall(f'.//{namespace}g/{namespace}path[@d="{d}"]')
         if len(finds) == 0:
             continue
@@ -300,13 +343,13 @@ def postprocessing(filename='output.svg'):
                 x = formatFloat(translate[0]/0.7)
                 y = formatFloat(translate[1]/0.7)
                 use = etree.SubElement(small_text_container, f'{namespace}use',
-                                       {'href': f'#txt{i}',
+                                       {'href': f'#{pathID}',
                                         'x': x, 'y': y})
             else:
                 x = formatFloat(translate[0])
                 y = formatFloat(translate[1])
                 use = etree.SubElement(text_container, f'{namespace}use',
-                                       {'href': f'#txt{i}',
+                                       {'href': f'#{pathID}',
                                         'x': x, 'y': y})
             text_g.remove(parent)
 
@@ -315,7 +358,6 @@ def postprocessing(filename='output.svg'):
             del path.attrib['transform']
             #path.attrib['class'] = 's'
         text_g.append(path)
-        i += 1
 
     if len(text_g.getchildren()) == 0:
         text_g.getparent().remove(text_g)
@@ -334,31 +376,33 @@ def postprocessing(filename='output.svg'):
         root.remove(defs)
 
     # set css style
-    style.text = "*{fill:none;stroke:black}"
+    style.text = "*{fill:none;stroke:var(--ink)}"
     if len(root.findall(f'{namespace}path')) > 0:
         style.text += "svg>path{stroke-linecap:round}"
     if len(root.findall(f'.//{namespace}path')) > 0:
         style.text += "path{stroke-width:3}"
     if text_g is not None and len(text_g.findall(f'.//{namespace}path')) > 0:
-        style.text += "#txt path{fill:black;stroke-width:0}"
+        style.text += "#txt path{fill:var(--ink);stroke-width:0}"
     if len(root.findall(f'.//*[@class="v"]')) > 0:
-        style.text += ".v>*{stroke:#d12938;stroke-width:2.55}"
+        style.text += ".v>*{stroke:var(--source);stroke-width:2.55}"
     if len(root.findall(f'.//*[@class="v"]/{namespace}path')) > 0:
-        style.text += ".v>path{stroke-width:1.5;fill:#7b1d23}"
+        style.text += ".v>path{stroke-width:1.5;fill:var(--accent)}"
     if len(root.findall(f'.//*[@class="c"]')) > 0:
-        style.text += ".c>*{stroke:#7b1d23;stroke-width:2.55}"
+        style.text += ".c>*{stroke:var(--accent);stroke-width:2.55}"
     if len(root.findall(f'.//*[@class="c"]/{namespace}path')) > 0:
-        style.text += ".c>path{stroke-width:0;fill:#7b1d23}"
+        style.text += ".c>path{stroke-width:0;fill:var(--accent)}"
     if len(root.findall(f'.//*[@id="ground"]/{namespace}path')) > 0:
         style.text += "#ground>path{stroke-width:2.61;stroke-linecap:round}"
+    if len(root.findall(f'{namespace}path[@class="W"]')) > 0:
+        style.text += ".W{stroke:var(--wire)}"
     current_dir = root.xpath(f'.//*[@id="current_dir"]')
     mesh_current = root.xpath(f'.//*[@id="mesh_current"]')
     if len(current_dir) > 0 and len(mesh_current) > 0:
-        style.text += "#current_dir,#mesh_current{stroke:none;fill:#7b1d23}"
+        style.text += "#current_dir,#mesh_current{stroke:none;fill:var(--accent)}"
     elif len(current_dir) > 0:
-        current_dir[0].attrib['style'] = "stroke:none;fill:#7b1d23"
+        current_dir[0].attrib['style'] = "stroke:none;fill:var(--accent)"
     elif len(mesh_current) > 0:
-        mesh_current[0].attrib['style'] = "stroke:none;fill:#7b1d23"
+        mesh_current[0].attrib['style'] = "stroke:none;fill:var(--accent)"
 
     root[:0] = [style]
 
@@ -389,9 +433,14 @@ def postprocessing(filename='output.svg'):
                     if use.attrib['transform'] == "":
                         del use.attrib['transform']
 
+
+def serialize(root, theme='light', darkTheme=None, inputHash=None):
+    """Return the text of an optimized svg tree : spaces are stripped, floats are
+    simplified, theme rules are put before the style of the figure. See
+    postprocessing."""
+    themeCss = make_themeCss(theme, darkTheme)
     et = etree.ElementTree(root)
-    string = etree.tostring(et).decode('utf8')
-    string = string.replace('&gt;', '>')
+    string = unescape_styles(etree.tostring(et).decode('utf8'))
 
     # strip space like char(' ', '\n')
     string = string.replace('\n', '')
@@ -400,6 +449,8 @@ def postprocessing(filename='output.svg'):
     string = re.sub(r' ([{}();:,"])', r'\1', string)
     string = string.replace(';}', '}')
     string = string.replace('> <', '><')
+    # fallback colours of template are not needed, theme rules are always set
+    string = re.sub(r'var\((--[a-z]+),[^)]*\)', r'var(\1)', string)
 
     # simply float
     output = ""
@@ -438,5 +489,9 @@ def postprocessing(filename='output.svg'):
         isDecimal = False
         numberString = ""
 
-    with open(filename, 'w') as outFile:
-        outFile.write(output)
+    # theme rules are put in their own style element, so that variants of
+    # this figure only need to swap it (see core.theme).
+    output = output.replace('<style>', f'<style>{themeCss}</style><style>', 1)
+    if inputHash is not None:
+        output = output.replace('<svg ', f'<svg data-input-hash="{inputHash}" ', 1)
+    return output
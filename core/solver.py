@@ -0,0 +1,191 @@
+# Modified nodal analysis (MNA) of a netlist, see netlist.
+#
+# Unknowns are voltages of nets (besides the reference net) and currents of branches
+# that are stamped as impedances : R, L, b, voltage sources and elements whose label
+# is in Ω. Capacitors are stamped as admittances unless labeled in Ω. Only the kind
+# of the element and the unit of its label choose the stamp, not the value.
+#     impedance Z  : Vp - Vn - Z I = 0, I leaves net p and enters net n.
+#     admittance Y : Y (Vp - Vn) leaves net p and enters net n.
+#     V source     : Vp - Vn = V.
+#     I source     : drives current I into net p (see netlist).
+# At DC (omega = 0) inductors are shorts and capacitors are open.
+#
+# Values are parsed from labels (3kΩ, 2\muF, 3-j4Ω, 10∠30V, 10!p{30}V), or given by
+# params. Every value and omega can be an array, they are broadcast together and every
+# point is solved by one batched np.linalg.solve. Stamps are kept as (row, column,
+# value) lists and assembled with np.add.at, the system is dense for solve since
+# scipy is not a dependency.
+import re
+import cmath
+import numpy as np
+from typing import NamedTuple
+
+# prefixes and units of values, units are removed. F and H are units in either case
+# right after a number (2F, 2f), femto needs a unit after it (2fF).
+valuePrefixes = {'\\mu' : 1e-6, 'T' : 1e12, 'G' : 1e9, 'M' : 1e6, 'k' : 1e3, 'm' : 1e-3,
+                 'u' : 1e-6, 'µ' : 1e-6, 'μ' : 1e-6, 'n' : 1e-9, 'p' : 1e-12, 'f' : 1e-15}
+valueUnits = {'Ω' : 'Ω', 'ohm' : 'Ω', 'F' : 'F', 'f' : 'F', 'H' : 'H', 'h' : 'H',
+              'V' : 'V', 'A' : 'A', 'S' : 'S'}
+def parse_value(valueStr) :
+    '''\
+    Return the number of a label, complex for j impedances and phasors.
+    Raise ValueError if the label is not a number.'''
+    return parse_quantity(valueStr)[0]
+def parse_quantity(valueStr) :
+    '''Return (number, unit) of a label, unit is one of valueUnits values or None.'''
+    s = re.sub(r'\\[,;:! ]|\s', '', valueStr)
+    s = re.sub(r'!p\{(.*?)\}', r'∠\1', s).replace('°', '').replace('{', '').replace('}', '')
+    unit = None
+    for unitStr, unitName in valueUnits.items() :
+        if s.endswith(unitStr) :
+            s, unit = s[:-len(unitStr)], unitName
+            break
+    scale = 1
+    for prefix, prefixScale in valuePrefixes.items() :
+        if s.endswith(prefix) and s != prefix :
+            s, scale = s[:-len(prefix)], prefixScale
+            break
+    try :
+        if '∠' in s :
+            magnitude, angle = s.split('∠')
+            value = float(magnitude) * cmath.exp(1j * np.deg2rad(float(angle)))
+        elif 'j' in s :
+            # j4 -> 4j, 3-j4 -> 3-4j
+            s = re.sub(r'j([\d.eE]*)', lambda m : (m.group(1) or '1') + 'j', s)
+            value = complex(s)
+        else :
+            value = float(s)
+    except ValueError :
+        raise ValueError(f'{valueStr} is not a numeric value.') from None
+    return value * scale, unit
+
+class Solution(NamedTuple) :
+    '''\
+    Voltages of nets (by name and alias) and currents of branches, from p through
+    the element to n. Each is an array of the broadcast shape of values and omega.'''
+    voltages : dict
+    currents : dict
+
+def solve(netlist, omega = 0, params = None, ground = None) :
+    '''\
+    Solve a netlist. omega is the angular frequency, 0 for DC. params is
+    {element name : value}, values are numbers, arrays or labels, elements not in
+    params take values of their labels. ground is the reference net, the net '0' or
+    the first net by default.'''
+    params = {} if params is None else params
+    if not netlist.nets : raise ValueError('netlist has no net.')
+    if ground is None : ground = '0' if any(net.name == '0' for net in netlist.nets) else netlist.nets[0].name
+    ground = netlist.net_of(ground).name
+    # unknowns : nets besides ground, then currents of impedance branches.
+    netIndex = {}
+    for net in netlist.nets :
+        if net.name != ground : netIndex[net.name] = len(netIndex)
+    values = {}
+    # branches labeled in Ω, they are stamped as impedances
+    inOhms = set()
+    for branch in netlist.branches :
+        if branch.code in ('i', 'v') :
+            raise ValueError(f'dependent source {branch.name} is not supported, '
+                             f'replace it by an independent source.')
+        value = params.get(branch.name, branch.value)
+        if value is None : raise ValueError(f'{branch.name} has no value, label it or give it by params.')
+        if isinstance(value, str) :
+            try :
+                value, unit = parse_quantity(value)
+            except ValueError as error :
+                raise ValueError(f'{branch.name} : {error}') from None
+            if unit == 'Ω' : inOhms.add(branch.name)
+        values[branch.name] = np.asarray(value)
+    omega = np.asarray(omega)
+    shape = np.broadcast_shapes(omega.shape, *(value.shape for value in values.values()))
+
+    rows, columns, entries = [], [], []
+    rhsRows, rhsEntries = [], []
+    def stamp(row, column, entry) :
+        if row is not None and column is not None :
+            rows.append(row); columns.append(column); entries.append(entry)
+    def stamp_rhs(row, entry) :
+        if row is not None :
+            rhsRows.append(row); rhsEntries.append(entry)
+    # currents : element name -> function of the solution vector
+    currents = {}
+    N = len(netIndex)
+    for branch in netlist.branches :
+        p, n, value = netIndex.get(branch.p), netIndex.get(branch.n), values[branch.name]
+        isImpedance = branch.name in inOhms
+        if branch.code == 'I' :
+            stamp_rhs(p, value)
+            stamp_rhs(n, -value)
+            currents[branch.name] = lambda x, value = value : np.broadcast_to(-value, x.shape[:-1]).copy()
+        elif branch.code == 'C' and not isImpedance :
+            admittance = 1j * omega * value
+            for row, sign in ((p, 1), (n, -1)) :
+                stamp(row, p, sign * admittance)
+                stamp(row, n, -sign * admittance)
+            currents[branch.name] = lambda x, p = p, n = n, admittance = admittance : \
+                admittance * (voltage_of(x, p) - voltage_of(x, n))
+        else :
+            k = N
+            N += 1
+            stamp(p, k, 1)
+            stamp(n, k, -1)
+            stamp(k, p, 1)
+            stamp(k, n, -1)
+            if branch.code == 'V' :
+                stamp_rhs(k, value)
+            else :
+                if branch.code == 'L' and not isImpedance : impedance = 1j * omega * value
+                else :                                      impedance = value
+                stamp(k, k, -impedance)
+            currents[branch.name] = lambda x, k = k : x[..., k]
+
+    A = np.zeros(shape + (N * N,), dtype = complex)
+    b = np.zeros(shape + (N,), dtype = complex)
+    if entries :
+        np.add.at(A, (Ellipsis, np.array(rows) * N + np.array(columns)),
+                  np.stack(np.broadcast_arrays(*entries, np.zeros(shape)), axis = -1)[..., :-1])
+    if rhsEntries :
+        np.add.at(b, (Ellipsis, np.array(rhsRows)),
+                  np.stack(np.broadcast_arrays(*rhsEntries, np.zeros(shape)), axis = -1)[..., :-1])
+    try :
+        x = np.linalg.solve(A.reshape(shape + (N, N)), b[..., None])[..., 0]
+    except np.linalg.LinAlgError :
+        raise ValueError('circuit can not be solved, every net must have a path to '
+                         f'{ground} and voltage sources can not form a loop.') from None
+    if not np.iscomplexobj(omega) and np.all(omega == 0) and not any(np.iscomplexobj(v) for v in values.values()) :
+        x = x.real
+    voltages = {}
+    for net in netlist.nets :
+        voltage = voltage_of(x, netIndex.get(net.name))
+        for name in (net.name,) + net.aliases : voltages[name] = voltage
+    return Solution(voltages, {name : current(x) for name, current in currents.items()})
+
+def voltage_of(x, k) :
+    '''Voltage of unknown k in solutions x, k is None for the reference net.'''
+    return np.zeros(x.shape[:-1], dtype = x.dtype) if k is None else x[..., k]
+
+def format_value(value, unit = '') :
+    '''Label of a number with a prefix, complex numbers are phasors (magnitude∠angle).'''
+    value = complex(value)
+    if abs(value.imag) > 1e-12 * abs(value) :
+        return f'{format_value(abs(value))}!p{{{np.rad2deg(cmath.phase(value)):.3g}}}{unit}'
+    value = value.real
+    for prefix in ('T', 'G', 'M', 'k', '', 'm', 'u', 'n', 'p') :
+        scale = valuePrefixes.get(prefix, 1)
+        if abs(value) >= scale : return f'{value / scale:.3g}{"μ" if prefix == "u" else prefix}{unit}'
+    return f'{value:.3g}{unit}'
+
+def solution_sheet(netlist, solution, index = (), currents = True) :
+    '''\
+    Return a label setting sheet of solution[index] : voltages as values of nodes (n),
+    and currents as values of elements if currents is True.'''
+    lines = []
+    for net in netlist.nets :
+        for name in (net.name,) + net.aliases :
+            if name[0] == 'n' : lines.append(f'{name} : value = {format_value(solution.voltages[name][index], "V")}')
+    if currents :
+        for branch in netlist.branches :
+            if branch.name not in solution.currents or '_' in branch.name : continue
+            current = solution.currents[branch.name][index]
+            lines.append(f'{branch.name} : value = {format_value(current, "A")}')
+    return '\n'.join(lines) + '\n#'
@@ -0,0 +1,289 @@
+# Streaming render of tall boards.
+#
+# The board is made and drawn in horizontal bands of rows. A band board has the rows
+# of its band and CircuitBoard.editRadius rows around it, connections, anchors and
+# nodes of a cell only depend on cells that near, thus cells of the band are the same
+# as those of the whole board. Svg codes of the band (wires clipped at its border) are
+# rendered and optimized by postprocessing, then the elements are written to the file
+# one by one. Peak memory depends on band size, not on board size.
+#
+# Settings : element names are found by one pass over the circuit string (names are 2
+# characters, thus there are only a few of them). Commands are resolved against them
+# before any band is made, a command for a name is applied to the last element with
+# the name, and a command for a container to every element of it, the same as
+# CircuitBoard. Each band board applies commands of elements it has. Destinations of
+# pm labels are found the same way, thus they can be out of the band board.
+#
+# Output : glyphs of texts and components (resistor, ground...) are written in <defs>
+# at the end, css rules of every band are merged, the viewBox is patched at the end.
+# Elements and their labels are drawn with the band of their row, a pm label with a
+# destination too. Wires cut by band borders are not merged, labels are not moved by
+# autoPlace. The
+# file is written next to the target and replaces it once it is complete, thus a
+# failed render keeps the previous file.
+import os
+import re
+import inspect
+import tempfile
+from lxml import etree
+from core.svgkit import svgGenerator
+from core.convert import update_drawingCache, make_convertContext, remove_empty
+from core.placement import clip_segment
+from core.construct import (CircuitBoard, Container, Element, PrimaryElement, Node,
+                            elemClasses, report_errors, tokenize_setting)
+from core.postprocessing import postprocessing, glyphID, formatFloat, namespace
+from core.theme import make_themeCss
+
+# setters of elements called by container settings, see Container.
+containerSetters = {
+    'values'     : Element.set_value,
+    'valuePoss'  : Element.set_valuePos,
+    'directions' : PrimaryElement.set_direction,
+    'fills'      : Node.set_fill,
+}
+
+def iter_rows(circuitCodeStr) :
+    '''Rows of a circuit string, one by one.'''
+    start = 0
+    while start <= len(circuitCodeStr) :
+        end = circuitCodeStr.find('\n', start)
+        if end < 0 : end = len(circuitCodeStr)
+        row = circuitCodeStr[start:end]
+        if row[:1] == '#' : return
+        yield row
+        start = end + 1
+
+def scan_names(circuitCodeStr) :
+    '''\
+    Return the number of rows, last position of every element name and the number of
+    elements with each name.'''
+    lastPos, counts = {}, {}
+    Nv = 0
+    for i, row in enumerate(iter_rows(circuitCodeStr)) :
+        Nv = i + 1
+        for j in range(0, len(row) - 1, 3) :
+            elemID = row[j:j+2]
+            if elemID[0] not in elemClasses or elemID[1] == ' ' : continue
+            lastPos[elemID] = i, j // 3
+            counts[elemID] = counts.get(elemID, 0) + 1
+    return Nv, lastPos, counts
+
+def resolve_setting(settingSheetStr, lastPos, counts) :
+    '''\
+    Resolve commands of a setting sheet against element names, return commands and errors :
+        command : (line, column, name, setter, arguments), setter is a function of an element.
+        error   : (line, column, message).
+    The destination of a pm label must be an element, it is the last one with the name.'''
+    commands, errors = tokenize_setting(settingSheetStr)
+    resolved = []
+    for lineNo, objName, setting, arguments, columns in commands :
+        method, settingClass = CircuitBoard._settingMethod.get(setting, (None, None))
+        # containers are made for codes of at least 2 elements, see CircuitBoard._make_containerRef
+        members = sorted((name for name in counts if name[0] == objName), key = lambda x : x[1])
+        isContainer = objName in CircuitBoard._containerCodes and \
+                      sum(counts[name] for name in members) >= 2
+        targetClass = Container if isContainer else \
+                      elemClasses[objName[0]] if objName in lastPos else None
+        if settingClass is None :
+            errors.append((lineNo, columns[1], f'{setting} is not an available setting.'))
+        if targetClass is None :
+            errors.append((lineNo, columns[0], f'element or container {objName} does not exist.'))
+        if settingClass is None or targetClass is None : continue
+        if not issubclass(targetClass, settingClass) :
+            errors.append((lineNo, columns[1], f'{objName} have no setting about {setting}'))
+            continue
+        try :
+            inspect.signature(method).bind(None, *arguments)
+        except TypeError :
+            parameters = inspect.signature(method).parameters
+            errors.append((lineNo, columns[1], f'{setting} takes {len(parameters) - 1} arguments, '
+                                               f'got {len(arguments)}'))
+            continue
+        column = (columns[2:] or columns[1:])[0]
+        if setting == 'pm' and arguments[1] not in ('+', '-') and arguments[1] not in lastPos :
+            errors.append((lineNo, (columns[3:] or [column])[0],
+                           f'pm destination {arguments[1]} does not exist.'))
+            continue
+        if not isContainer :
+            resolved.append((lineNo, column, objName, method, arguments))
+            continue
+        # storage of the container, an element is in it once for each element with its name
+        storage = [name for name in members for _ in range(counts[name])]
+        if setting == 'allValueMove' :
+            resolved += [(lineNo, column, name, Element.set_valueMove, arguments) for name in storage]
+            continue
+        if len(arguments) < len(storage) :
+            print(f'warning : For container "{objName}", arguments provided are not enough for every element in the storage.')
+        if len(arguments) > len(storage) :
+            errors.append((lineNo, column, f'Too many arguments are provided for container "{objName}"'))
+            continue
+        resolved += [(lineNo, column, name, containerSetters[setting], [argument])
+                     for name, argument in zip(storage, arguments)]
+    return resolved, errors
+
+def make_bandBoard(rows, start, commands, autoNode, destinations = {}) :
+    '''\
+    Return the board of rows, the first of them is row start of the whole board.
+    commands are resolved commands of elements in rows, with their positions.
+    destinations are positions of pm destinations in the whole board, by name.'''
+    try :
+        board = CircuitBoard('\n'.join(rows) + '\n#', '#', autoNode = autoNode)
+    except ValueError as error :
+        # lines of the band to lines of the whole circuit string
+        message = re.sub(r'line (\d+)', lambda m : f'line {int(m.group(1)) + start}', str(error))
+        raise ValueError(message) from None
+    errors = []
+    for lineNo, column, (i, j), method, arguments in commands :
+        try :
+            method(board.Ae[i - start, j], *arguments)
+        except (ValueError, IndexError) as error :
+            errors.append((lineNo, column, str(error)))
+    report_errors('setting sheet is malformed', errors)
+    board.make_anchorAndNode()
+    # pm labels find destinations by name, those out of the band are out of the board
+    for name, (i, j) in destinations.items() :
+        board.namePos[name] = i - start, j
+    return board
+
+def band_svgCodes(board, start, bandStart, bandEnd, blockWidth) :
+    '''\
+    svg codes of rows bandStart ~ bandEnd-1 of a band board, the first row of the board
+    is row start. Coordinates are those of the whole board. Codes of an element and its
+    labels are those of the band of its row, wires are clipped at the band.'''
+    offset = start * blockWidth
+    y0, y1 = (bandStart - start - 0.5) * blockWidth, (bandEnd - start - 0.5) * blockWidth
+    # codes by position, the same as to_svgCodes
+    codeCache = update_drawingCache(board).codes_of(make_convertContext(blockWidth = blockWidth))
+    elemCodes, textCodes = [], []
+    for pos in board.occupiedPos :
+        codes = codeCache.codes.get(pos)
+        if codes is None or not bandStart <= pos[0] + start < bandEnd : continue
+        elemCodes += codes[0]
+        textCodes += codes[2]
+    remove_empty(elemCodes)
+    wireCodes = []
+    for _, elemCode, x1, x2, wy1, wy2 in codeCache.sortedWires :
+        clipped = clip_segment((min(x1, x2), y0, max(x1, x2), y1), x1, wy1, x2, wy2)
+        if clipped is None : continue
+        t0, t1 = clipped
+        if t0 == t1 : continue
+        wireCodes.append(('e', elemCode, x1 + (x2 - x1) * t0, x1 + (x2 - x1) * t1,
+                          wy1 + (wy2 - wy1) * t0 + offset, wy1 + (wy2 - wy1) * t1 + offset))
+    return [code[:3] + (code[3] + offset,) + code[4:] for code in elemCodes] + wireCodes + \
+           [code[:3] + (code[3] + offset,) + code[4:] for code in textCodes]
+
+class SvgStreamWriter :
+    '''\
+    Write an optimized svg file from optimized svg roots of its parts, one by one.
+    Elements of parts are written when they are added, glyphs, components and css
+    rules are merged and written by close, the viewBox is patched by close. The file
+    is binary, thus the offset of the viewBox is a byte offset.'''
+    # space kept for the viewBox
+    viewBoxWidth = 80
+    def __init__(self, filename, theme = 'light', darkTheme = None, inputHash = None) :
+        self.file = open(filename, 'wb')
+        hashAttribute = '' if inputHash is None else f' data-input-hash="{inputHash}"'
+        self._write(f'<svg{hashAttribute} xmlns="http://www.w3.org/2000/svg" '
+                    'xmlns:xlink="http://www.w3.org/1999/xlink" viewBox="')
+        self.viewBoxOffset = self.file.tell()
+        self._write(' ' * self.viewBoxWidth + f'><style>{make_themeCss(theme, darkTheme)}</style>')
+        self.viewBox = None
+        # id -> serialized component or glyph, glyphs also by path data for glyphID
+        self.components = {}
+        self.glyphPaths, self.glyphs = {}, {}
+        self.rules = []
+
+    def add(self, root) :
+        x, y, w, h = (float(v) for v in root.get('viewBox').replace(',', ' ').split())
+        if self.viewBox is None : self.viewBox = x, y, x + w, y + h
+        else :
+            x0, y0, x1, y1 = self.viewBox
+            self.viewBox = min(x0, x), min(y0, y), max(x1, x + w), max(y1, y + h)
+        renamed = {}
+        for component in root.findall(f'{namespace}defs/*') :
+            if component.get('id') != 'txt' :
+                if component.get('id') not in self.components :
+                    self.components[component.get('id')] = self._tostring(component)
+                continue
+            # glyphs are merged by path data, ids that mean other glyphs are renamed.
+            for path in component :
+                pathID, d = path.get('id'), path.get('d')
+                if self.glyphs.get(pathID, d) != d :
+                    path.attrib['id'] = glyphID(d, self.glyphs)
+                    renamed[f'#{pathID}'] = '#' + path.get('id')
+                self.glyphs[path.get('id')] = d
+                if path.get('id') not in self.glyphPaths :
+                    self.glyphPaths[path.get('id')] = self._tostring(path)
+        for rule in re.findall(r'[^{}]+\{[^{}]*\}', root.findall(f'{namespace}style')[-1].text or '') :
+            if rule not in self.rules : self.rules.append(rule)
+        for child in root :
+            if child.tag in (f'{namespace}style', f'{namespace}defs') : continue
+            for use in child.iter(f'{namespace}use') :
+                if use.get('href') in renamed : use.attrib['href'] = renamed[use.get('href')]
+            self._write(self._tostring(child))
+
+    def _write(self, text) :
+        self.file.write(text.encode('utf8'))
+
+    def _tostring(self, elem) :
+        # namespaces are declared by <svg>
+        return re.sub(r' xmlns(:\w+)?="[^"]*"', '', etree.tostring(elem).decode('utf8'))
+
+    def close(self) :
+        defs = ''.join(self.components.values())
+        if self.glyphPaths : defs += '<g id="txt">' + ''.join(self.glyphPaths.values()) + '</g>'
+        if defs : self._write(f'<defs>{defs}</defs>')
+        self._write('<style>' + ''.join(self.rules) + '</style></svg>')
+        x0, y0, x1, y1 = self.viewBox or (0, 0, 0, 0)
+        viewBox = ' '.join(formatFloat(v) for v in (x0, y0, x1 - x0, y1 - y0)) + '"'
+        self.file.seek(self.viewBoxOffset)
+        self._write(viewBox.ljust(self.viewBoxWidth))
+        self.file.close()
+
+def render_stream(circuitCodeStr, settingSheetStr, filename, * , bandRows = 256,
+                  autoNode = True, blockWidth = 6, generatorSetting = None,
+                  theme = 'light', darkTheme = None, inputHash = None) :
+    '''Render a circuit band by band into filename, return the filename.'''
+    if generatorSetting is None : generatorSetting = {'unit': 8}
+    generatorSetting = dict(generatorSetting, autoPlace = False)
+    Nv, lastPos, counts = scan_names(circuitCodeStr)
+    commands, errors = resolve_setting(settingSheetStr, lastPos, counts)
+    report_errors('setting sheet is malformed', errors)
+    # commands by the row of their element
+    rowCommands, destinations = {}, {}
+    for lineNo, column, name, method, arguments in commands :
+        rowCommands.setdefault(lastPos[name][0], []).append((lineNo, column, lastPos[name], method, arguments))
+        if method is Element.set_pm and arguments[1] in lastPos :
+            destinations[arguments[1]] = lastPos[arguments[1]]
+    overlap = CircuitBoard.editRadius
+    textCache = {}
+    # written next to filename, it replaces filename once complete
+    partFile = f'{filename}.{os.getpid()}.part'
+    writer = SvgStreamWriter(partFile, theme, darkTheme, inputHash)
+    try :
+        with tempfile.TemporaryDirectory() as scratch :
+            scratchFile = os.path.join(scratch, 'band.svg')
+            rows, start = [], 0
+            rowIter = iter_rows(circuitCodeStr)
+            for bandStart in range(0, Nv, bandRows) :
+                bandEnd = min(bandStart + bandRows, Nv)
+                end = min(bandEnd + overlap, Nv)
+                # rows start ~ end-1 of the band board
+                dropped = max(bandStart - overlap, 0) - start
+                rows, start = rows[dropped:], start + dropped
+                while start + len(rows) < end : rows.append(next(rowIter))
+                bandCommands = [command for i in range(start, end) for command in rowCommands.get(i, ())]
+                board = make_bandBoard(rows, start, bandCommands, autoNode, destinations)
+                codes = band_svgCodes(board, start, bandStart, bandEnd, blockWidth)
+                del board
+                if not codes : continue
+                svgGenerator(codes, dict(generatorSetting), textCache).generate(scratchFile)
+                postprocessing(scratchFile, theme, darkTheme)
+                writer.add(etree.parse(scratchFile).getroot())
+        writer.close()
+        os.replace(partFile, filename)
+    except BaseException :
+        writer.file.close()
+        os.remove(partFile)
+        raise
+    return filename
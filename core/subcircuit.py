@@ -0,0 +1,331 @@
+# Sub-circuits : blocks of circuit that are rendered once and instanced with <use>.
+#
+# A block is a named circuit string and setting sheet :
+#     blocks = {'rlc' : (circuit, setting)}
+# A cell 'X' + label of a circuit string is an instance of a block. The cell is the
+# top left corner of the instance, the rest of the area of the block must be empty.
+# Instances are set in the setting sheet, instances with the same ID share settings :
+#     >> X1 : block    = rlc
+#     >> X1 : R1.value = 3kΩ       # label of element R1 of this instance
+#     >> X2 : R.values = 1Ω 2Ω
+# Besides block, settings of an instance are label settings of elements of the
+# block (see variants.labelSettings), they never change the geometry.
+#
+# Ports :
+#     Unnumbered wires and nodes on the border of a block are ports. A port next to
+#     an element out of the area of its instance is copied into the circuit as an
+#     unnumbered wire that only connects outward, thus wires of the circuit end at it.
+#
+# Each block is made, converted and rendered once into <g id="sub-name"> of <defs>,
+# its labels once into <g id="sub-name-k"> for each distinct set of label settings.
+# Instances are <use> of these groups, thus build time and file size grow with
+# distinct blocks rather than instances. Blocks can have instances of other blocks.
+# Blocks are optimized in memory and merged, the document is serialized once.
+import io
+import re
+import numpy as np
+from lxml import etree
+from core.construct import CircuitBoard, make_elemIDArray, tokenize_setting, \
+                           report_errors, connectMove
+from core.convert import make_convertContext, make_drawingObjs, make_textDrawingObjs, \
+                         make_svgCodes, to_svgCodes, ij2xy
+from core.svgkit import svgGenerator
+from core.postprocessing import optimize, serialize, formatFloat, glyphID, namespace
+from core.variants import labelSettings, save_labels, restore_labels
+
+# ids of groups are made from block names
+blockNamePattern = re.compile(r'[A-Za-z0-9_]+')
+
+def find_instances(circuitCodeStr) :
+    '''Return the circuit string without instances and instances (name, i, j).'''
+    lines = circuitCodeStr.split('\n')
+    instances = []
+    for i, line in enumerate(lines) :
+        if line[:1] == '#' : continue
+        for column in range(0, len(line), 3) :
+            name = line[column : column+2]
+            # 'X' without label is left as it is, it is reported as a malformed cell.
+            if len(name) < 2 or name[0] != 'X' or name[1].isspace() : continue
+            instances.append((name, i, column // 3))
+            line = line[:column] + '  ' + line[column+2:]
+        lines[i] = line
+    return '\n'.join(lines), instances
+
+def split_setting(settingSheetStr, instNames) :
+    '''\
+    Return the setting sheet without lines of instances, settings of instances and errors.
+    Lines of instances are left empty, thus lines of errors are the same.
+        settings[name] = block, overrides
+        block     : (line, column, block name), None if it is not set.
+        overrides : [(line, column, label setting line of the block)].'''
+    lines = settingSheetStr.split('\n')
+    commands, _ = tokenize_setting(settingSheetStr)
+    settings = {name : [None, []] for name in instNames}
+    errors = []
+    for lineNo, name, setting, arguments, columns in commands :
+        # 'X' is not an element code, names start with it are instances.
+        if name[0] != 'X' : continue
+        line, lines[lineNo] = lines[lineNo], ''
+        if name not in settings :
+            errors.append((lineNo, columns[0], f'sub-circuit instance {name} does not exist.'))
+            continue
+        if setting == 'block' :
+            if len(arguments) != 1 :
+                errors.append((lineNo, columns[1], f'block takes 1 arguments, got {len(arguments)}'))
+                continue
+            settings[name][0] = lineNo, columns[2], arguments[0]
+            continue
+        elemName, _, labelSetting = setting.partition('.')
+        if labelSetting not in labelSettings :
+            errors.append((lineNo, columns[1], f'{setting} is not a sub-circuit setting, expect '
+                                               f'block or element.setting, setting is one of '
+                                               f'{", ".join(labelSettings)}'))
+            continue
+        # arguments are kept as they are written, escapes are read by the block.
+        arguments = line[line.find('=', line.find(':')) + 1 :]
+        settings[name][1].append((lineNo, columns[1], f'{elemName} : {labelSetting} ={arguments}'))
+    return '\n'.join(lines), settings, errors
+
+class SubCircuit :
+    '''\
+    A circuit with instances of blocks.
+        board     : CircuitBoard of the circuit, instances are removed and ports are added.
+        instances : (name, i, j) of every instance.
+        instBlock : instance name -> (SubCircuit of its block, label setting sheet).
+    circuitCodeStr, settingSheetStr and blocks are as given, see construct.to_txt.
+    Blocks are compiled once, compiled is shared by every SubCircuit of one render.'''
+    def __init__(self, circuitCodeStr, settingSheetStr, blocks, * , autoNode = True,
+                 name = None, compiled = None, parents = ()) :
+        self.name = name
+        self.circuitCodeStr, self.settingSheetStr, self.blocks = circuitCodeStr, settingSheetStr, blocks
+        compiled = {} if compiled is None else compiled
+        circuitCodeStr, self.instances = find_instances(circuitCodeStr)
+        settingSheetStr, settings, errors = split_setting(settingSheetStr,
+                                                          {inst for inst, _, _ in self.instances})
+        firstPos = {}
+        for inst, i, j in self.instances : firstPos.setdefault(inst, (i, 3*j))
+        self.instBlock = {}
+        for inst, (block, overrides) in settings.items() :
+            if block is None :
+                errors.append((*firstPos[inst], f'sub-circuit instance {inst} has no block setting'))
+                continue
+            lineNo, column, blockName = block
+            if blockName not in blocks :
+                errors.append((lineNo, column, f'block {blockName} does not exist.'))
+                continue
+            if blockName in parents :
+                errors.append((lineNo, column, f'block {blockName} has an instance of itself.'))
+                continue
+            sub = compile_block(blockName, blocks, compiled, autoNode, parents)
+            for lineNo, column, override in overrides :
+                _, overrideErrors = sub.board.compile_setting(override)
+                errors += [(lineNo, column, message) for _, _, message in overrideErrors]
+            overrideSheet = '\n'.join(override for _, _, override in overrides)
+            self.instBlock[inst] = sub, overrideSheet
+        report_errors('sub-circuits are malformed', errors)
+        Ai, ports, cuts = self._place_ports(make_elemIDArray(circuitCodeStr))
+        rows = (' '.join(row).rstrip() for row in Ai.tolist())
+        self.board = CircuitBoard('\n'.join(rows) + '\n#', settingSheetStr, autoNode = autoNode)
+        if cuts : self.board.cut_connections(cuts)
+        if autoNode : self._set_portNodes(ports)
+
+    def _place_ports(self, Ai) :
+        '''\
+        Return the element ID array with ports of every instance, padded to cover every
+        instance, ports and connections to cut between ports of the same instance.
+        ports[pos] = board of the block, position of the port in the block.'''
+        Nv = max([Ai.shape[0]] + [i + self.instBlock[inst][0].board.Nv for inst, i, _ in self.instances])
+        Nh = max([Ai.shape[1]] + [j + self.instBlock[inst][0].board.Nh for inst, _, j in self.instances])
+        Ai = np.pad(Ai, ((0, Nv - Ai.shape[0]), (0, Nh - Ai.shape[1])), constant_values = '  ')
+        # index of the instance that covers each position, -1 for none.
+        owner = np.full([Nv, Nh], -1)
+        errors = []
+        candidates = {}
+        for n, (inst, i, j) in enumerate(self.instances) :
+            blockBoard = self.instBlock[inst][0].board
+            blockAi = blockBoard.Ai
+            area = np.s_[i : i + blockAi.shape[0], j : j + blockAi.shape[1]]
+            for di, dj in zip(*np.nonzero((Ai[area] != '  ') | (owner[area] >= 0))) :
+                errors.append((i + di, 3 * (j + dj), f'cell is covered by sub-circuit instance {inst}'))
+            owner[area] = n
+            # unnumbered wires and nodes on the border
+            border = np.zeros(blockAi.shape, dtype = bool)
+            border[[0, -1], :] = border[:, [0, -1]] = True
+            isPort = border & (np.isin(blockAi, ('..', ',,')) | (blockBoard.codeArray == 'n'))
+            for di, dj in zip(*np.nonzero(isPort)) :
+                candidates[i + di, j + dj] = blockBoard, (di, dj)
+        report_errors('sub-circuits are malformed', errors)
+        ports, cuts = {}, []
+        for (i, j), port in candidates.items() :
+            neighbours = [(i + di, j + dj) for di, dj in connectMove
+                          if 0 <= i + di < Nv and 0 <= j + dj < Nh]
+            outward = [pos for pos in neighbours if owner[pos] != owner[i, j]]
+            if any(Ai[pos] != '  ' or pos in candidates for pos in outward) :
+                ports[i, j] = port
+        for (i, j), (blockBoard, blockPos) in ports.items() :
+            Ai[i, j] = ',,' if blockBoard.Ai[blockPos] == ',,' else '..'
+            for di, dj in connectMove[:4] :
+                pos = i + di, j + dj
+                if pos in ports and owner[pos] == owner[i, j] : cuts.append(((i, j), pos))
+        return Ai, ports, cuts
+
+    def _set_portNodes(self, ports) :
+        '''\
+        A port is a node if it is an intersection of connections of the circuit and of the
+        block together, nodes of the block are drawn by the block.'''
+        for pos, (blockBoard, blockPos) in ports.items() :
+            if blockBoard.isNodeArray[blockPos] or blockBoard.codeArray[blockPos] == 'n' : continue
+            bits = mutual_connections(self.board, *pos) | mutual_connections(blockBoard, *blockPos)
+            connectN = bin(bits).count('1')
+            connectDircN = sum(1 for bit in range(4) if bits >> bit & 1 or bits >> (bit+4) & 1)
+            if connectDircN >= 2 and connectN >= 3 : self.board.isNodeArray[pos] = True
+
+def mutual_connections(board, i, j) :
+    '''Bits of directions that (i, j) and its neighbour connect to each other.'''
+    C = board.connectArray
+    bits = 0
+    for bit, (di, dj) in enumerate(connectMove) :
+        if board.haveElem(i + di, j + dj) and C[i, j] >> bit & 1 and C[i + di, j + dj] >> (bit+4) % 8 & 1 :
+            bits |= 1 << bit
+    return bits
+
+def compile_block(name, blocks, compiled, autoNode, parents) :
+    '''Return the SubCircuit of a block, each block is compiled once.'''
+    if name not in compiled :
+        if not blockNamePattern.fullmatch(name) :
+            raise ValueError(f'block name {name!r} must be letters, digits or _')
+        circuitCodeStr, settingSheetStr = blocks[name]
+        try :
+            compiled[name] = SubCircuit(circuitCodeStr, settingSheetStr, blocks, autoNode = autoNode,
+                                        name = name, compiled = compiled, parents = parents + (name,))
+        except ValueError as error :
+            raise ValueError(f'block {name} : {error}') from None
+    return compiled[name]
+
+class Composer :
+    '''\
+    Render blocks into <defs> of one document and place instances with <use>.
+    Each block and each distinct set of labels of a block is rendered once.'''
+    def __init__(self, ctx, generatorSetting) :
+        self.ctx = ctx
+        self.generatorSetting = dict(generatorSetting, autoPlace = False)
+        settings = svgGenerator([], dict(generatorSetting)).settings()
+        # svg coordinates of one unit of svg codes
+        self.scale = settings['a'] / (settings['unit'] / 2)
+        self.textCache = {}
+        # key -> (id, viewBox) of a group in <defs>, None for empty groups
+        self.defined = {}
+        self.labelCount = {}
+        self.document = None
+
+    def render(self, svgCodes, generatorSetting = None) :
+        '''Return the root of the optimized svg of svg codes, it is not serialized.'''
+        if generatorSetting is None : generatorSetting = self.generatorSetting
+        svgGenObj = svgGenerator(svgCodes, dict(generatorSetting), textCache = self.textCache)
+        svgFile = io.BytesIO()
+        svgGenObj.generate(svgFile)
+        svgFile.seek(0)
+        root = etree.parse(svgFile).getroot()
+        optimize(root)
+        return root
+
+    def add_instances(self, root, subCircuit) :
+        '''Put <use> of every instance of subCircuit in root, viewBox of root covers them.'''
+        x0, y0, w, h = read_viewBox(root)
+        x1, y1 = x0 + w, y0 + h
+        for inst, i, j in subCircuit.instances :
+            block, overrideSheet = subCircuit.instBlock[inst]
+            x, y = (v * self.scale for v in ij2xy(i, j, self.ctx))
+            for group in (self.define_geometry(block), self.define_labels(block, overrideSheet)) :
+                if group is None : continue
+                groupID, (bx, by, bw, bh) = group
+                etree.SubElement(root, f'{namespace}use', {'href' : f'#{groupID}',
+                                 'x' : formatFloat(x), 'y' : formatFloat(y)})
+                x0, y0 = min(x0, x + bx), min(y0, y + by)
+                x1, y1 = max(x1, x + bx + bw), max(y1, y + by + bh)
+        root.attrib['viewBox'] = ' '.join(formatFloat(v) for v in (x0, y0, x1 - x0, y1 - y0))
+
+    def define_geometry(self, block) :
+        key = block.name, None
+        if key not in self.defined :
+            centeredDrawingObjs, wireDrawingObjs, _ = make_drawingObjs(block.board)
+            root = self.render(make_svgCodes((centeredDrawingObjs, wireDrawingObjs, []), self.ctx))
+            self.add_instances(root, block)
+            self.defined[key] = self.define(root, f'sub-{block.name}')
+        return self.defined[key]
+
+    def define_labels(self, block, overrideSheet) :
+        key = block.name, overrideSheet
+        if key not in self.defined :
+            board = block.board
+            labels = save_labels(board)
+            board.apply_setting(overrideSheet)
+            textDrawingObjs = make_textDrawingObjs(board)
+            restore_labels(board, labels)
+            self.defined[key] = None
+            if textDrawingObjs :
+                n = self.labelCount[block.name] = self.labelCount.get(block.name, -1) + 1
+                root = self.render(make_svgCodes(([], [], textDrawingObjs), self.ctx))
+                self.defined[key] = self.define(root, f'sub-{block.name}-{n}')
+        return self.defined[key]
+
+    def define(self, root, groupID) :
+        '''Move root into <g id=groupID> of <defs> of the document, return (groupID, viewBox).'''
+        document = self.document
+        styles = document.findall(f'{namespace}style')
+        defs = document.find(f'{namespace}defs')
+        if defs is None :
+            defs = etree.Element(f'{namespace}defs')
+            styles[-1].addnext(defs)
+        # glyphs of texts are merged by path data, ids that mean other glyphs are renamed.
+        glyphs = defs.find(f'{namespace}g[@id="txt"]')
+        usedIDs = {} if glyphs is None else {path.get('id') : path.get('d') for path in glyphs}
+        renamed = {}
+        for component in root.findall(f'{namespace}defs/*') :
+            componentID = component.get('id')
+            if componentID != 'txt' :
+                if document.find(f'.//*[@id="{componentID}"]') is None : defs.append(component)
+                continue
+            if glyphs is None :
+                glyphs = etree.SubElement(defs, f'{namespace}g', {'id' : 'txt'})
+            for path in list(component) :
+                pathID, d = path.get('id'), path.get('d')
+                if usedIDs.get(pathID, d) != d :
+                    renamed[f'#{pathID}'] = path.attrib['id'] = glyphID(d, usedIDs)
+                elif pathID in usedIDs :
+                    continue
+                usedIDs[path.get('id')] = d
+                glyphs.append(path)
+        group = etree.SubElement(defs, f'{namespace}g', {'id' : groupID})
+        for child in list(root) :
+            if child.tag in (f'{namespace}style', f'{namespace}defs') : continue
+            for use in child.iter(f'{namespace}use') :
+                if use.get('href') in renamed : use.attrib['href'] = '#' + renamed[use.get('href')]
+            group.append(child)
+        # css rules of the block, its top level is the group now.
+        rules = root.findall(f'{namespace}style')[-1].text.replace('svg>', f'#{groupID}>')
+        for rule in re.findall(r'[^{}]+\{[^{}]*\}', rules) :
+            if rule not in styles[-1].text : styles[-1].text += rule
+        return groupID, read_viewBox(root)
+
+def read_viewBox(root) :
+    return [float(v) for v in root.get('viewBox').replace(',', ' ').split()]
+
+def render_subcircuits(circuitCodeStr, settingSheetStr, blocks, filename, * ,
+                       autoNode = True, blockWidth = 6, generatorSetting = None,
+                       theme = 'light', darkTheme = None, inputHash = None) :
+    '''\
+    Render a circuit with instances of blocks into one svg file, blocks is
+    {name : (circuit string, setting sheet)}. Return the filename.'''
+    if generatorSetting is None : generatorSetting = {'unit': 8}
+    top = SubCircuit(circuitCodeStr, settingSheetStr, blocks, autoNode = autoNode)
+    labelGroups = bool(generatorSetting.get('autoPlace'))
+    svgCodes = to_svgCodes(top.board, blockWidth = blockWidth, labelGroups = labelGroups)
+    ctx = make_convertContext(blockWidth = blockWidth)
+    composer = Composer(ctx, generatorSetting)
+    composer.document = composer.render(svgCodes, generatorSetting)
+    composer.add_instances(composer.document, top)
+    output = serialize(composer.document, theme, darkTheme, inputHash)
+    with open(filename, 'w') as outFile :
+        outFile.write(output)
+    return filename
@@ -4,18 +4,26 @@
 # import re
 import pathlib
 import xml.etree.ElementTree as ET
-import matplotlib as mpl
 from matplotlib import mathtext, font_manager
+from matplotlib.figure import Figure
 from io import BytesIO
 from typing import Union
+from core.placement import GridHash, place_labels
+
+ET.register_namespace('', "http://www.w3.org/2000/svg")
+ET.register_namespace('xlink', "http://www.w3.org/1999/xlink")
+
 
 def text2svg(s, font):
+    # the same as mathtext.math_to_image, except that transparency is given
+    # to savefig directly instead of changing global rcParams.
+    parser = mathtext.MathTextParser('path')
+    width, height, depth, _, _ = parser.parse(s, dpi=72, prop=font)
+    fig = Figure(figsize=(width / 72.0, height / 72.0))
+    fig.text(0, depth/height, s, fontproperties=font)
     bio = BytesIO()
-    with mpl.rc_context({'savefig.transparent': True}):
-        mathtext.math_to_image(s, bio, prop=font, format='svg')
+    fig.savefig(bio, format='svg', transparent=True)
     root = ET.parse(BytesIO(bio.getvalue())).getroot()
-    ET.register_namespace('', "http://www.w3.org/2000/svg")
-    ET.register_namespace('xlink', "http://www.w3.org/1999/xlink")
     # ET.register_namespace('rdf', "http://www.w3.org/1999/02/22-rdf-syntax-ns#")
     # ET.register_namespace('cc', "http://creativecommons.org/ns#")
     # ET.register_namespace('dc', "http://purl.org/dc/elements/1.1/")
@@ -29,13 +37,18 @@ def text2svg(s, font):
 class svgGenerator:
     """Generate SVG from given svg_elements"""
 
-    def __init__(self, elements: Union[list, tuple], setting: dict = None):
+    def __init__(self, elements: Union[list, tuple], setting: dict = None,
+                 textCache: dict = None):
         """
         elements: A list or tuple. Every items must be follow the following formats
             ('e', {'w'/'W'}, x1, x2, y1, y2)  -- wire
 
             ({'t'/'e'}, {element/text}, x, y, c, d, direction)  -- element and text, without wire
 
+            ('t', text, x, y, c, d, direction, group)  -- text of a label
+            # texts with the same group are moved together by 'autoPlace',
+            # group None is a text that is never moved.
+
             # direction: 
             #  3  2  1
             #   \ | /
@@ -76,6 +89,12 @@ class svgGenerator:
             'scaler'  -- 
             'unit'  -- E的長度，預設是2，代表2單位
             'font'  -- set by "font_manager.FontProperties" class
+            'autoPlace'  -- move labels (texts with a group) to avoid overlapping
+                            elements, wires and other labels
+
+        textCache: A dict shared by several svgGenerator. Texts rendered by
+            one generator are reused by the others, e.g. variants of a circuit
+            that only differ in some labels.
         """
 
 
@@ -88,7 +107,8 @@ class svgGenerator:
             'scaler': 1,
             'unit': 2,
             'font': font_manager.FontProperties(size=20, family='serif', math_fontfamily='stix'),
-            'template' : svg_template_path
+            'template' : svg_template_path,
+            'autoPlace': False
         }
         # svg elements setting
         self._svgID = {
@@ -114,6 +134,21 @@ class svgGenerator:
             'b_width': 21,
             'b_height': 19
         }
+        self._elemHalfSize = {  # (along, across) direction, for label placement
+            'L': (26, 11),
+            'R': (22, 8),
+            'C': (8, 16),
+            'V': (24, 24),
+            'v': (29, 29),
+            'I': (24, 24),
+            'i': (29, 29),
+            'b': (21, 18),
+            'g': (16, 16),
+            'n': (5, 5),
+            'N': (7.5, 7.5),
+            'A': (6, 4),
+            'a': (33, 5)
+        }
         # self._elemSizeP = {  # for padding
         #    'L': 26,
         #    'R': 21,
@@ -161,6 +196,14 @@ class svgGenerator:
                 if i[6] not in {0, 1, 2, 3, 4, 5, 6, 7}:
                     raise Exception(
                         f"Input elements's element error. Invalid: direction, {i}")
+            elif len(i) == 8 and i[0] == 't':
+                for j in range(2, 6):
+                    if not isinstance(i[j], (int, float)):
+                        raise Exception(
+                            f"Invalid: Inside x, y, c, d must be int or float, {i}")
+                if i[6] not in {0, 1, 2, 3, 4, 5, 6, 7}:
+                    raise Exception(
+                        f"Input elements's element error. Invalid: direction, {i}")
             else:
                 raise Exception(
                     f"Input argument 'elements''s element format is invalid. Invalid: length, {i}")
@@ -187,6 +230,7 @@ class svgGenerator:
         self.elements.extend(elements_else)
 
         self._desc = ""
+        self._textCache = {} if textCache is None else textCache
 
     def settings(self, setting: dict = None):
         """return setting if no input. change setting if 'setting' given"""
@@ -201,6 +245,15 @@ class svgGenerator:
         else:
             raise Exception("setting must be dict")
 
+    def render_text(self, text):
+        """Return svg element of a text, each text is rendered once.
+        The element is shared, it must not be modified."""
+        font = self._setting['font']
+        key = text, font
+        if key not in self._textCache:
+            self._textCache[key] = text2svg(text, font)
+        return self._textCache[key]
+
     def description(self, desc: str = ""):
         """Add description in SVG file. (In 'desc' tag)
         return description if no input
@@ -210,10 +263,12 @@ class svgGenerator:
         else:
             self._desc = str(desc)
 
-    def generate(self, filename, debug=False):
+    def generate(self, filename, debug=False, viewBox=None):
         """Generate svg, and save as file.
 
         if debug==True : show text anchor
+        viewBox : (x, y, width, height) of the figure, it covers every
+                  element if None.
 
         """
         def patch(delta_a, delta_e, direction, xa, ya):
@@ -263,6 +318,68 @@ class svgGenerator:
                 Y = y + (-delta_c + delta_d)/(2**0.5)
             return X, Y
 
+        def text_box(text, x, y, dc, dd, direction):
+            str_elem = self.render_text(text)
+            str_elem_attr = str_elem.attrib
+            size_x, size_y = float(str_elem_attr['width']), float(
+                str_elem_attr['height'])
+            x_tot, y_tot = translate_cd(x*a, y*a, dc, dd, direction)
+            X = x_tot - size_x/2
+            Y = y_tot - size_y/2
+            # translate if text with a vertical elements
+            if direction in {2, 6}:
+                if dc > 0:
+                    X += size_x/2
+                if dc < 0:
+                    X -= size_x/2
+            return str_elem, X, Y, size_x, size_y, x_tot, y_tot
+
+        def elem_box(elem):
+            circuit_elem, x, y, dc, dd, direction = elem[1:7]
+            if circuit_elem not in self._elemHalfSize:
+                return None
+            along, across = self._elemHalfSize[circuit_elem]
+            if circuit_elem == 'a':
+                xa, ya = translate_cd(x*a, y*a, dc, dd, direction)
+            else:
+                xa, ya = x*a, y*a
+            if direction in {0, 4}:
+                hx, hy = along, across
+            elif direction in {2, 6}:
+                hx, hy = across, along
+            else:
+                hx = hy = (along + across) / 2**0.5
+            return xa - hx, ya - hy, xa + hx, ya + hy
+
+        def placed_elements():
+            """Return elements with labels moved to where they overlap the least."""
+            obstacles = GridHash()
+            groups = {}
+            for n, elem in enumerate(self.elements):
+                if elem[0] == 'e' and elem[1] in {'w', 'W'}:
+                    x1, x2, y1, y2 = elem[2:]
+                    obstacles.insert_segment(x1*a, y1*a, x2*a, y2*a)
+                elif elem[0] == 'e':
+                    box = elem_box(elem)
+                    if box is not None:
+                        obstacles.insert_box(box)
+                else:
+                    group = elem[7] if len(elem) == 8 else None
+                    # a text without group is a fixed group of its own
+                    key = n if group is None else group
+                    groups.setdefault(key, (group is not None, []))[1].append(
+                        (n, elem[4], elem[5]))
+
+            def box_of(n, dc, dd):
+                text, x, y, _, _, direction = self.elements[n][1:7]
+                X, Y, size_x, size_y = text_box(text, x, y, dc, dd, direction)[1:5]
+                return X, Y, X+size_x, Y+size_y
+            placed = place_labels(list(groups.values()), box_of, obstacles)
+            elements = list(self.elements)
+            for n, (dc, dd) in placed.items():
+                elements[n] = elements[n][:4] + (dc, dd) + elements[n][6:]
+            return elements
+
         def extremeX(maxX, minX, *val):
             maxX = max(maxX, *val)
             minX = min(minX, *val)
@@ -280,7 +397,11 @@ class svgGenerator:
         maxX, maxY = 0, 0
         minX, minY = 0, 0
 
-        for elem in self.elements:
+        if self._setting['autoPlace']:
+            elements = placed_elements()
+        else:
+            elements = self.elements
+        for elem in elements:
             if elem[0] == 'e':  # element
                 circuit_elem = elem[1]
                 if circuit_elem in {'w', 'W'}:
@@ -290,9 +411,12 @@ class svgGenerator:
                     y1 *= a
                     y2 *= a
                     dpath = f'M {x1},{y1} {x2},{y2}'
-                    color = {'w': "black", 'W': "#afb0b4"}[circuit_elem]
-                    svg_Element = ET.Element(
-                        'path', {"d": dpath, "stroke": color, "stroke-width": "3.0"})
+                    if circuit_elem == 'w':
+                        svg_Element = ET.Element(
+                            'path', {"d": dpath, "stroke": "black", "stroke-width": "3.0"})
+                    else:  # gray wire, colored by theme
+                        svg_Element = ET.Element(
+                            'path', {"d": dpath, "class": "W", "stroke-width": "3.0"})
                     root.append(svg_Element)
                     maxX, minX = extremeX(maxX, minX, x1+3, x1-3, x2+3, x2-3)
                     maxY, minY = extremeY(maxY, minY, y1+3, y1-3, y2+3, y2-3)
@@ -462,20 +586,9 @@ class svgGenerator:
                 else:  # not define
                     pass
             else:  # text
-                text, x, y, dc, dd, direction = elem[1:]
-                str_elem = text2svg(text, self._setting['font'])
-                str_elem_attr = str_elem.attrib
-                size_x, size_y = float(str_elem_attr['width']), float(
-                    str_elem_attr['height'])
-                x_tot, y_tot = translate_cd(x*a, y*a, dc, dd, direction)
-                X = x_tot - size_x/2
-                Y = y_tot - size_y/2
-                # translate if text with a vertical elements
-                if direction in {2, 6}:
-                    if dc > 0:
-                        X += size_x/2
-                    if dc < 0:
-                        X -= size_x/2
+                text, x, y, dc, dd, direction = elem[1:7]
+                str_elem, X, Y, size_x, size_y, x_tot, y_tot = text_box(
+                    text, x, y, dc, dd, direction)
                 # print(X, Y, x_tot, y_tot, size_x, size_y)
                 transform = f"translate({X},{Y})"
                 # transform = ""
@@ -492,6 +605,8 @@ class svgGenerator:
         root[0].text = self._desc
         # root.set("width", str(maxX-minX+a))
         # root.set("height", str(maxY-minY+a))
-        root.set("viewBox", f"{minX-2} {minY-2} {maxX-minX+10} {maxY-minY+2}")
-        ET.register_namespace('', "http://www.w3.org/2000/svg")
+        if viewBox is None:
+            root.set("viewBox", f"{minX-2} {minY-2} {maxX-minX+10} {maxY-minY+2}")
+        else:
+            root.set("viewBox", " ".join(map(str, viewBox)))
         ET.ElementTree(root).write(filename)
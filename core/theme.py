@@ -0,0 +1,107 @@
+# Colour themes for the optimized SVG.
+#
+# Geometry and glyphs are emitted once. Every colour in the figure refers to a
+# CSS custom property (var(--ink), var(--resistor), ...), and a theme is only
+# the table that assigns those properties. The theme rules are written as the
+# first <style> element of the optimized SVG, so writing another variant of an
+# already rendered figure is a string substitution.
+#
+# Custom properties :
+#     --ink       : wires, outlines, signs and text
+#     --wire      : gray wire (W)
+#     --resistor  : resistor
+#     --inductor  : inductor
+#     --capacitor : capacitor
+#     --source    : outline of voltage sources
+#     --accent    : current sources, arrows of current direction, mesh current
+# Hollow nodes are not filled. A theme dict may give 'paper' to fill them, the
+# fill is only set by the CSS of that theme.
+import re
+import pathlib
+
+themes = {
+    'light': {
+        'ink': 'black',
+        'wire': '#afb0b4',
+        'resistor': '#257eb8',
+        'inductor': '#572581',
+        'capacitor': '#875e7f',
+        'source': '#d12938',
+        'accent': '#7b1d23',
+    },
+    'dark': {
+        'ink': '#e6e6e6',
+        'wire': '#5f6168',
+        'resistor': '#5aa9e6',
+        'inductor': '#b48ee0',
+        'capacitor': '#d19fc6',
+        'source': '#ff6b76',
+        'accent': '#f08a92',
+    },
+    'print': {
+        'ink': 'black',
+        'wire': 'gray',
+        'resistor': 'black',
+        'inductor': 'black',
+        'capacitor': 'black',
+        'source': 'black',
+        'accent': 'black',
+    },
+}
+
+_themeStyle = re.compile(r'<style>(.*?)</style>', re.S)
+
+
+def get_theme(theme):
+    """Return the colour table of a theme given by name or as a dict.
+    A dict only needs the properties it changes, the rest come from 'light'."""
+    if isinstance(theme, str):
+        if theme not in themes:
+            raise ValueError(
+                f'{theme} is not an avaliable theme. Support : {", ".join(themes)}')
+        return dict(themes[theme])
+    if isinstance(theme, dict):
+        unknown = set(theme) - set(themes['light']) - {'paper'}
+        if unknown:
+            raise ValueError(f'unknown theme properties : {", ".join(sorted(unknown))}')
+        return {**themes['light'], **theme}
+    raise TypeError('theme must be a theme name or dict')
+
+
+def make_themeCss(theme='light', darkTheme=None):
+    """Return CSS rules assigning the custom properties of a theme.
+    if darkTheme is given, it is applied under prefers-color-scheme: dark."""
+    def rule(table):
+        css = ':root{' + ';'.join(f'--{key}:{value}' for key, value in table.items()) + '}'
+        if 'paper' in table:
+            css += '#ring{fill:var(--paper)}'
+        return css
+    css = rule(get_theme(theme))
+    if darkTheme is not None:
+        css += '@media(prefers-color-scheme:dark){' + rule(get_theme(darkTheme)) + '}'
+    return css
+
+
+def swap_theme(svgString, theme='light', darkTheme=None):
+    """Replace the theme rules (first <style> element) of an optimized SVG string."""
+    css = make_themeCss(theme, darkTheme)
+    string, n = _themeStyle.subn(lambda _: f'<style>{css}</style>', svgString, count=1)
+    if n == 0:
+        raise ValueError('SVG string does not contain theme rules')
+    return string
+
+
+def write_themes(filename, names=('light', 'dark', 'print')):
+    """Write one variant of an optimized SVG for each theme,
+    'figure.svg' ---> 'figure.light.svg', 'figure.dark.svg', ...
+    Return the paths of written files."""
+    path = pathlib.Path(filename)
+    with open(path, 'r') as inFile:
+        string = inFile.read()
+    filenames = []
+    for name in names:
+        variantPath = path.with_name(f'{path.stem}.{name}{path.suffix}')
+        with open(variantPath, 'w') as outFile:
+            outFile.write(swap_theme(string, name))
+        filenames.append(variantPath.as_posix())
+    return filenames
@@ -0,0 +1,69 @@
+# Render value variants of one circuit.
+#
+# Variants share the circuit string, the setting sheet and therefore the
+# geometry. Each variant only overrides labels, e.g. :
+#     >> R1 : value  = 3kΩ
+#     >> C  : values = 2\muF 4\muF
+# The board, its drawing objects and wires are made once. For every variant
+# only text drawing objects are made again, and texts that are the same in
+# several variants are rendered once (shared text cache of svgGenerator).
+from core.construct import CircuitBoard, decode
+from core.convert import make_convertContext, make_drawingObjs, \
+                         make_textDrawingObjs, make_svgCodes
+from core.svgkit import svgGenerator
+from core.postprocessing import postprocessing
+
+# settings that only change labels, other settings change the geometry.
+labelSettings = ('value', 'values', 'pm', 'valuePos', 'valuePoss', 'pmPos',
+                 'valueMove', 'allValueMove', 'pmMove', 'pmSep')
+# attributes of an element that are changed by label settings.
+labelAttributes = ('value', 'pm', 'valuePos', 'pmPos', 'valueMove', 'pmMove', 'pmSep')
+
+def check_override(overrideStr) :
+    '''Raise ValueError if the override changes anything besides labels.'''
+    commands = decode(overrideStr)
+    if commands == None : return
+    for objName, setting, _ in commands :
+        if setting not in labelSettings :
+            raise ValueError(f'{objName} : {setting} changes the geometry, '
+                             f'variants only support {", ".join(labelSettings)}')
+
+def save_labels(circuitboard) :
+    '''Return label settings of every element, unset settings are not stored.'''
+    labels = {}
+    for pos, settings in circuitboard.elemSettings.items() :
+        labels[pos] = {attr : settings[attr] for attr in labelAttributes if attr in settings}
+    return labels
+
+def restore_labels(circuitboard, labels) :
+    for pos, settings in circuitboard.elemSettings.items() :
+        for attr in labelAttributes : settings.pop(attr, None)
+        settings.update(labels.get(pos, {}))
+
+def render_variants(circuitCodeStr, settingSheetStr, overrides, filenames, * ,
+                    autoNode = True, blockWidth = 6, generatorSetting = None,
+                    theme = 'light', darkTheme = None) :
+    '''\
+    Render one svg file for each override sheet, filenames[k] is for overrides[k].
+    Return the list of filenames.'''
+    overrides, filenames = list(overrides), list(filenames)
+    if len(overrides) != len(filenames) :
+        raise ValueError('every override needs a filename')
+    for overrideStr in overrides : check_override(overrideStr)
+    if generatorSetting is None : generatorSetting = {'unit': 8}
+
+    board = CircuitBoard(circuitCodeStr, settingSheetStr, autoNode = autoNode)
+    ctx = make_convertContext(blockWidth = blockWidth)
+    centeredDrawingObjs, wireDrawingObjs, _ = make_drawingObjs(board)
+    labels = save_labels(board)
+    textCache = {}
+    for overrideStr, filename in zip(overrides, filenames) :
+        restore_labels(board, labels)
+        board.apply_setting(overrideStr)
+        textDrawingObjs = make_textDrawingObjs(board)
+        svgCodes = make_svgCodes((centeredDrawingObjs, wireDrawingObjs, textDrawingObjs), ctx)
+        svgGenObj = svgGenerator(svgCodes, dict(generatorSetting), textCache = textCache)
+        svgGenObj.generate(filename)
+        postprocessing(filename, theme, darkTheme)
+    restore_labels(board, labels)
+    return filenames
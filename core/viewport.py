@@ -0,0 +1,139 @@
+# Viewports and tiles of a figure.
+#
+# svg codes are put in grid buckets (GridHash of placement) by their extents in px,
+# the same coordinates as svgGenerator. A viewport renders only the codes that
+# intersect it, wires are clipped at its border. Finding the codes of a viewport only
+# looks at the buckets it covers (or at the buckets that hold something, whichever
+# are fewer), thus rendering a viewport depends on what is in it, not on the size of
+# the board.
+#
+# Extents :
+#     wires    : the segment.
+#     elements : a box around the center that covers the symbol and its leads, see elemHalo.
+#     texts    : the rendered size of the text around its position, moved by c, d.
+# Labels are not moved by autoPlace in viewports, since tiles must agree at borders.
+#
+# Tiles : zoom z has 2^z x 2^z square tiles that cover the figure (XYZ scheme), tile
+# (z, x, y) is written to directory/z/x/y.svg. Tiles without any code are not written.
+import pathlib
+from core.svgkit import svgGenerator
+from core.placement import GridHash, clip_segment
+from core.postprocessing import postprocessing
+
+# the same as build
+defaultSetting = {'unit' : 8}
+# half size of the box of elements in px, others reach a (the end of their leads).
+elemHalo = {'n' : 5, 'N' : 8, 'A' : 10, 'a' : 35, 'g' : 33, 'm' : 70, 'anchor' : 2}
+
+class ViewportIndex :
+    '''\
+    svg codes of a figure by their extents. setting is the setting of svgGenerator,
+    blockWidth is the one of the svg codes, used by cell_box. Texts rendered for
+    extents are kept in textCache and reused by every viewport.'''
+    def __init__(self, svgCodes, setting = None, blockWidth = 6, cellSize = 64, textCache = None) :
+        self.svgCodes   = list(svgCodes)
+        self.setting    = {**defaultSetting, **(setting or {}), 'autoPlace' : False}
+        self.blockWidth = blockWidth
+        self.textCache  = {} if textCache is None else textCache
+        generator  = svgGenerator([], self.setting, self.textCache)
+        setting    = generator.settings()
+        a, c, d    = setting['a'], setting['c'], setting['d']
+        self.scale = a / (setting['unit'] / 2)
+        self.grid  = GridHash(cellSize)
+        # codes[k] is the index in svgCodes of the k-th box or segment of grid
+        self.boxCodes, self.segmentCodes = [], []
+        bounds = None
+        for n, code in enumerate(self.svgCodes) :
+            if code[0] == 'e' and code[1] in ('w', 'W') :
+                x1, x2, y1, y2 = (v * self.scale for v in code[2:6])
+                self.grid.insert_segment(x1, y1, x2, y2)
+                self.segmentCodes.append(n)
+                box = min(x1, x2) - 3, min(y1, y2) - 3, max(x1, x2) + 3, max(y1, y2) + 3
+            else :
+                x, y = code[2] * self.scale, code[3] * self.scale
+                move = abs(code[4]) * c + abs(code[5]) * d
+                if code[0] == 't' :
+                    textElem = generator.render_text(code[1])
+                    hx = float(textElem.attrib['width']) + move
+                    hy = float(textElem.attrib['height']) + move
+                elif code[1] == 'a' :
+                    hx = hy = elemHalo['a'] + move
+                else :
+                    hx = hy = elemHalo.get(code[1], a + 3)
+                box = x - hx, y - hy, x + hx, y + hy
+                self.grid.insert_box(box)
+                self.boxCodes.append(n)
+            bounds = box if bounds is None else (min(bounds[0], box[0]), min(bounds[1], box[1]),
+                                                 max(bounds[2], box[2]), max(bounds[3], box[3]))
+        self.bounds = (0, 0, 0, 0) if bounds is None else bounds
+
+    def cell_box(self, i0, j0, i1, j1) :
+        '''Box in px that covers cells from (i0, j0) to (i1, j1) of the board.'''
+        s = self.blockWidth * self.scale
+        return (j0 - 0.5) * s, (i0 - 0.5) * s, (j1 + 0.5) * s, (i1 + 0.5) * s
+
+    def query(self, box) :
+        '''svg codes that intersect box (px) in their order, wires are clipped by box.'''
+        found = []
+        for kind, k in self.grid.keys(box) :
+            if kind == 'b' :
+                x0, y0, x1, y1 = self.grid.boxes[k]
+                if x0 <= box[2] and box[0] <= x1 and y0 <= box[3] and box[1] <= y1 :
+                    found.append((self.boxCodes[k], self.svgCodes[self.boxCodes[k]]))
+                continue
+            n = self.segmentCodes[k]
+            code = self.svgCodes[n]
+            x1, y1, x2, y2, _ = self.grid.segments[k]
+            clipped = clip_segment(box, x1, y1, x2, y2)
+            if clipped is None : continue
+            if clipped != (0, 1) :
+                t0, t1 = clipped
+                _, elemCode, cx1, cx2, cy1, cy2 = code
+                code = ('e', elemCode, cx1 + (cx2 - cx1) * t0, cx1 + (cx2 - cx1) * t1,
+                                       cy1 + (cy2 - cy1) * t0, cy1 + (cy2 - cy1) * t1)
+            found.append((n, code))
+        return [code for _, code in sorted(found, key = lambda x : x[0])]
+
+    def render(self, box, filename, *, theme = 'light', darkTheme = None) :
+        '''Write the viewport box (px) as an svg file, return the number of svg codes in it.'''
+        codes = self.query(box)
+        self._write(codes, box, filename, theme, darkTheme)
+        return len(codes)
+
+    def _write(self, codes, box, filename, theme, darkTheme) :
+        x0, y0, x1, y1 = box
+        generator = svgGenerator(codes, dict(self.setting), self.textCache)
+        generator.generate(filename, viewBox = (x0, y0, x1 - x0, y1 - y0))
+        postprocessing(filename, theme, darkTheme)
+
+    def tile_box(self, z, x, y) :
+        '''Box in px of tile (z, x, y).'''
+        x0, y0, x1, y1 = self.bounds
+        side = max(x1 - x0, y1 - y0) / 2**z
+        return x0 + x * side, y0 + y * side, x0 + (x + 1) * side, y0 + (y + 1) * side
+
+    def tiles(self, z) :
+        '''Tiles (x, y) of zoom z that may have something, found from buckets of the grid.'''
+        x0, y0, x1, y1 = self.bounds
+        side = max(x1 - x0, y1 - y0, 1e-9) / 2**z
+        s = self.grid.cellSize
+        found = set()
+        for cx, cy in self.grid.cells :
+            for tx in range(max(int((cx * s - x0) // side), 0), min(int(((cx + 1) * s - x0) // side), 2**z - 1) + 1) :
+                for ty in range(max(int((cy * s - y0) // side), 0), min(int(((cy + 1) * s - y0) // side), 2**z - 1) + 1) :
+                    found.add((tx, ty))
+        return sorted(found)
+
+    def write_tiles(self, directory, maxZoom, *, theme = 'light', darkTheme = None) :
+        '''Write tiles of zoom 0 ~ maxZoom as directory/z/x/y.svg, return paths written.'''
+        written = []
+        for z in range(maxZoom + 1) :
+            for x, y in self.tiles(z) :
+                box = self.tile_box(z, x, y)
+                codes = self.query(box)
+                if not codes : continue
+                path = pathlib.Path(directory, str(z), str(x), f'{y}.svg')
+                path.parent.mkdir(parents = True, exist_ok = True)
+                self._write(codes, box, path.as_posix(), theme, darkTheme)
+                written.append(path)
+        return written
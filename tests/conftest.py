@@ -0,0 +1,5 @@
+# Tests import core and build from the root of the repository.
+import sys
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
@@ -0,0 +1,114 @@
+import os
+import sys
+import pathlib
+import contextlib
+import subprocess
+import build
+from core.manifest import BuildManifests
+
+circuits = {'a': '.. R1 ..\n..    ..\nVa    C1\n..    ..\n.. .. ..\n#',
+            'b': '.. .. L1 .. n1\n..          ..\nVb          R2\n..          ..\n.. .. .. .. ..\n#',
+            'c': 'n1 .. R1 .. .. C1 .. n2\n#'}
+root = pathlib.Path(build.__file__).parent
+
+
+def write_txtfiles(folder):
+    for name, circuit in circuits.items():
+        (folder / f'{name}.txt').write_text(f"circuit = '''\\\n{circuit}'''\nsetting = '#'\n")
+    (folder / 'bad.txt').write_text("circuit = '''\\\n.. x\n#'''\nsetting = '#'\n")
+    return sorted(str(path) for path in folder.glob('*.txt'))
+
+
+def test_jobs_draw_every_file(tmp_path):
+    write_txtfiles(tmp_path)
+    result = subprocess.run([sys.executable, str(root / 'build.py'), str(tmp_path), '-j', '2'],
+                            input='\n', capture_output=True, text=True, cwd=root)
+    assert result.returncode == 0
+    assert '3 svg figures are drawn' in result.stdout
+    assert f'{tmp_path / "bad.txt"} : ValueError' in result.stdout
+    assert sorted(path.name for path in tmp_path.glob('*.svg')) == ['a.svg', 'b.svg', 'c.svg']
+
+
+def make_args(**changes):
+    '''Arguments of main, see build.main.'''
+    args = {'output': '', 'log': False, 'theme': 'light', 'dark_theme': None,
+            'theme_variants': [], 'embed_hash': False, 'auto_place': False, 'netlist': [],
+            'tiles': None, 'stream': None, 'jobs': 1, 'cache': None, 'watch': False,
+            'force': False}
+    args.update(changes)
+    return args
+
+
+def test_workers_draw_the_same_files_as_one_process(tmp_path):
+    txtfiles = write_txtfiles(tmp_path)
+    args = make_args(force=True)
+    build.build_batch(txtfiles, args, '', BuildManifests(), 'v1')
+    drawn = {path.name: path.read_bytes() for path in tmp_path.glob('*.svg')}
+    for path in tmp_path.glob('*.svg'):
+        path.unlink()
+    args = make_args(jobs=2, force=True)
+    with build.make_executor(args) as executor:
+        # the same workers draw both batches
+        assert not build.build_batch(txtfiles, args, '', BuildManifests(), 'v1', executor)
+        assert not build.build_batch(txtfiles, args, '', BuildManifests(), 'v1', executor)
+    assert {path.name: path.read_bytes() for path in tmp_path.glob('*.svg')} == drawn
+
+
+def test_broken_workers_fail_every_file_left(tmp_path, capsys):
+    txtfiles = write_txtfiles(tmp_path)
+    args = make_args(jobs=2)
+    with build.make_executor(args) as executor:
+        # a worker that dies breaks every worker
+        assert executor.submit(os._exit, 1).exception() is not None
+        assert build.build_batch(txtfiles, args, '', BuildManifests(), 'v1', executor)
+    assert '4 files are not drawn' in capsys.readouterr().out
+    assert list(tmp_path.glob('*.svg')) == []
+
+
+def fake_sleep(monkeypatch, saves, stop):
+    '''time.sleep of watch, saves[n] is called at the n-th sleep, watch stops at the stop-th.'''
+    calls = []
+
+    def sleep(seconds):
+        calls.append(seconds)
+        if len(calls) == stop:
+            raise KeyboardInterrupt
+        saves.get(len(calls), lambda: None)()
+    monkeypatch.setattr(build.time, 'sleep', sleep)
+
+
+def test_watch_draws_saved_files(tmp_path, monkeypatch):
+    txtfiles = write_txtfiles(tmp_path)
+    build.build_batch(txtfiles, make_args(), '', BuildManifests(), 'v1')
+    drawn = {path.name: path.read_bytes() for path in tmp_path.glob('*.svg')}
+    txtfile = tmp_path / 'c.txt'
+    # saved after the first poll, drawn after the debounce
+    fake_sleep(monkeypatch, {1: lambda: txtfile.write_text(txtfile.read_text().replace('C1', 'L1'))}, 4)
+    build.watch([str(tmp_path)], make_args(watch=True), '', BuildManifests(), 'v1')
+    assert (tmp_path / 'c.svg').read_bytes() != drawn['c.svg']
+    assert all((tmp_path / name).read_bytes() == drawn[name] for name in ('a.svg', 'b.svg'))
+
+
+def test_watch_starts_broken_workers_again(tmp_path, monkeypatch):
+    write_txtfiles(tmp_path)
+    txtfile = tmp_path / 'c.txt'
+    executors = []
+
+    def build_batch(txtfiles, args, baseDir, manifests, toolVersion, executor):
+        executors.append(executor)
+        return len(executors) == 1
+    monkeypatch.setattr(build, 'build_batch', build_batch)
+    monkeypatch.setattr(build, 'make_executor', lambda args: contextlib.nullcontext('started again'))
+    save = lambda: txtfile.write_text(txtfile.read_text() + '\n')
+    fake_sleep(monkeypatch, {1: save, 3: save}, 5)
+    build.watch([str(tmp_path)], make_args(watch=True, jobs=2), '', BuildManifests(), 'v1', 'workers')
+    assert executors == ['workers', 'started again']
+
+
+def test_text_cache_keeps_texts_used_last(monkeypatch):
+    monkeypatch.setattr(build.TextCache, 'maxTexts', 2)
+    cache = build.TextCache()
+    cache['a'], cache['b'] = 1, 2
+    assert cache['a'] == 1
+    cache['c'] = 3
+    assert list(cache) == ['a', 'c']
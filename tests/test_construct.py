@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from core.construct import CircuitBoard, to_txt, from_txt
+from core.convert import to_svgCodes
+
+circuit = '''\
+.. .. L1 .. .. A1 .. .. n1
+.. ,,       ..    ..
+Va    R1    C1    i1
+..       ,, ..    ..
+.. .. C0 .. .. .. .. .. n2
+#'''
+setting = '''\
+n1 : pm        = - n2 v_o
+i1 : direction = D
+i1 : value     = 2I_x
+A1 : value     = I_x
+C  : values    = 2F 4F
+#'''
+arrayNames = ('elemIDArray', 'connectArray', 'directionArray', 'isPosAnchorArray', 'isNodeArray')
+
+
+def snapshot(board):
+    return ([getattr(board, name).copy() for name in arrayNames], dict(board.elemSettings),
+            list(board.directionSettings), board.circuitCodeStr)
+
+
+def assert_same(first, second):
+    for a, b in zip(first[0], second[0]):
+        np.testing.assert_array_equal(a, b)
+    assert first[1:] == second[1:]
+
+
+@pytest.mark.parametrize('edit', [
+    lambda board: board.set_cell(1, 1, 'R9'),
+    lambda board: board.set_cell(2, 2, '  '),
+    lambda board: board.insert_row(3),
+    lambda board: board.delete_column(1),
+    lambda board: board.set_settingSheet('i1 : direction = D\n#'),
+])
+def test_edit_matches_a_new_board(edit):
+    board = CircuitBoard(circuit, setting)
+    to_svgCodes(board)
+    edit(board)
+    fresh = CircuitBoard(board.circuitCodeStr, board.settingSheetStr)
+    assert_same(snapshot(board), snapshot(fresh))
+    assert to_svgCodes(board) == to_svgCodes(fresh)
+
+
+@pytest.mark.parametrize('edit', [
+    lambda board: board.set_cell(2, 6, '  '),                # i1 is in the setting sheet
+    lambda board: board.delete_row(2),
+    lambda board: board.set_settingSheet('Z1 : value = 1\n#'),
+])
+def test_failed_edit_leaves_the_board_unchanged(edit):
+    board = CircuitBoard(circuit, setting)
+    svgCodes = to_svgCodes(board)
+    before = snapshot(board)
+    with pytest.raises(ValueError):
+        edit(board)
+    assert_same(snapshot(board), before)
+    assert board.settingSheetStr == setting
+    assert to_svgCodes(board) == svgCodes
+
+
+def test_txt_round_trip_with_blocks(tmp_path):
+    blocks = {'rlc': ('.. R1 ..\n#', "R1 : value = v'\n#")}
+    board = CircuitBoard(circuit, setting)
+    to_txt(board, tmp_path / 'fig.txt', blockWidth=4, blocks=blocks)
+    variables = from_txt(tmp_path / 'fig.txt')
+    assert variables['circuit'] == circuit
+    assert variables['setting'] == setting
+    assert variables['blockWidth'] == 4
+    assert variables['blocks'] == {'rlc': blocks['rlc']}
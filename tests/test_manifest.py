@@ -0,0 +1,126 @@
+import pytest
+from core.construct import CircuitBoard
+from core.convert import to_svgCodes
+from core.manifest import BuildManifest, BuildManifests, make_buildKey, outputFlags
+from core.cache import StageCache
+
+circuit = '''\
+.. R1 ..
+..    ..
+Va    C1
+..    ..
+.. .. ..
+#'''
+setting = '''\
+R1 : value = 1kΩ
+#'''
+
+
+def make_inputs(**changes):
+    inputs = {'circuit': circuit, 'setting': setting, 'autoNode': True,
+              'blockWidth': 6, 'blocks': None}
+    inputs.update(changes)
+    return inputs
+
+
+def make_flags(**changes):
+    flags = {flag: None for flag in outputFlags}
+    flags.update(theme='light', theme_variants=[], netlist=[], embed_hash=False,
+                 auto_place=False, cache=None, log=False)
+    flags.update(changes)
+    return flags
+
+
+def test_build_key_follows_inputs_and_output_flags():
+    key = make_buildKey(make_inputs(), make_flags(), 'v1', 'fig')
+    assert make_buildKey(make_inputs(), make_flags(), 'v1', 'fig') == key
+    assert make_buildKey(make_inputs(setting='#'), make_flags(), 'v1', 'fig') != key
+    assert make_buildKey(make_inputs(blockWidth=4), make_flags(), 'v1', 'fig') != key
+    assert make_buildKey(make_inputs(), make_flags(theme='dark'), 'v1', 'fig') != key
+    assert make_buildKey(make_inputs(), make_flags(tiles=2), 'v1', 'fig') != key
+    assert make_buildKey(make_inputs(), make_flags(), 'v2', 'fig') != key
+    # flags that do not change outputs, and the name without netlists
+    assert make_buildKey(make_inputs(), make_flags(log=True, cache='c'), 'v1', 'other') == key
+    netlistKey = make_buildKey(make_inputs(), make_flags(netlist=['spice']), 'v1', 'fig')
+    assert make_buildKey(make_inputs(), make_flags(netlist=['spice']), 'v1', 'other') != netlistKey
+
+
+@pytest.fixture
+def drawn(tmp_path):
+    txtfile = tmp_path / 'fig.txt'
+    txtfile.write_text('')
+    outputs = [tmp_path / 'fig.svg', tmp_path / 'fig.cir', tmp_path / 'fig.tiles']
+    outputs[0].write_text('<svg/>')
+    outputs[1].write_text('* fig\n.end\n')
+    (outputs[2] / '0' / '0').mkdir(parents=True)
+    (outputs[2] / '0' / '0' / '0.svg').write_text('<svg/>')
+    manifest = BuildManifest(tmp_path / 'build-manifest.jsonl')
+    manifest.record(txtfile, 'key', outputs, 1.0)
+    return manifest, txtfile, outputs
+
+
+def test_manifest_hit(drawn):
+    manifest, txtfile, outputs = drawn
+    assert manifest.is_upToDate(txtfile, 'key', outputs)
+    # entries are read back from the file
+    assert BuildManifest(manifest.path).is_upToDate(txtfile, 'key', outputs)
+
+
+def test_manifest_miss_on_key(drawn):
+    manifest, txtfile, outputs = drawn
+    assert not manifest.is_upToDate(txtfile, 'other key', outputs)
+
+
+@pytest.mark.parametrize('changed', [0, 1])
+def test_manifest_miss_on_changed_output(drawn, changed):
+    manifest, txtfile, outputs = drawn
+    outputs[changed].write_text('changed')
+    assert not manifest.is_upToDate(txtfile, 'key', outputs)
+
+
+def test_manifest_miss_on_changed_tile(drawn):
+    manifest, txtfile, outputs = drawn
+    (outputs[2] / '0' / '0' / '0.svg').unlink()
+    assert not manifest.is_upToDate(txtfile, 'key', outputs)
+
+
+def test_manifest_miss_on_other_outputs(drawn, tmp_path):
+    manifest, txtfile, outputs = drawn
+    assert not manifest.is_upToDate(txtfile, 'key', outputs[:1])
+    assert not manifest.is_upToDate(txtfile, 'key', outputs + [tmp_path / 'fig.json'])
+
+
+def test_manifests_are_next_to_outputs(tmp_path):
+    manifests = BuildManifests()
+    first, second = tmp_path / 'a' / 'fig.svg', tmp_path / 'b' / 'fig.svg'
+    assert manifests.of(first) is manifests.of(tmp_path / 'a' / 'other.svg')
+    assert manifests.of(first).path == tmp_path / 'a' / 'build-manifest.jsonl'
+    assert manifests.of(second) is not manifests.of(first)
+
+
+def test_cache_keys_cover_only_what_a_stage_depends_on(tmp_path):
+    cache = StageCache(tmp_path)
+    keys = cache.keys(circuit, setting, blockWidth=6, generatorSetting={'unit': 8})
+    wider = cache.keys(circuit, setting, blockWidth=4, generatorSetting={'unit': 8})
+    assert wider['board'] == keys['board'] and wider['svgCodes'] != keys['svgCodes']
+    larger = cache.keys(circuit, setting, blockWidth=6, generatorSetting={'unit': 10})
+    assert larger['svgCodes'] == keys['svgCodes'] and larger['svg'] != keys['svg']
+    edited = cache.keys(circuit, '#', blockWidth=6, generatorSetting={'unit': 8})
+    assert all(edited[stage] != keys[stage] for stage in keys)
+    # line endings do not change keys
+    assert cache.keys(circuit.replace('\n', '\r\n'), setting, blockWidth=6,
+                      generatorSetting={'unit': 8}) == keys
+
+
+def test_cache_miss_then_hit(tmp_path):
+    cache = StageCache(tmp_path)
+    keys = cache.keys(circuit, setting)
+    assert cache.load('board', keys['board']) is None
+    board = CircuitBoard(circuit, setting)
+    svgCodes = to_svgCodes(board)
+    cache.save('board', keys['board'], board)
+    cache.save('svgCodes', keys['svgCodes'], svgCodes)
+    loaded = cache.load('board', keys['board'])
+    assert loaded.elemSettings == board.elemSettings
+    assert to_svgCodes(loaded) == svgCodes
+    assert cache.load('svgCodes', keys['svgCodes']) == svgCodes
@@ -0,0 +1,60 @@
+from core.construct import CircuitBoard
+from core.netlist import make_netlist, to_spice
+
+rcCircuit = '''\
+n1 .. R1 .. A1 .. n2
+..                ..
+Va                C1
+..                ..
+g1 .. .. w1 .. .. ..
+#'''
+rcSetting = '''\
+R1 : value = 1kΩ
+C1 : value = 1\\muF
+Va : value = 5V
+#'''
+
+
+def nets_by_name(netlist):
+    return {net.name: net for net in netlist.nets}
+
+
+def test_mid_arrow_does_not_split_a_net():
+    netlist = make_netlist(CircuitBoard(rcCircuit, rcSetting))
+    nets = nets_by_name(netlist)
+    # R1 reaches n2 through the mid arrow A1
+    assert set(nets['n2'].terminals) == {('R1', 'p'), ('C1', 'p')}
+    assert set(nets['n1'].terminals) == {('R1', 'n'), ('Va', 'p')}
+
+
+def test_nodes_and_wires_of_a_net_are_merged():
+    circuit = '''\
+n1 .. n3 .. R1 .. n2
+..                ..
+Va                R2
+..                ..
+.. .. w2 .. w3 .. ..
+#'''
+    netlist = make_netlist(CircuitBoard(circuit, '#'))
+    nets = nets_by_name(netlist)
+    assert set(nets) == {'n1', 'n2', 'w2'}
+    # nodes name a net before numbered wires, other names are aliases
+    assert nets['n1'].aliases == ('n3',)
+    assert nets['w2'].aliases == ('w3',)
+    assert set(nets['n2'].terminals) == {('R1', 'p'), ('R2', 'p')}
+    assert set(nets['w2'].terminals) == {('Va', 'n'), ('R2', 'n')}
+    assert netlist.net_of('n3') is nets['n1']
+
+
+def test_ground_net_takes_wire_names_as_aliases():
+    netlist = make_netlist(CircuitBoard(rcCircuit, rcSetting))
+    assert nets_by_name(netlist)['0'].aliases == ('w1',)
+
+
+def test_spice_of_rc_circuit():
+    netlist = make_netlist(CircuitBoard(rcCircuit, rcSetting))
+    assert to_spice(netlist, 'rc') == ('* rc\n'
+                                       'R1 n2 n1 1kΩ\n'
+                                       'Va n1 0 5V\n'
+                                       'C1 n2 0 1\\muF\n'
+                                       '.end\n')
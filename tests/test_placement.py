@@ -0,0 +1,34 @@
+import pytest
+from core.placement import clip_segment
+
+box = (0, 0, 10, 10)
+
+
+def test_segment_inside_is_kept():
+    assert clip_segment(box, 1, 1, 9, 9) == (0, 1)
+
+
+def test_segment_outside_is_dropped():
+    assert clip_segment(box, 11, 0, 20, 10) is None
+    assert clip_segment(box, -5, -1, 15, -1) is None
+
+
+def test_segment_crossing_is_clipped():
+    assert clip_segment(box, -10, 5, 20, 5) == pytest.approx((1 / 3, 2 / 3))
+    # the same segment reversed
+    assert clip_segment(box, 20, 5, -10, 5) == pytest.approx((1 / 3, 2 / 3))
+
+
+def test_segment_on_the_border_is_inside():
+    assert clip_segment(box, 0, 0, 10, 0) == (0, 1)
+    assert clip_segment(box, 10, -5, 10, 5) == (0.5, 1)
+
+
+def test_segment_touching_a_corner_is_dropped():
+    assert clip_segment(box, 10, 10, 20, 20) is None
+    assert clip_segment(box, 5, 15, 15, 5) is None
+
+
+def test_point():
+    assert clip_segment(box, 5, 5, 5, 5) == (0, 1)
+    assert clip_segment(box, 5, 11, 5, 11) is None
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from core.netlist import Net, Branch, Netlist
+from core.solver import parse_value, parse_quantity, solve
+
+
+def one_port(code, value):
+    '''A 1 V source V1 across a single element X1 of code, between n1 and 0.'''
+    nets = (Net('n1', (), (('V1', 'p'), ('X1', 'p'))),
+            Net('0', (), (('V1', 'n'), ('X1', 'n'))))
+    branches = (Branch('V1', 'V', '1V', (0, 0), 'n1', '0'),
+                Branch('X1', code, value, (0, 2), 'n1', '0'))
+    return Netlist(nets, branches)
+
+
+@pytest.mark.parametrize('label, value', [
+    ('2F', 2), ('2f', 2), ('2H', 2), ('2h', 2), ('2fF', 2e-15), ('2ff', 2e-15),
+    ('4.7nF', 4.7e-9), ('2\\muF', 2e-6), ('5mH', 5e-3), ('3kΩ', 3e3), ('1ohm', 1),
+    ('3-j4Ω', 3 - 4j), ('10∠90V', 10j),
+])
+def test_parse_value(label, value):
+    assert parse_value(label) == pytest.approx(value)
+
+
+def test_parse_quantity_units():
+    assert parse_quantity('2f') == (2, 'F')
+    assert parse_quantity('3kohm') == (3e3, 'Ω')
+    assert parse_quantity('3k')[1] is None
+
+
+def test_parse_value_rejects_text():
+    with pytest.raises(ValueError):
+        parse_value('I_x')
+
+
+def test_capacitor_in_farads_is_an_admittance():
+    omega = 1e3
+    solution = solve(one_port('C', '2F'), omega=omega)
+    assert solution.currents['X1'] == pytest.approx(1j * omega * 2)
+
+
+def test_complex_capacitance_is_still_an_admittance():
+    # a complex value without Ω does not make the capacitor an impedance
+    omega = 1e3
+    solution = solve(one_port('C', None), omega=omega, params={'X1': 1e-6 + 0j})
+    assert solution.currents['X1'] == pytest.approx(1j * omega * 1e-6)
+
+
+def test_capacitor_in_ohms_is_an_impedance():
+    solution = solve(one_port('C', '-j2kΩ'), omega=1e3)
+    assert solution.currents['X1'] == pytest.approx(1 / -2e3j)
+
+
+def test_inductor_in_henries_and_ohms():
+    omega = 3.0
+    inHenries = solve(one_port('L', '2H'), omega=omega)
+    assert inHenries.currents['X1'] == pytest.approx(1 / (2j * omega))
+    inOhms = solve(one_port('L', '4Ω'), omega=omega)
+    assert inOhms.currents['X1'] == pytest.approx(1 / 4)
+    # an Ω label given by params is an impedance as well
+    byParams = solve(one_port('L', '2H'), omega=omega, params={'X1': '4Ω'})
+    assert byParams.currents['X1'] == pytest.approx(1 / 4)
+
+
+def test_resistor_sweep_is_broadcast():
+    resistances = np.array([1.0, 2.0, 4.0])
+    solution = solve(one_port('R', '1kΩ'), params={'X1': resistances})
+    assert solution.currents['X1'] == pytest.approx(1 / resistances)
@@ -0,0 +1,71 @@
+import pytest
+from lxml import etree
+from core.construct import CircuitBoard
+from core.convert import to_svgCodes
+from core.svgkit import svgGenerator
+from core.postprocessing import postprocessing, namespace
+from core.stream import render_stream
+
+circuit = '''\
+.. .. L1 .. .. A1 .. .. n1
+.. ,,       ..    ..
+Va    R1    C1    i1
+..       ,, ..    ..
+.. .. C0 .. .. .. .. .. n2
+.. .. L2 .. .. A2 .. .. n3
+.. ,,       ..    ..
+Vb    R2    C2    i2
+..       ,, ..    ..
+.. .. C3 .. .. .. .. .. n4
+#'''
+setting = '''\
+i1 : direction = D
+i1 : value     = 2I_x
+A1 : value     = I_x
+C  : values    = 2F 4F 1F 3F
+R2 : value     = 3kΩ
+n1 : pm        = - n4 v_o
+L2 : pm        = + - v_L
+#'''
+
+
+def uses_of(filename):
+    '''Count of every <use> by (href, x, y, transform).'''
+    uses = {}
+    for use in etree.parse(str(filename)).getroot().iter(f'{namespace}use'):
+        key = tuple(use.get(name) for name in ('href', 'x', 'y', 'transform'))
+        uses[key] = uses.get(key, 0) + 1
+    return uses
+
+
+@pytest.fixture(scope='module')
+def whole(tmp_path_factory):
+    filename = tmp_path_factory.mktemp('whole') / 'whole.svg'
+    board = CircuitBoard(circuit, setting)
+    svgGenerator(to_svgCodes(board), {'unit': 8}).generate(str(filename))
+    postprocessing(str(filename))
+    return uses_of(filename)
+
+
+@pytest.mark.parametrize('bandRows', [2, 3, 256])
+def test_stream_uses_match_whole_board(tmp_path, whole, bandRows):
+    filename = tmp_path / 'stream.svg'
+    render_stream(circuit, setting, str(filename), bandRows=bandRows)
+    assert uses_of(filename) == whole
+
+
+def test_pm_destination_must_exist(tmp_path):
+    with pytest.raises(ValueError, match='line 1, column 13'):
+        render_stream(circuit, 'n1 : pm = - n9 v_o\n#', str(tmp_path / 'stream.svg'))
+
+
+def test_failed_stream_keeps_previous_output(tmp_path):
+    filename = tmp_path / 'stream.svg'
+    render_stream(circuit, setting, str(filename), bandRows=3)
+    previous = filename.read_bytes()
+    # the last row is malformed, bands before it are already written
+    malformed = circuit.replace('\n#', '\n.. x\n#')
+    with pytest.raises(ValueError):
+        render_stream(malformed, setting, str(filename), bandRows=3)
+    assert filename.read_bytes() == previous
+    assert [path.name for path in tmp_path.iterdir()] == ['stream.svg']
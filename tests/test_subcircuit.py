@@ -0,0 +1,63 @@
+import pytest
+from lxml import etree
+from core.subcircuit import render_subcircuits
+from core.postprocessing import namespace
+
+blocks = {'rlc': ('''\
+.. R1 ..
+      C1
+      ..
+#''', '''\
+R1 : value = 1kΩ
+#''')}
+circuit = '''\
+Va .. X1       X2       ..
+..                      ..
+..                      ..
+.. .. .. .. .. .. .. .. ..
+#'''
+
+
+def render(tmp_path, setting, blocks=blocks):
+    filename = tmp_path / 'sub.svg'
+    render_subcircuits(circuit, setting, blocks, str(filename))
+    root = etree.parse(str(filename)).getroot()
+    groups = [g.get('id') for g in root.iter(f'{namespace}g') if g.get('id', '').startswith('sub-')]
+    uses = [use.get('href') for use in root.findall(f'{namespace}use')
+            if use.get('href').startswith('#sub-')]
+    return groups, uses
+
+
+def test_block_is_drawn_once_for_every_instance(tmp_path):
+    setting = '''\
+X1 : block    = rlc
+X2 : block    = rlc
+X2 : R1.value = 2kΩ
+#'''
+    groups, uses = render(tmp_path, setting)
+    assert groups == ['sub-rlc', 'sub-rlc-0', 'sub-rlc-1']
+    assert sorted(uses) == ['#sub-rlc', '#sub-rlc', '#sub-rlc-0', '#sub-rlc-1']
+
+
+def test_instances_with_the_same_labels_share_them(tmp_path):
+    setting = '''\
+X1 : block = rlc
+X2 : block = rlc
+#'''
+    groups, uses = render(tmp_path, setting)
+    assert groups == ['sub-rlc', 'sub-rlc-0']
+    assert sorted(uses) == ['#sub-rlc', '#sub-rlc', '#sub-rlc-0', '#sub-rlc-0']
+
+
+def test_missing_block_is_reported(tmp_path):
+    with pytest.raises(ValueError, match='block lc does not exist'):
+        render(tmp_path, 'X1 : block = lc\nX2 : block = rlc\n#')
+
+
+def test_block_with_an_instance_of_itself_is_reported(tmp_path):
+    loop = {'rlc': ('''\
+X1    ..
+..    ..
+#''', 'X1 : block = rlc\n#')}
+    with pytest.raises(ValueError, match='instance of itself'):
+        render(tmp_path, 'X1 : block = rlc\nX2 : block = rlc\n#', loop)
@@ -0,0 +1,49 @@
+import pytest
+from lxml import etree
+from core.construct import CircuitBoard
+from core.convert import to_svgCodes
+from core.svgkit import svgGenerator
+from core.postprocessing import postprocessing, namespace
+from core.variants import render_variants
+
+circuit = '''\
+.. R1 ..
+..    ..
+Va    C1
+..    ..
+.. .. ..
+#'''
+setting = '''\
+R1 : value = 1kΩ
+#'''
+
+
+def uses_of(filename):
+    '''Count of every <use> by (href, x, y, transform).'''
+    uses = {}
+    for use in etree.parse(str(filename)).getroot().iter(f'{namespace}use'):
+        key = tuple(use.get(name) for name in ('href', 'x', 'y', 'transform'))
+        uses[key] = uses.get(key, 0) + 1
+    return uses
+
+
+def test_variants_match_boards_with_their_overrides(tmp_path):
+    overrides = ['R1 : value = 3kΩ\n#', 'C1 : value = 5pF\nR1 : pm = + - v_R\n#', '#']
+    filenames = [str(tmp_path / f'variant{k}.svg') for k in range(len(overrides))]
+    assert render_variants(circuit, setting, overrides, filenames) == filenames
+    for overrideStr, filename in zip(overrides, filenames):
+        expected = tmp_path / 'expected.svg'
+        board = CircuitBoard(circuit, setting.replace('#', overrideStr))
+        svgGenerator(to_svgCodes(board), {'unit': 8}).generate(str(expected))
+        postprocessing(str(expected))
+        assert uses_of(filename) == uses_of(expected)
+
+
+def test_override_of_geometry_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='changes the geometry'):
+        render_variants(circuit, setting, ['C1 : direction = D\n#'], [str(tmp_path / 'v.svg')])
+
+
+def test_every_override_needs_a_filename(tmp_path):
+    with pytest.raises(ValueError, match='every override needs a filename'):
+        render_variants(circuit, setting, ['#', '#'], [str(tmp_path / 'v.svg')])
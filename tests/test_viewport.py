@@ -0,0 +1,59 @@
+from lxml import etree
+from core.construct import CircuitBoard
+from core.convert import to_svgCodes
+from core.postprocessing import namespace
+from core.viewport import ViewportIndex
+
+circuit = '''\
+.. .. L1 .. .. A1 .. .. n1
+.. ,,       ..    ..
+Va    R1    C1    i1
+..       ,, ..    ..
+.. .. C0 .. .. .. .. .. n2
+#'''
+setting = '''\
+i1 : direction = D
+A1 : value     = I_x
+#'''
+
+
+def make_index():
+    svgCodes = to_svgCodes(CircuitBoard(circuit, setting))
+    return svgCodes, ViewportIndex(svgCodes, {'unit': 8})
+
+
+def test_viewport_of_the_whole_figure_has_every_code(tmp_path):
+    svgCodes, index = make_index()
+    assert index.query(index.bounds) == svgCodes
+    assert index.render(index.bounds, str(tmp_path / 'all.svg')) == len(svgCodes)
+
+
+def test_viewport_only_has_codes_in_it(tmp_path):
+    svgCodes, index = make_index()
+    box = index.cell_box(0, 0, 1, 1)
+    codes = index.query(box)
+    assert 0 < len(codes) < len(svgCodes)
+    # the inductor in row 0 is in it, the capacitor in row 4 is not
+    elements = [code[1] for code in codes if code[0] == 'e' and code[1] not in ('w', 'W')]
+    assert 'L' in elements and 'C' not in elements
+    filename = tmp_path / 'part.svg'
+    assert index.render(box, str(filename)) == len(codes)
+    x0, y0, x1, y1 = box
+    viewBox = [float(v) for v in etree.parse(str(filename)).getroot().get('viewBox').split()]
+    assert viewBox == [round(v, 2) for v in (x0, y0, x1 - x0, y1 - y0)]
+
+
+def test_tiles_cover_the_figure(tmp_path):
+    svgCodes, index = make_index()
+    written = index.write_tiles(tmp_path / 'tiles', 2)
+    assert (tmp_path / 'tiles' / '0' / '0' / '0.svg') in written
+    assert all(path.exists() for path in written)
+    # every code is in a tile of the last zoom
+    found = set()
+    for x, y in index.tiles(2):
+        found.update(code[:2] + code[2:4] for code in index.query(index.tile_box(2, x, y))
+                     if code[0] == 't' or code[1] not in ('w', 'W'))
+    assert found == {code[:2] + code[2:4] for code in svgCodes
+                     if code[0] == 't' or code[1] not in ('w', 'W')}
+    for path in written:
+        assert etree.parse(str(path)).getroot().tag == f'{namespace}svg'